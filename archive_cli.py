@@ -0,0 +1,182 @@
+import os
+import sys
+import argparse
+import importlib
+import subprocess
+import wind_config as config
+
+"""
+One entry point for the archive pipelines. Subcommand modules are imported only when that
+subcommand runs, so quick commands (file listing, station metadata, archive queries,
+metrics summaries) never load xarray, cfgrib, Herbie or matplotlib. Pipeline subcommands
+pass their remaining arguments to the module's own main().
+
+    python archive_cli.py ndfd --start 202101010000 --end 202103010000
+    python archive_cli.py model --model hrrrak
+    python archive_cli.py query ndfd --stations PANC,PAFA --start 2021-01-01 --end 2021-01-08
+    python archive_cli.py import-budget
+"""
+
+# subcommand -> (module, help); pipelines take their own argv, quick commands are handled here
+PIPELINES = {
+    "ndfd": ("create_ndfd_archive", "Build the NDFD forecast archive"),
+    "plan-ndfd": ("ndfd_planner", "Plan an NDFD backfill and estimate its cost"),
+    "model": ("create_model_archive", "Build a Herbie model forecast archive"),
+    "obs": ("create_obs_archive", "Build the obs archive from Synoptic or MADIS"),
+    "plots": ("stn_wind_plots", "Render and publish the station wind plots"),
+    "fixtures": ("make_fixtures", "Write offline GRIB2/Synoptic fixtures"),
+    "bench": ("bench_pipeline", "Run the stage benchmarks"),
+    "s3-harness": ("s3_harness", "Run against a local S3 stand-in"),
+    "mock-synoptic": ("mock_synoptic", "Serve or load-test the mock Synoptic API"),
+    "executors": ("executors", "Check an execution backend and its task routing"),
+}
+
+QUICK = {
+    "list-ndfd": "create_ndfd_archive",
+    "stations": "station_catalog",
+    "query": "archive_query",
+    "metrics": "pipeline_metrics",
+}
+
+# modules that spawned pool workers import before doing any work
+WORKER_MODULES = ["create_obs_archive", "pipeline_metrics", "stn_wind_plots"]
+
+
+def list_ndfd(args):
+    from create_ndfd_archive import get_ndfd_file_list
+    files = get_ndfd_file_list(args.start, args.end, config.NDFD_DICT, base_url=args.base_url)
+    for component, paths in files.items():
+        print(f"{component}: {len(paths)} files")
+        if args.paths:
+            print("\n".join(paths))
+
+
+def stations(args):
+    from station_catalog import load_station_catalog, refresh_station_catalog
+    if args.refresh or args.full:
+        refresh_station_catalog(full=args.full)
+    catalog = load_station_catalog()
+    if args.csv:
+        catalog.to_csv(sys.stdout, index=False)
+    else:
+        print(f"{len(catalog)} stations")
+        print(catalog.head(args.head).to_string(index=False))
+
+
+def query(args):
+    from archive_query import get_series
+    df = get_series(args.source, args.stations.split(",") if args.stations else None, args.start, args.end,
+                    [int(lead) for lead in args.leads.split(",")] if args.leads else None, qc_only=not args.all)
+    if args.csv:
+        df.to_csv(args.csv if args.csv != "-" else sys.stdout, index=False)
+    else:
+        print(f"{len(df)} rows")
+        print(df.head(args.head).to_string(index=False))
+
+
+def metrics(args):
+    from pipeline_metrics import main
+    main(["summary", args.path] + (["--json"] if args.json else []))
+
+
+def import_seconds(module, repeats=3):
+    """Best-of wall time to import module in a fresh interpreter, plus its slowest top-level imports."""
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    best, slowest = None, []
+    for _ in range(repeats):
+        out = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        if out.returncode:
+            return None, [out.stderr.strip().splitlines()[-1]]
+        seconds = float(out.stdout.strip().splitlines()[-1])
+        if best is None or seconds < best:
+            best = seconds
+            # "import time: self [us] | cumulative | name", nesting shown by two-space indents and
+            # children listed before their parent; report what the measured module imports directly,
+            # not what interpreter startup (site, .pth hooks) loaded before it
+            rows = [r for r in (line.split("|") for line in out.stderr.splitlines() if line.startswith("import time:"))
+                    if len(r) == 3 and r[1].strip().isdigit()]
+            ends = [i for i, r in enumerate(rows) if r[2] == f" {module}"]
+            top = []
+            for r in reversed(rows[:ends[-1]] if ends else []):
+                if not r[2].startswith("   "):
+                    break
+                if not r[2].startswith("    "):
+                    top.append((int(r[1]), r[2].strip()))
+            slowest = [f"{name} {us / 1e6:.2f}s" for us, name in sorted(top, reverse=True)[:4]]
+    return best, slowest
+
+
+def import_budget(args):
+    """Check quick subcommands and worker modules against config.IMPORT_BUDGET_S."""
+    modules = sorted(set(QUICK.values()) | set(WORKER_MODULES) | {"archive_cli"})
+    over = 0
+    for module in modules:
+        seconds, slowest = import_seconds(module, args.repeats)
+        if seconds is None:
+            print(f"⚠️ {module}: import failed ({slowest[0]})")
+            continue
+        ok = seconds <= args.budget
+        over += not ok
+        print(f"{'✅' if ok else '❌'} {module:<22}{seconds:6.2f}s   {', '.join(slowest)}")
+    print(f"⏱️ budget {args.budget:.2f}s: {over} module(s) over")
+    return 1 if over else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Wind forecast archive pipelines.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, (module, summary) in PIPELINES.items():
+        p = sub.add_parser(name, help=summary, add_help=False)
+        p.add_argument("argv", nargs=argparse.REMAINDER)
+
+    p = sub.add_parser("list-ndfd", help="List NDFD source files for a period")
+    p.add_argument("--start", default=config.OBS_START, help="YYYYmmddHHMM")
+    p.add_argument("--end", default=config.OBS_END, help="YYYYmmddHHMM")
+    p.add_argument("--base-url", help="bucket or local mirror (default config.NDFD_SOURCE_URL)")
+    p.add_argument("--paths", action="store_true", help="print every path")
+    p.set_defaults(func=list_ndfd)
+
+    p = sub.add_parser("stations", help="Show or refresh the station catalog")
+    p.add_argument("--refresh", action="store_true", help="incremental refresh from Synoptic")
+    p.add_argument("--full", action="store_true", help="rebuild the catalog from scratch")
+    p.add_argument("--csv", action="store_true", help="write the catalog to stdout as CSV")
+    p.add_argument("--head", type=int, default=10)
+    p.set_defaults(func=stations)
+
+    p = sub.add_parser("query", help="Query archived obs or forecast series")
+    p.add_argument("source", help='"obs", "ndfd" or a Herbie model')
+    p.add_argument("--stations", help="comma-separated station ids")
+    p.add_argument("--start")
+    p.add_argument("--end")
+    p.add_argument("--leads", help="comma-separated forecast hours")
+    p.add_argument("--all", action="store_true", help="include obs that failed QC")
+    p.add_argument("--csv", help="write rows to this path ('-' for stdout)")
+    p.add_argument("--head", type=int, default=20)
+    p.set_defaults(func=query)
+
+    p = sub.add_parser("metrics", help="Summarize a pipeline metrics run")
+    p.add_argument("path", help="run .jsonl file")
+    p.add_argument("--json", action="store_true")
+    p.set_defaults(func=metrics)
+
+    p = sub.add_parser("import-budget", help="Check import times against config.IMPORT_BUDGET_S")
+    p.add_argument("--budget", type=float, default=config.IMPORT_BUDGET_S)
+    p.add_argument("--repeats", type=int, default=3)
+    p.set_defaults(func=import_budget)
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in PIPELINES:
+        # hand everything after the subcommand (including --help) to the module's parser
+        module = importlib.import_module(PIPELINES[argv[0]][0])
+        return module.main(argv[1:])
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    status = main()
+    sys.exit(status if isinstance(status, int) else 0)
@@ -0,0 +1,198 @@
+import os
+import duckdb
+import pandas as pd
+import wind_config as config
+from pairing import archive_paths
+from storage import filesystem, duckdb_s3_secret, s3_filesystem
+
+"""
+Query layer over the forecast and obs archives. get_series pushes station, time and lead
+filters into DuckDB Parquet scans (local or s3://), and resolves monthly archives and obs
+partitions to file names directly so nothing has to be listed. Archives are written
+station-sorted with bounded row groups, so a single-station lookup only reads the row
+groups whose station_id stats match.
+"""
+
+SERIES_COLUMNS = ["stid", "valid_time", "lead_hr", "wind_speed_kt", "wind_dir_deg", "wind_gust_kt"]
+
+# one DuckDB connection per process
+_connection = None
+
+
+def get_connection():
+    global _connection
+    if _connection is None:
+        con = duckdb.connect()
+        con.execute("SET TimeZone='UTC'")
+        _connection = con
+    return _connection
+
+
+_s3_ready = False
+
+
+def enable_s3(con):
+    """Load httpfs once; credentials and endpoint follow storage (AWS credential chain or config.S3_ENDPOINT_URL)."""
+    global _s3_ready
+    if not _s3_ready:
+        try:
+            con.execute("INSTALL httpfs; LOAD httpfs;")
+            con.execute(duckdb_s3_secret())
+        except duckdb.Error as e:
+            # hosts that cannot fetch the extension read s3:// through s3fs instead
+            print(f"⚠️ DuckDB httpfs unavailable ({e.__class__.__name__}); reading s3:// through fsspec.")
+            con.register_filesystem(s3_filesystem())
+        _s3_ready = True
+
+
+def existing(paths):
+    """Drop candidate files that were never written (HEAD per name, no prefix listing)."""
+    if not paths:
+        return []
+    fs, _ = filesystem(paths[0])
+    return list(dict.fromkeys(p for p in paths if fs.exists(fs._strip_protocol(p))))
+
+
+def obs_partition_paths(obs_dir, start, end):
+    months = pd.period_range(pd.Timestamp(start).to_period("M"), pd.Timestamp(end).to_period("M"), freq="M")
+    return [os.path.join(obs_dir, f"year={m.year}", f"month={m.month}", "part-0.parquet") for m in months]
+
+
+def in_list(column, values):
+    """Literal IN list so DuckDB can push it into the Parquet scan."""
+    quoted = ", ".join("'" + str(v).replace("'", "''") + "'" for v in values)
+    return f"{column} IN ({quoted})"
+
+
+def source_query(source, stations, leads, qc_only):
+    """SQL producing SERIES_COLUMNS for one archive, with ? placeholders for the file list, start and end."""
+    if source == "ndfd":
+        where = ["valid_time >= ?::TIMESTAMP", "valid_time < ?::TIMESTAMP"]
+        if stations is not None:
+            where.append(in_list("station_id", stations))
+        if leads is not None:
+            where.append(f"forecast_hour IN ({', '.join(str(int(l)) for l in leads)})")
+        return f"""
+            SELECT station_id AS stid, valid_time, forecast_hour AS lead_hr,
+                   wind_speed_kt, wind_dir_deg, NULL::DOUBLE AS wind_gust_kt
+            FROM read_parquet(?, union_by_name=true)
+            WHERE {' AND '.join(where)}
+        """
+    if source in config.HERBIE_MODELS:
+        where = ["valid_time >= ?::TIMESTAMP", "valid_time < ?::TIMESTAMP"]
+        if stations is not None:
+            where.append(in_list("stid", stations))
+        if leads is not None:
+            where.append(f"step_hr IN ({', '.join(str(float(l)) for l in leads)})")
+        return f"""
+            SELECT stid, valid_time, CAST(step_hr AS INTEGER) AS lead_hr,
+                   max(value) FILTER (WHERE variable = 'speed') AS wind_speed_kt,
+                   max(value) FILTER (WHERE variable = 'direction') AS wind_dir_deg,
+                   max(value) FILTER (WHERE variable = 'gust') AS wind_gust_kt
+            FROM read_parquet(?)
+            WHERE {' AND '.join(where)}
+            GROUP BY ALL
+        """
+    if source == "obs":
+        where = ["timestamp >= ?::TIMESTAMPTZ", "timestamp < ?::TIMESTAMPTZ"]
+        if stations is not None:
+            where.append(in_list("stid", stations))
+        if qc_only:
+            where.append("qc_flags = 0")
+        return f"""
+            SELECT stid, timestamp AS valid_time, 0 AS lead_hr,
+                   wind_speed AS wind_speed_kt, wind_direction AS wind_dir_deg, wind_gust AS wind_gust_kt
+            FROM read_parquet(?, hive_partitioning=false)
+            WHERE {' AND '.join(where)}
+        """
+    raise ValueError(f"Unknown archive source '{source}'")
+
+
+def source_files(source, start, end):
+    if source == "obs":
+        return existing(obs_partition_paths(config.OBS_ARCHIVE_DIR, start, end))
+    if source == "ndfd" or source in config.FORECAST_ARCHIVES:
+        template = config.FORECAST_ARCHIVES[source]
+    else:
+        template = os.path.join(config.MODEL_DIR, source, f"alaska_{source}_{config.ELEMENT.lower()}_forecasts.parquet")
+    return existing(archive_paths(template, start, end))
+
+
+def get_series(source, stations=None, start=None, end=None, leads=None, qc_only=True):
+    """
+    Return forecast or obs series for stations between start (inclusive) and end (exclusive).
+    source is "obs", "ndfd" or a Herbie model name; leads filters forecast hours.
+    """
+    start = pd.Timestamp(start or config.OBS_START)
+    end = pd.Timestamp(end or config.OBS_END)
+    start = start.tz_convert(None) if start.tzinfo else start
+    end = end.tz_convert(None) if end.tzinfo else end
+    if isinstance(stations, str):
+        stations = [stations]
+    files = source_files(source, start, end)
+    if not files:
+        return pd.DataFrame(columns=SERIES_COLUMNS)
+    con = get_connection()
+    if any(f.startswith("s3://") for f in files):
+        enable_s3(con)
+    sql = source_query(source, stations, leads, qc_only) + " ORDER BY stid, valid_time, lead_hr"
+    df = con.execute(sql, [files, start, end]).df()
+    df["valid_time"] = pd.to_datetime(df["valid_time"], utc=True)
+    # monthly NDFD chunks overlap, so the same issuance can appear twice
+    return df.drop_duplicates(subset=["stid", "valid_time", "lead_hr"], keep="last").reset_index(drop=True)
+
+
+def missing_valid_times(df, dates, leads):
+    """Valid times in dates that lack at least one of leads in a get_series frame (gaps to fetch)."""
+    dates = pd.DatetimeIndex(dates)
+    dates = dates.tz_localize("UTC") if dates.tz is None else dates.tz_convert("UTC")
+    have = pd.MultiIndex.from_frame(df[["valid_time", "lead_hr"]].drop_duplicates()) if len(df) else None
+    want = pd.MultiIndex.from_product([dates, [int(l) for l in leads]], names=["valid_time", "lead_hr"])
+    gaps = want if have is None else want[~want.isin(have)]
+    return pd.DatetimeIndex(gaps.get_level_values("valid_time").unique()).rename(None)
+
+
+def stale_stations(df, stations, end, max_gap="1h"):
+    """Stations whose latest row in a get_series frame is older than end - max_gap, with that time (NaT if none)."""
+    last = df.groupby("stid")["valid_time"].max() if len(df) else pd.Series(dtype="datetime64[ns, UTC]")
+    last = last.reindex(list(stations))
+    end = pd.Timestamp(end)
+    end = end.tz_localize("UTC") if end.tzinfo is None else end
+    return last[last.isna() | (last < end - pd.Timedelta(max_gap))]
+
+
+ROLLUP_FIELDS = {"wind_speed_kt": "wind_speed", "wind_dir_deg": "wind_direction", "wind_gust_kt": "wind_gust"}
+
+
+def get_obs_rollup(stations, freq, start=None, end=None, obs=None, rollup_dir=None):
+    """
+    QC-passed obs binned to valid times start..end (inclusive) at freq, in the rollup schema.
+    Bins come from the stored rollup; stations it lacks, and each station's bins from its last
+    stored one on (obs written since the rollup was built), are binned from obs, a get_series
+    ("obs") frame that is read here for just those stations and times when not given.
+    """
+    from obs_rollup import ROLLUP_SCHEMA, as_utc, read_obs_rollup, rollup_obs
+    rollup_dir = rollup_dir or config.OBS_ROLLUP_DIR
+    start, end = as_utc(start or config.OBS_START), as_utc(end or config.OBS_END)
+    if isinstance(stations, str):
+        stations = [stations]
+    stations = list(stations)
+    stored = pd.DataFrame(columns=ROLLUP_SCHEMA.names)
+    if os.path.isdir(os.path.join(rollup_dir, f"freq={freq}")):
+        stored = read_obs_rollup(rollup_dir, freq, stations, start, end)
+    # the last stored bin may have been built before all of its obs arrived, so it is redone too
+    resume = stored.groupby("stid")["valid_time"].max() if len(stored) else pd.Series(dtype="datetime64[ns, UTC]")
+    resume = pd.to_datetime(resume.reindex(stations).fillna(start), utc=True)
+    half = pd.Timedelta(freq) / 2
+    if obs is None:
+        obs = get_series("obs", stations, resume.min() - half, end + half)
+    wide = obs.rename(columns=ROLLUP_FIELDS)
+    wide = wide[wide["valid_time"] >= wide["stid"].map(resume) - half]
+    fresh = rollup_obs(wide, freq, time_col="valid_time")
+    fresh = fresh[(fresh["valid_time"] >= fresh["stid"].map(resume)) & (fresh["valid_time"] <= end)]
+    stored = stored[stored["valid_time"] < stored["stid"].map(resume)]
+    # archive reads come back in microseconds, the stored rollup in nanoseconds
+    frames = [df.astype({"valid_time": "datetime64[ns, UTC]"}) for df in (stored, fresh) if len(df)]
+    if not frames:
+        return pd.DataFrame(columns=ROLLUP_SCHEMA.names)
+    return pd.concat(frames, ignore_index=True).sort_values(["stid", "valid_time"], ignore_index=True)
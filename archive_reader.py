@@ -0,0 +1,136 @@
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+import wind_config as config
+from archive_query import get_series
+
+"""
+Read-optimized exports of the archives as memory-mapped .npy columns. Rows are sorted by
+station then valid time, and offsets.npy holds CSR-style row bounds per station, so a
+station's series is a slice of each column and time windows are a searchsorted away.
+Arrays are opened with mmap_mode="r": nothing is deserialized and every process reading
+the same export shares the page cache.
+"""
+
+ARRAY_COLUMNS = {
+    "valid_time": "int64",       # ns since epoch, UTC
+    "lead_hr": "int16",
+    "wind_speed_kt": "float32",
+    "wind_dir_deg": "float32",
+    "wind_gust_kt": "float32",
+}
+
+
+def export_path(source, arrays_dir=config.ARCHIVE_ARRAYS_DIR):
+    return os.path.join(arrays_dir, source)
+
+
+def export_archive(source, start=None, end=None, arrays_dir=config.ARCHIVE_ARRAYS_DIR):
+    """Write a station-major array export of one archive, replacing any previous export."""
+    df = get_series(source, None, start, end, qc_only=True)
+    df = df.sort_values(["stid", "valid_time", "lead_hr"], kind="stable", ignore_index=True)
+    stids, starts = np.unique(df["stid"].to_numpy(dtype=str), return_index=True)
+    offsets = np.append(starts, len(df)).astype("int64")
+
+    out_dir = export_path(source, arrays_dir)
+    # exports are built under <source>_versions/ and out_dir is a symlink to the live one
+    versions = f"{out_dir}_versions"
+    os.makedirs(versions, exist_ok=True)
+    if os.path.isdir(out_dir) and not os.path.islink(out_dir):
+        # one-time move of an export written before versioning
+        os.replace(out_dir, os.path.join(versions, "legacy"))
+        os.symlink(os.path.join(versions, "legacy"), out_dir)
+    live = os.path.realpath(out_dir) if os.path.islink(out_dir) else None
+    tmp_dir = os.path.join(versions, pd.Timestamp.now(tz="UTC").strftime("%Y%m%dT%H%M%S%f"))
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, "stations.npy"), stids)
+    np.save(os.path.join(tmp_dir, "offsets.npy"), offsets)
+    # an empty window comes back with an untyped valid_time column
+    valid_ns = pd.to_datetime(df["valid_time"], utc=True).dt.tz_convert(None).to_numpy("datetime64[ns]").view("int64")
+    np.save(os.path.join(tmp_dir, "valid_time.npy"), valid_ns)
+    for col, dtype in ARRAY_COLUMNS.items():
+        if col != "valid_time":
+            np.save(os.path.join(tmp_dir, f"{col}.npy"), df[col].to_numpy(dtype="float64").astype(dtype))
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+        json.dump({"source": source, "rows": len(df), "stations": len(stids),
+                   "exported": pd.Timestamp.now(tz="UTC").isoformat()}, f)
+
+    # repoint the symlink in one rename, so a reader opens either the old export or the new one
+    tmp_link = f"{out_dir}.tmp"
+    if os.path.lexists(tmp_link):
+        os.remove(tmp_link)
+    os.symlink(tmp_dir, tmp_link)
+    os.replace(tmp_link, out_dir)
+    # keep the previous export for readers that resolved the link before the swap
+    for name in os.listdir(versions):
+        path = os.path.join(versions, name)
+        if path not in (tmp_dir, live):
+            shutil.rmtree(path, ignore_errors=True)
+    print(f"✅ Exported {len(df)} {source} rows for {len(stids)} stations to {out_dir}")
+    return out_dir
+
+
+def to_ns(ts):
+    ts = pd.Timestamp(ts)
+    ts = ts.tz_convert(None) if ts.tzinfo else ts
+    return ts.value
+
+
+class ArchiveReader:
+    """
+    Zero-copy access to an array export. series() returns numpy views into the mapped
+    columns; only a lead_hr filter, which is not contiguous, materializes a copy.
+    """
+
+    def __init__(self, source, arrays_dir=config.ARCHIVE_ARRAYS_DIR):
+        # resolve the live link once, so every file comes from the same export even if
+        # export_archive swaps in a new version while they load
+        self.path = os.path.realpath(export_path(source, arrays_dir))
+        self.stations = np.load(os.path.join(self.path, "stations.npy"))
+        self.offsets = np.load(os.path.join(self.path, "offsets.npy"))
+        self.columns = {col: np.load(os.path.join(self.path, f"{col}.npy"), mmap_mode="r") for col in ARRAY_COLUMNS}
+        self._index = {stid: i for i, stid in enumerate(self.stations.tolist())}
+
+    def __contains__(self, stid):
+        return stid in self._index
+
+    def __len__(self):
+        return len(self.stations)
+
+    def bounds(self, stid, start=None, end=None):
+        """Row range [lo, hi) of stid with valid times in [start, end)."""
+        i = self._index.get(stid)
+        if i is None:
+            return 0, 0
+        lo, hi = int(self.offsets[i]), int(self.offsets[i + 1])
+        times = self.columns["valid_time"][lo:hi]
+        first = int(np.searchsorted(times, to_ns(start), "left")) if start is not None else 0
+        last = int(np.searchsorted(times, to_ns(end), "left")) if end is not None else hi - lo
+        return lo + first, lo + last
+
+    def series(self, stid, start=None, end=None, lead_hr=None, columns=None):
+        """Dict of column arrays for one station; valid_time stays int64 ns (see as_datetime)."""
+        lo, hi = self.bounds(stid, start, end)
+        out = {col: self.columns[col][lo:hi] for col in (columns or ARRAY_COLUMNS)}
+        if lead_hr is not None:
+            keep = self.columns["lead_hr"][lo:hi] == lead_hr
+            out = {col: arr[keep] for col, arr in out.items()}
+        return out
+
+    def frame(self, stid, start=None, end=None, lead_hr=None):
+        """Convenience DataFrame of series() for notebooks (copies)."""
+        df = pd.DataFrame(self.series(stid, start, end, lead_hr))
+        df["valid_time"] = as_datetime(df["valid_time"].to_numpy())
+        df.insert(0, "stid", stid)
+        return df
+
+
+def as_datetime(ns):
+    return pd.to_datetime(np.asarray(ns, dtype="int64"), utc=True)
+
+
+if __name__ == "__main__":
+    for source in ["obs", "ndfd", config.MODEL]:
+        export_archive(source)
@@ -0,0 +1,312 @@
+import os
+import io
+import sys
+import glob
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import resource
+import tracemalloc
+import contextlib
+import multiprocessing as mp
+import numpy as np
+import pandas as pd
+import wind_config as config
+
+"""
+Stage benchmarks for the ingest and verification pipelines. Each stage is timed on its
+own with wall-clock time (perf_counter, so I/O waits count), and reports rows/s, bytes/s,
+the Python peak allocation (tracemalloc) and the peak RSS of a fresh worker process.
+File stages read offline fixtures from config.BENCH_FIXTURES_DIR and are skipped when
+those are missing; the rest run on seeded synthetic frames. Results can be saved as a
+baseline and later runs are compared against it.
+
+    python bench_pipeline.py                      # run every stage, compare to baseline
+    python bench_pipeline.py -s decode pairing    # selected stages
+    python bench_pipeline.py --save-baseline
+"""
+
+STAGES = {}
+
+
+def stage(name):
+    def register(setup):
+        STAGES[name] = setup
+        return setup
+    return register
+
+
+class Skip(Exception):
+    pass
+
+
+def fixture(*parts):
+    path = os.path.join(config.BENCH_FIXTURES_DIR, *parts)
+    if not os.path.exists(path):
+        raise Skip(f"missing fixture {path}")
+    return path
+
+
+def ndfd_fixture_files(component):
+    files = sorted(glob.glob(os.path.join(fixture("ndfd", "wmo", component), "*", "*", "*", "*")))
+    if not files:
+        raise Skip(f"no NDFD {component} fixtures")
+    return files
+
+
+def synthetic_stations(n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "stid": [f"BNCH{i:04d}" for i in range(n)],
+        "latitude": rng.uniform(55, 70, n),
+        "longitude": rng.uniform(-165, -140, n),
+    })
+
+
+def synthetic_obs(n_stations=300, days=31, seed=0):
+    rng = np.random.default_rng(seed)
+    times = pd.date_range("2021-01-01", periods=days * 24 * 3, freq="20min", tz="UTC")
+    stids = np.repeat([f"BNCH{i:04d}" for i in range(n_stations)], len(times))
+    n = len(stids)
+    return pd.DataFrame({
+        "stid": stids,
+        "timestamp": np.tile(times, n_stations),
+        "wind_direction": rng.uniform(0, 360, n).round(),
+        "wind_speed": rng.gamma(2.0, 5.0, n).round(2),
+        "wind_gust": rng.gamma(3.0, 6.0, n).round(2),
+    })
+
+
+def synthetic_forecasts(n_stations=300, days=31, leads=(24, 48, 72, 96), seed=1):
+    rng = np.random.default_rng(seed)
+    valid = pd.date_range("2021-01-01", periods=days * 8, freq="3h", tz="UTC")
+    idx = pd.MultiIndex.from_product([[f"BNCH{i:04d}" for i in range(n_stations)], valid, leads],
+                                     names=["stid", "valid_time", "lead_hr"]).to_frame(index=False)
+    n = len(idx)
+    idx["lead_hr"] = idx["lead_hr"].astype("int32")
+    idx["fcst_speed_kt"] = rng.gamma(2.0, 5.0, n)
+    idx["fcst_dir_deg"] = rng.uniform(0, 360, n)
+    return idx
+
+
+# Each setup prepares inputs (untimed) and returns run(), which does the timed work and
+# returns (rows, bytes) processed.
+
+@stage("s3_listing")
+def setup_listing():
+    from create_ndfd_archive import get_ndfd_file_list
+    from ndfd_planner import file_cycle
+    root = fixture("ndfd", "wmo")
+    cycles = [file_cycle(f) for f in ndfd_fixture_files("wspd")]
+    start, end = min(cycles).strftime("%Y%m%d%H%M"), max(cycles).strftime("%Y%m%d%H%M")
+
+    def run():
+        files = get_ndfd_file_list(start, end, config.NDFD_DICT, base_url=root)
+        return sum(len(v) for v in files.values()), 0
+    return run
+
+
+@stage("grib_fetch")
+def setup_fetch():
+    import fsspec
+    files = ndfd_fixture_files("wspd") + ndfd_fixture_files("wdir")
+
+    def run():
+        nbytes = 0
+        for f in files:
+            with fsspec.open(f, "rb") as fh:
+                nbytes += len(fh.read())
+        return len(files), nbytes
+    return run
+
+
+@stage("decode")
+def setup_decode():
+    from create_ndfd_archive import open_grib
+    files = ndfd_fixture_files("wspd")[:8]
+
+    def run():
+        cells = 0
+        for f in files:
+            with open_grib(f, config.TMP) as ds:
+                cells += sum(v.load().size for v in ds.data_vars.values())
+        return cells, sum(os.path.getsize(f) for f in files)
+    return run
+
+
+@stage("station_extraction")
+def setup_extraction():
+    import create_ndfd_archive as ndfd
+    speed, direction = ndfd_fixture_files("wspd")[0], ndfd_fixture_files("wdir")[0]
+    ds_speed = ndfd.open_grib(speed, config.TMP).load()
+    ds_dir = ndfd.open_grib(direction, config.TMP).load()
+    stations = synthetic_stations()
+    keys = config.NDFD_ELEMENT_STRINGS[config.ELEMENT]
+
+    def run():
+        # cold station index each repeat, as for the first file of a nightly run
+        ndfd.station_index_cache.clear()
+        df = ndfd.extract_station_records(ds_speed, ds_dir, stations, keys)
+        return len(df), 0
+    return run
+
+
+@stage("obs_json_parse")
+def setup_obs_json():
+    from create_obs_archive import obs_frame_from_json
+    files = sorted(glob.glob(os.path.join(fixture("synoptic"), "*.json")))
+    if not files:
+        raise Skip("no Synoptic JSON fixtures")
+    payloads = [open(f, "rb").read() for f in files]
+
+    def run():
+        rows = 0
+        for raw in payloads:
+            data = json.loads(raw)
+            rows += len(obs_frame_from_json(data, data["STATION"][0]["STID"]))
+        return rows, sum(len(p) for p in payloads)
+    return run
+
+
+@stage("pairing")
+def setup_pairing():
+    from pairing import pair_forecasts
+    fcst, obs = synthetic_forecasts(), synthetic_obs()
+
+    def run():
+        return len(pair_forecasts(fcst, obs, source="bench")), 0
+    return run
+
+
+@stage("parquet_write")
+def setup_parquet():
+    from create_obs_archive import write_obs_batch
+    from obs_qc import run_qc
+    obs = run_qc(synthetic_obs())
+    out_dir = tempfile.mkdtemp(prefix="bench_obs_")
+
+    def run():
+        shutil.rmtree(out_dir, ignore_errors=True)
+        rows = write_obs_batch(obs, out_dir)
+        nbytes = sum(os.path.getsize(f) for f in glob.glob(os.path.join(out_dir, "**", "*.parquet"), recursive=True))
+        return rows, nbytes
+    return run
+
+
+@stage("verification_aggregation")
+def setup_verification():
+    from pairing import pair_forecasts
+    from verification_stats import accumulate_stats, merge_stats
+    pairs = pair_forecasts(synthetic_forecasts(), synthetic_obs(), source="bench")
+
+    def run():
+        merge_stats(accumulate_stats(pairs))
+        return len(pairs), 0
+    return run
+
+
+def measure(name, repeats):
+    """Run one stage in this process: best-of wall time, then one traced pass for peak allocation."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        run = STAGES[name]()
+        walls = []
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            rows, nbytes = run()
+            walls.append(time.perf_counter() - t0)
+        tracemalloc.start()
+        run()
+        _, py_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    wall = min(walls)
+    return {
+        "wall_s": round(wall, 4),
+        "wall_median_s": round(float(np.median(walls)), 4),
+        "rows": int(rows),
+        "rows_per_s": round(rows / wall, 1) if wall else None,
+        "bytes": int(nbytes),
+        "bytes_per_s": round(nbytes / wall, 1) if wall and nbytes else None,
+        "py_peak_mb": round(py_peak / 2**20, 1),
+        # ru_maxrss is KiB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def run_isolated(name, repeats):
+    """Measure a stage in a fresh process so peak RSS belongs to that stage alone."""
+    ctx = mp.get_context("spawn")
+    with ctx.Pool(1) as pool:
+        try:
+            return pool.apply(measure_or_skip, (name, repeats))
+        except Exception as e:
+            return {"error": f"{type(e).__name__}: {e}"}
+
+
+def measure_or_skip(name, repeats):
+    try:
+        return measure(name, repeats)
+    except Skip as e:
+        return {"skipped": str(e)}
+    except ImportError as e:
+        return {"skipped": f"missing dependency: {e}"}
+
+
+def compare(results, baseline, threshold_pct=config.BENCH_REGRESSION_PCT):
+    print(f"{'stage':<26}{'wall s':>9}{'rows/s':>14}{'MB/s':>9}{'py MB':>8}{'rss MB':>8}{'vs base':>9}")
+    regressions = []
+    for name, r in results.items():
+        if "wall_s" not in r:
+            print(f"{name:<26}  ⚠️ {r.get('skipped') or r.get('error')}")
+            continue
+        base = baseline.get(name, {}).get("wall_s")
+        delta = ""
+        if base:
+            pct = 100 * (r["wall_s"] - base) / base
+            delta = f"{pct:+.0f}%"
+            if pct > threshold_pct:
+                regressions.append(name)
+                delta += " ❌"
+        mbps = f"{r['bytes_per_s'] / 2**20:.1f}" if r["bytes_per_s"] else "-"
+        print(f"{name:<26}{r['wall_s']:>9.3f}{r['rows_per_s'] or 0:>14,.0f}{mbps:>9}{r['py_peak_mb']:>8}{r['peak_rss_mb']:>8}{delta:>9}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark pipeline stages on offline fixtures.")
+    parser.add_argument("-s", "--stages", nargs="+", choices=sorted(STAGES), default=list(STAGES))
+    parser.add_argument("-n", "--repeats", type=int, default=config.BENCH_REPEATS)
+    parser.add_argument("--baseline", default=config.BENCH_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--json", help="also write this run's results to a JSON file")
+    parser.add_argument("--fixtures", help="fixture directory (default config.BENCH_FIXTURES_DIR)")
+    args = parser.parse_args(argv)
+    if args.fixtures:
+        # stage workers are spawned and re-read config, so pass it through the environment
+        os.environ["BENCH_FIXTURES_DIR"] = os.path.abspath(args.fixtures)
+
+    results = {name: run_isolated(name, args.repeats) for name in args.stages}
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f).get("stages", {})
+    regressions = compare(results, baseline)
+
+    record = {"created": pd.Timestamp.now(tz="UTC").isoformat(), "python": sys.version.split()[0], "stages": results}
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(record, f, indent=2)
+    if args.save_baseline:
+        # keep baseline entries for stages that were not run this time
+        merged = dict(baseline, **{k: v for k, v in results.items() if "wall_s" in v})
+        with open(args.baseline, "w") as f:
+            json.dump(dict(record, stages=merged), f, indent=2)
+        print(f"✅ Saved baseline to {args.baseline}")
+    if regressions:
+        print(f"❌ Slower than baseline by more than {config.BENCH_REGRESSION_PCT}%: {', '.join(regressions)}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+import wind_config as config
+from archive_query import get_series, get_obs_rollup
+from verification_cube import VerificationCube
+
+"""
+Chart data export for browser-side plotting. Each station gets one compact JSON bundle with
+its hourly obs, every source's forecasts by lead and its verification scores. Times and
+values are quantized to integers and delta-encoded, so a week of series is a few KB. A
+manifest lists each bundle's hash; bundles whose content did not change are not rewritten,
+so a refresh only touches the stations that got new data. charts.html draws them.
+"""
+
+FIELDS = {"wind_speed_kt": "wind_speed", "wind_dir_deg": "wind_direction", "wind_gust_kt": "wind_gust"}
+
+SCORE_COLUMNS = ["n_speed", "bias", "mae", "rmse", "corr", "vector_rmse", "dir_bias", "dir_mae"]
+
+
+def delta_encode(values, scale=1):
+    """Quantize to 1/scale and store differences from the previous non-null value; NaN -> None."""
+    values = np.asarray(values, dtype="float64")
+    valid = ~np.isnan(values)
+    q = np.round(values[valid] * scale).astype("int64")
+    out = np.full(len(values), None, dtype=object)
+    out[valid] = np.diff(q, prepend=0)
+    return out.tolist()
+
+
+def delta_decode(encoded, scale=1):
+    out = np.full(len(encoded), np.nan)
+    valid = np.array([v is not None for v in encoded], dtype=bool)
+    out[valid] = np.cumsum([v for v in encoded if v is not None]) / scale
+    return out
+
+
+def encode_series(df, t0, scale):
+    """Encode one station's series: t in minutes after t0, value columns that have any data."""
+    minutes = (df["valid_time"] - t0) // pd.Timedelta("1min")
+    out = {"t": delta_encode(minutes)}
+    for col, name in FIELDS.items():
+        if col in df and df[col].notna().any():
+            out[name] = delta_encode(df[col], scale)
+    return out
+
+
+def station_bundle(stid, t0, obs, forecasts, scores, scale=config.CHART_SCALE):
+    bundle = {"v": 1, "stid": stid, "t0": t0.isoformat(), "scale": scale, "obs": None, "models": {}, "scores": []}
+    if obs is not None:
+        bundle["obs"] = encode_series(obs, t0, scale)
+    for source, fcst in forecasts.items():
+        bundle["models"][source] = {
+            str(int(lead)): encode_series(grp, t0, scale) for lead, grp in fcst.groupby("lead_hr")
+        }
+    if scores is not None:
+        cols = ["source", "lead_hr"] + [c for c in SCORE_COLUMNS if c in scores]
+        rounded = scores[cols].round(2).astype(object).where(scores[cols].notna(), None)
+        bundle["scores"] = rounded.to_dict(orient="records")
+    return bundle
+
+
+def split_by_station(df, order=("valid_time",)):
+    if df is None or df.empty:
+        return {}
+    return {stid: grp.sort_values(list(order), ignore_index=True) for stid, grp in df.groupby("stid")}
+
+
+def load_scores(stations, cube_dir=config.VERIFICATION_CUBE_DIR):
+    if not os.path.exists(os.path.join(cube_dir, "manifest.json")):
+        return pd.DataFrame(columns=["stid", "source", "lead_hr"] + SCORE_COLUMNS)
+    return VerificationCube(cube_dir).query(stid=list(stations), by=("stid", "source", "lead_hr"))
+
+
+def write_if_changed(path, payload, old_hash):
+    digest = hashlib.sha1(payload).hexdigest()
+    if digest != old_hash or not os.path.exists(path):
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(payload)
+        os.replace(f"{path}.tmp", path)
+        return digest, True
+    return digest, False
+
+
+def export_charts(stations, start=None, end=None, sources=config.CHART_SOURCES, out_dir=config.CHART_EXPORT_DIR,
+                  cube_dir=config.VERIFICATION_CUBE_DIR):
+    """Write per-station chart bundles for [start, end) and a manifest; returns the stations rewritten."""
+    end = pd.Timestamp(end) if end is not None else pd.Timestamp.now(tz="UTC").floor("h")
+    end = end.tz_localize("UTC") if end.tzinfo is None else end
+    start = pd.Timestamp(start) if start is not None else end - pd.Timedelta(days=config.CHART_WINDOW_DAYS)
+    start = start.tz_localize("UTC") if start.tzinfo is None else start
+    stations = list(stations)
+
+    # hourly obs from the stored rollup; only bins it lacks are binned from the archive
+    hourly = get_obs_rollup(stations, "1h", start, end)
+    hourly = hourly[hourly["valid_time"] < end].rename(columns={v: k for k, v in FIELDS.items()})
+    obs_by_stid = split_by_station(hourly)
+    fcst_by_source = {source: split_by_station(get_series(source, stations, start, end)) for source in sources}
+    scores_by_stid = split_by_station(load_scores(stations, cube_dir), order=("source", "lead_hr"))
+
+    os.makedirs(os.path.join(out_dir, "stations"), exist_ok=True)
+    manifest_path = os.path.join(out_dir, "manifest.json")
+    old = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            old = json.load(f).get("stations", {})
+
+    entries, changed = {}, []
+    for stid in stations:
+        forecasts = {src: by_stid[stid] for src, by_stid in fcst_by_source.items() if stid in by_stid}
+        if stid not in obs_by_stid and not forecasts:
+            continue
+        bundle = station_bundle(stid, start, obs_by_stid.get(stid), forecasts, scores_by_stid.get(stid))
+        payload = json.dumps(bundle, separators=(",", ":")).encode()
+        fname = f"stations/{stid}.json"
+        digest, wrote = write_if_changed(os.path.join(out_dir, fname), payload, old.get(stid, {}).get("hash"))
+        entries[stid] = {"file": fname, "hash": digest, "bytes": len(payload), "sources": sorted(forecasts)}
+        if wrote:
+            changed.append(stid)
+    for stid in set(old) - set(entries):
+        stale = os.path.join(out_dir, old[stid]["file"])
+        if os.path.exists(stale):
+            os.remove(stale)
+
+    # manifest last, so a reader never sees a hash for a bundle that is not there yet
+    manifest = {"generated": pd.Timestamp.now(tz="UTC").isoformat(), "start": start.isoformat(),
+                "end": end.isoformat(), "stations": entries}
+    with open(f"{manifest_path}.tmp", "w") as f:
+        json.dump(manifest, f, separators=(",", ":"))
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+    write_chart_page(out_dir)
+    print(f"✅ Chart bundles: {len(changed)} rewritten, {len(entries) - len(changed)} unchanged ({out_dir})")
+    return changed
+
+
+CHART_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Station wind charts</title>
+<script src="https://cdn.jsdelivr.net/npm/chart.js@4"></script>
+<style>body{font-family:sans-serif;margin:1em}canvas{max-height:320px}table{border-collapse:collapse}td,th{padding:2px 8px;border:1px solid #ccc}</style>
+</head><body>
+<select id="stid"></select> <select id="param"><option>wind_speed</option><option>wind_direction</option><option>wind_gust</option></select>
+<canvas id="chart"></canvas><table id="scores"></table>
+<script>
+const decode=(a,s=1)=>{let acc=0;return a.map(v=>v===null?null:(acc+=v)/s);};
+let manifest, chart;
+async function show(){
+  const stid=document.getElementById('stid').value, param=document.getElementById('param').value;
+  const b=await (await fetch(manifest.stations[stid].file+'?h='+manifest.stations[stid].hash)).json();
+  const t0=Date.parse(b.t0), series=[];
+  const add=(label,s,style)=>{ if(!s||!s[param]) return; const t=decode(s.t), y=decode(s[param],b.scale);
+    series.push({label,data:t.map((m,i)=>({x:t0+m*60000,y:y[i]})),pointRadius:0,borderWidth:1,...style}); };
+  add('obs',b.obs,{borderColor:'black',borderDash:[4,3]});
+  for(const [src,leads] of Object.entries(b.models)) for(const [lead,s] of Object.entries(leads)) add(`${src} ${lead}h`,s,{});
+  if(chart) chart.destroy();
+  chart=new Chart(document.getElementById('chart'),{type:'line',data:{datasets:series},options:{animation:false,parsing:false,
+    scales:{x:{type:'linear',ticks:{callback:v=>new Date(v).toISOString().slice(5,13).replace('T',' ')+'Z'}}}}});
+  const rows=b.scores.map(r=>'<tr>'+Object.values(r).map(v=>`<td>${v??''}</td>`).join('')+'</tr>');
+  document.getElementById('scores').innerHTML=b.scores.length?'<tr>'+Object.keys(b.scores[0]).map(k=>`<th>${k}</th>`).join('')+'</tr>'+rows.join(''):'';
+}
+fetch('manifest.json',{cache:'no-cache'}).then(r=>r.json()).then(m=>{manifest=m;
+  const sel=document.getElementById('stid'); sel.innerHTML=Object.keys(m.stations).sort().map(s=>`<option>${s}</option>`).join('');
+  sel.onchange=show; document.getElementById('param').onchange=show; show();});
+</script></body></html>
+"""
+
+
+def write_chart_page(out_dir=config.CHART_EXPORT_DIR):
+    with open(os.path.join(out_dir, "charts.html"), "w") as f:
+        f.write(CHART_PAGE)
+
+
+if __name__ == "__main__":
+    export_charts(sorted({stid for group in config.STATION_GROUPS.values() for stid in group}))
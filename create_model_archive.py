@@ -1,12 +1,13 @@
 import os
-import requests
+import argparse
 from datetime import datetime
 import numpy as np
-import xarray as xr
 import pandas as pd
-from herbie import FastHerbie, Herbie
 from glob import glob
 import wind_config as config
+from station_catalog import load_station_catalog
+from pipeline_metrics import run, span, count
+from executors import Executor, BACKENDS
 
 """
 Latest version of Herbie has issues with an Unbound Local Error when defining the CRS
@@ -23,54 +24,26 @@ def ensure_dir(directory):
         print(f"{directory} already exists...skipping creation step.")
 
 
-def create_wind_metadata(url, token, state, networks, vars, obrange):
-    # setting up synoptic params
-    # Parameters for the API request
-    params = {
-        "token": token,
-        "vars": vars,  # Variables to retrieve
-        "obrange": obrange,
-        "network": networks,
-        "state": state,
-        "output": "json"           # Output format
-    }
-
-    # Make the API request
-    response = requests.get(url, params=params)
-
-    # Check if the request was successful
-    if response.status_code == 200:
-        data = response.json()
-    return data
-
-def parse_metadata(data):
-    stn_dict = {"stid": [], "name": [], "latitude": [], "longitude": [], "elevation": []}
-    for stn in data["STATION"]:
-        stn_dict['stid'].append(stn['STID'])
-        stn_dict['name'].append(stn['NAME'])
-        stn_dict['latitude'].append(stn['LATITUDE'])
-        stn_dict['longitude'].append(stn['LONGITUDE'])
-        stn_dict['elevation'].append(stn['ELEVATION'])
-    meta_df = pd.DataFrame(stn_dict)
-    return meta_df
-
-
-def get_model(model,dates,stns):
+def get_model_lead(model,dates,stns,fcst):
+    """Station points for one forecast lead over dates; the grids stay on the worker that decodes them."""
     global config
+    # Herbie and xarray take seconds to import, so only the commands that decode grids pay for them
+    import xarray as xr
+    from herbie import FastHerbie
     products = config.HERBIE_PRODUCTS
-    fcsts = config.HERBIE_FORECASTS
-			
-    print(f'getting {model} data with Herbie')
-    all_dates=[]
-    for fcst in fcsts[model]:
-        rdates=dates-pd.Timedelta(fcst,unit='hours')
+    rdates=dates-pd.Timedelta(fcst,unit='hours')
+    with span("list", model=model, fxx=fcst):
         if model in ['rtma_ak','urma_ak']:
             H=FastHerbie(rdates,model=model,product=products[model],
                 priority=['aws'])
-            H.download()
         else:
             H=FastHerbie(rdates,model=model,fxx=[fcst],
                 product=products[model],priority=['aws'])
+    count("files_listed", len(H.objects), model=model)
+    if model in ['rtma_ak','urma_ak']:
+        with span("fetch", model=model, fxx=fcst):
+            H.download()
+    with span("decode", model=model, fxx=fcst):
         if config.ELEMENT == "Wind":
             varlist = config.HERBIE_XARRAY_STRINGS[config.ELEMENT][model]
             if model=='nbm':
@@ -83,10 +56,30 @@ def get_model(model,dates,stns):
                 ds2=H.xarray(varlist[1],remove_grib=False)
                 ds=xr.merge([ds1,ds2])
                 ds=ds.drop_vars(['u10','v10'])
+    with span("extract", model=model, fxx=fcst):
         pts = ds.herbie.pick_points(stns,method='weighted',tree_name=f'{model}_tree',use_cached_tree=True)	
         if 'k' in pts.dims:
             pts=pts.drop_dims('k')
-        all_dates.append(pts)
+    count("rows_extracted", pts.sizes.get('point',0)*len(rdates), model=model)
+    return pts
+
+
+def get_model(model,dates,stns,executor=None):
+    """
+    Station points for every configured lead. Leads run one after another here, or as
+    tasks on executor, each routed by model and lead so a rerun lands on the worker that
+    kept that lead's GRIBs (remove_grib=False) and the cached KD-tree.
+    """
+    import xarray as xr
+    fcsts = config.HERBIE_FORECASTS
+			
+    print(f'getting {model} data with Herbie')
+    if executor is None:
+        all_dates=[get_model_lead(model,dates,stns,fcst) for fcst in fcsts[model]]
+    else:
+        futures=[executor.submit(get_model_lead,model,dates,stns,fcst,affinity=f'{model}_f{fcst:03d}')
+                 for fcst in fcsts[model]]
+        all_dates=[future.result() for future in futures]
 
     all_dates=xr.combine_nested(all_dates,concat_dim='time')
     return all_dates
@@ -97,6 +90,7 @@ def append_to_netcdf(new_ds, output_path, time_dim="time"):
     Appends new data along the time dimension to an existing NetCDF file.
     Avoids duplicate time steps using precise timestamp matching.
     """
+    import xarray as xr
     if os.path.exists(output_path):
         print(f"Existing NetCDF found: {output_path}. Merging new data...")
 
@@ -128,6 +122,7 @@ def append_to_netcdf(new_ds, output_path, time_dim="time"):
 
 def create_dataframe_fm_netcdf(model, ncfile, outputdir):
     global config
+    import xarray as xr
     with xr.open_dataset(ncfile, decode_timedelta=True) as ds:
         #ds = ds.sortby("time")
         # Loop through each point
@@ -210,50 +205,62 @@ def build_parquet_archive(input_dir, output_file):
         [melt_forecast_csv(f, os.path.basename(f).split("_")[0].upper()) for f in all_files],
         ignore_index=True
     )
-    df_all.to_parquet(output_file, index=False)
+    df_all = df_all.sort_values(["stid", "valid_time", "step_hr"], ignore_index=True)
+    df_all.to_parquet(output_file, index=False, row_group_size=config.PARQUET_ROW_GROUP_ROWS)
+    count("rows_written", len(df_all))
+    count("bytes_written", os.path.getsize(output_file))
     print(f"✅ Saved combined forecast archive to {output_file}")
 
-model = config.MODEL
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build a Herbie model forecast archive at the catalog stations.")
+    parser.add_argument("--model", default=config.MODEL, choices=config.HERBIE_MODELS)
+    parser.add_argument("--start", default=config.OBS_START, help="YYYYmmddHHMM")
+    parser.add_argument("--end", default=config.OBS_END, help="YYYYmmddHHMM")
+    parser.add_argument("--executor", choices=BACKENDS, help="run the leads as tasks here (default: one at a time in this process)")
+    parser.add_argument("--address", default=config.DASK_SCHEDULER, help='dask scheduler address or "local"')
+    args = parser.parse_args(argv)
+    model = args.model
+
+    with run(f"{model}_archive"):
+        # grabbing wind archive at our synoptic metadata sites
+        # Load station list from the cached station catalog
+        df_sites = load_station_catalog()
+        station_points = df_sites[["stid", "latitude", "longitude"]].dropna()
+        print(station_points.head(5))
+        cycle=config.HERBIE_CYCLES[model]
+        end = pd.Timestamp(args.end)
+        print(f'End time is: {end}')
+        start = pd.Timestamp(args.start)
+        print(f'Start time is: {start}')
+        dates=pd.date_range(start,end,freq=cycle)
+        print(f'Date range is: {dates}')
+        # getting our archive by model
+        if args.executor:
+            with Executor(args.executor, len(config.HERBIE_FORECASTS[model]), args.address) as executor:
+                model_data = get_model(model, dates, station_points, executor)
+        else:
+            model_data = get_model(model, dates, station_points)
+        #making sure we have a model directory
+        ensure_dir(config.MODEL_DIR)
+        # creating a directory for our particular model if we haven't already
+        ensure_dir(os.path.join(config.MODEL_DIR, model))
+        raw_output_file = f"{model}_archive_latest.nc"
+        raw_output_dir = os.path.join(config.MODEL_DIR, model)
+        raw_output_loc = os.path.join(raw_output_dir, raw_output_file)
+        # saving new data as .netcdf
+        with span("write", format="netcdf"):
+            append_to_netcdf(model_data, raw_output_loc)
+        # Now creating our dataframes for archive purposes
+        with span("write", format="csv"):
+            create_dataframe_fm_netcdf(model, raw_output_loc, os.path.join(os.path.join(config.MODEL_DIR, model)))
+        # Now creating our database file
+        output_parquet = os.path.join(raw_output_dir, f"alaska_{model}_{config.ELEMENT.lower()}_forecasts.parquet")
+        with span("write", format="parquet"):
+            build_parquet_archive(raw_output_dir, output_parquet)
+
 
 if __name__ == "__main__":
-    if not os.path.exists(os.path.join(config.OBS, config.METADATA)):
-        print(f"Couldn't find {config.METADATA} in {config.OBS}...will need to create the file")
-        ensure_dir(config.OBS)
-        # getting our metadata if we don't have it
-        print(f'Creating metadata file from {config.METADATA_URL}')
-        meta_json = create_wind_metadata(config.METADATA_URL, config.API_KEY, config.STATE, config.NETWORK, config.WIND_VARS, config.OBS_START)
-        meta_df = parse_metadata(meta_json)
-        meta_df.to_csv(os.path.join(config.OBS, config.METADATA), index=False)
-        print(f"All done creating metadata.  Saved {config.METADATA} in {config.OBS}.")
-    
-    # grabbing wind archive at our synoptic metadata sites
-    # Load station list from CSV
-    df_sites = pd.read_csv(os.path.join(config.OBS, config.METADATA))  
-    station_points = df_sites[["stid", "latitude", "longitude"]].dropna()
-    print(station_points.head(5))
-    cycle=config.HERBIE_CYCLES[model]
-    end = pd.Timestamp(config.OBS_END)
-    print(f'End time is: {end}')
-    start = pd.Timestamp(config.OBS_START)
-    print(f'Start time is: {start}')
-    dates=pd.date_range(start,end,freq=cycle)
-    print(f'Date range is: {dates}')
-    # getting our archive by model
-    model_data = get_model(model, dates, station_points)
-    #making sure we have a model directory
-    ensure_dir(config.MODEL_DIR)
-    # creating a directory for our particular model if we haven't already
-    ensure_dir(os.path.join(config.MODEL_DIR, model))
-    raw_output_file = f"{model}_archive_latest.nc"
-    raw_output_dir = os.path.join(config.MODEL_DIR, model)
-    raw_output_loc = os.path.join(raw_output_dir, raw_output_file)
-    # saving new data as .netcdf
-    append_to_netcdf(model_data, raw_output_loc)
-    # Now creating our dataframes for archive purposes
-    create_dataframe_fm_netcdf(model, raw_output_loc, os.path.join(os.path.join(config.MODEL_DIR, model)))
-    # Now creating our database file
-    output_parquet = os.path.join(raw_output_dir, f"alaska_{model}_{config.ELEMENT.lower()}_forecasts.parquet")
-    build_parquet_archive(raw_output_dir, output_parquet)
+    main()
 
 
 #TODO Need to look at removing extaneous .csv files or creating parquest directly from .netcdf
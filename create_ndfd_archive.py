@@ -1,19 +1,23 @@
 import os
 import io
+import glob
+import time
 import shutil
-import requests
-import fsspec
-import xarray as xr
+import json
+import uuid
+import argparse
 import pandas as pd
 import numpy as np
-import pyarrow.parquet as pq
-import pyarrow as pa
-import pyarrow.fs as pafs
 from collections import defaultdict
 from datetime import datetime, timedelta
-from dateutil.relativedelta import relativedelta
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import contextlib
 import wind_config as config
+from station_catalog import load_station_catalog
+from storage import (s3_filesystem, arrow_s3_filesystem, filesystem, cached_copy, write_parquet, read_parquet,
+                     file_lock, read_versioned, put_if, PreconditionFailed)
+from pipeline_metrics import run, span, count, fail
+from executors import Executor, BACKENDS
+from ndfd_planner import list_cycle_files, plan_files, estimate, print_estimate, calibrate
 
 # setting temp storage
 os.environ["TMPDIR"] = config.TMP
@@ -38,151 +42,126 @@ def ll_to_index(loclat, loclon, datalats, datalons):
     latlon_idx = np.unravel_index(latlon_idx_flat, datalons.shape)
     return latlon_idx
 
-def create_wind_metadata(url, token, state, networks, vars, obrange):
-    # setting up synoptic params
-    # Parameters for the API request
-    params = {
-        "token": token,
-        "vars": vars,  # Variables to retrieve
-        "obrange": obrange,
-        "network": networks,
-        "state": state,
-        "output": "json"           # Output format
-    }
-
-    # Make the API request
-    response = requests.get(url, params=params)
-
-    # Check if the request was successful
-    if response.status_code == 200:
-        data = response.json()
-    return data
-
-def parse_metadata(data):
-    stn_dict = {"stid": [], "name": [], "latitude": [], "longitude": [], "elevation": []}
-    for stn in data["STATION"]:
-        stn_dict['stid'].append(stn['STID'])
-        stn_dict['name'].append(stn['NAME'])
-        stn_dict['latitude'].append(stn['LATITUDE'])
-        stn_dict['longitude'].append(stn['LONGITUDE'])
-        stn_dict['elevation'].append(stn['ELEVATION'])
-    meta_df = pd.DataFrame(stn_dict)
-    return meta_df
-
 def extract_timestamp(filename):
     time_str = os.path.basename(filename).split("_")[-1]
     return datetime.strptime(time_str, "%Y%m%d%H%M")
 
 
-def get_ndfd_file_list(start, end, element_dict, element_type="Wind"):
-    global config
+def product_code(filename):
+    """Product suffix of a feed file, "98" (days 1-3) or "97" (days 4-7)."""
+    return os.path.basename(filename).split("_")[0][-2:]
+
+
+def get_ndfd_file_list(start, end, element_dict, element_type="Wind", base_url=None):
     """
-    Return filtered S3 GRIB file paths for both Speed and Direction wind forecasts from NDFD.
+    Return S3 GRIB file paths for both Speed and Direction wind forecasts from NDFD, for the
+    issuance cycles in start..end (YYYYmmddHHMM). base_url defaults to config.NDFD_SOURCE_URL;
+    a local directory with the same wspd/YYYY/MM/DD layout works too (e.g. fixtures).
+    Use ndfd_planner.plan_files to select cycles by the valid times they cover instead.
     """
-    # Ensure temp cache dir exists
-    tmp = config.TMP
-    ensure_dir(tmp)
-
-    # Construct date range for forecast run times
-    start = pd.to_datetime(start, format="%Y%m%d%H%M") - pd.Timedelta(days=3)
-    end = pd.to_datetime(end, format="%Y%m%d%H%M") - pd.Timedelta(days=0)
-    date_range = pd.date_range(start=start, end=end, freq="D")
-
-    # S3 setup
-    base_s3 = "s3://noaa-ndfd-pds/wmo"
-    fs = fsspec.filesystem("s3", anon=True)
-    filtered_files = {"wspd": [], "wdir": []}
-
-    for component in ["wspd", "wdir"]:
-        prefixes = element_dict[element_type][component]
-        print(prefixes)
-        for tdate in date_range:
-            for prefix in prefixes:
-                pattern = f"{base_s3}/{component}/{tdate:%Y}/{tdate:%m}/{tdate:%d}/{prefix}_*"
-                try:
-                    matched_files = fs.glob(pattern)
-                    for file in matched_files:
-                        filename = os.path.basename(file)
-                        try:
-                            ftime = datetime.strptime(filename.split("_")[-1], "%Y%m%d%H%M")
-                            if ftime.hour in [11, 23]:  # 12Z or 00Z cycles
-                                filtered_files[component].append(file)
-                        except ValueError:
-                            continue
-                except Exception as e:
-                    print(f"⚠️ Could not fetch files for {pattern}: {e}")
-    
+    files = list_cycle_files(pd.to_datetime(start, format="%Y%m%d%H%M"), pd.to_datetime(end, format="%Y%m%d%H%M"),
+                             element_dict, element_type, base_url)
+    filtered_files = {component: files.loc[files["component"] == component, "path"].tolist() for component in ["wspd", "wdir"]}
+    for component, paths in filtered_files.items():
+        count("files_listed", len(paths), component=component)
     return filtered_files
 
 
-def process_file_pair(speed_file, dir_file, station_df, tmp_dir, element_keys):
-    records = []
-    try:
-        speed_url = f'simplecache::s3://{speed_file}'
-        #speed_url = f'simplecache::s3://{speed_file}?cache_storage={tmp_dir}'
-        dir_url = f'simplecache::s3://{dir_file}' if dir_file else None
-        #dir_url = f'simplecache::s3://{dir_file}?cache_storage={tmp_dir}' if dir_file else None
+def fetch_grib(path, tmp_dir):
+    """Local copy of one NDFD GRIB file; bucket keys are downloaded once into tmp_dir, local paths are used in place."""
+    if os.path.exists(path):
+        count("grib_local_reads")
+        return path
+    with span("fetch", file=os.path.basename(path)):
+        local, hit = cached_copy(f"s3://{path}", tmp_dir, anon=True)
+    if hit:
+        count("grib_cache_hits")
+    else:
+        count("bytes_fetched", os.path.getsize(local))
+    return local
 
-        with fsspec.open(speed_url, s3={"anon": True}, filecache={"cache_storage": tmp_dir}) as f_speed:
-            ds_speed = xr.open_dataset(f_speed.name, engine='cfgrib', backend_kwargs={'indexpath': ''}, decode_timedelta=True)
 
-        if dir_url:
-            with fsspec.open(dir_url, s3={"anon": True}, filecache={"cache_storage": tmp_dir}) as f_dir:
-                ds_dir = xr.open_dataset(f_dir.name, engine='cfgrib', backend_kwargs={'indexpath': ''}, decode_timedelta=True)
-        else:
-            ds_dir = None
+def open_grib(path, tmp_dir):
+    """Decode one NDFD GRIB file."""
+    import xarray as xr
+    local = fetch_grib(path, tmp_dir)
+    with span("decode", file=os.path.basename(path)):
+        return xr.open_dataset(local, engine='cfgrib', backend_kwargs={'indexpath': ''}, decode_timedelta=True).load()
 
-        lats = ds_speed.latitude.values
-        lons = ds_speed.longitude.values - 360
-        steps = pd.to_timedelta(ds_speed.step.values)
-        valid_times = pd.to_datetime(ds_speed.valid_time.values)
 
-        if len(element_keys) > 1:
-            spd_key, dir_key, gust_key = element_keys
-            speed_array = ds_speed[spd_key].values
-            dir_array = ds_dir[dir_key].values if ds_dir else None
+def process_file_pair(speed_file, dir_file, station_df, tmp_dir, element_keys):
+    with span("file_pair", file=os.path.basename(speed_file)):
+        try:
+            ds_speed = open_grib(speed_file, tmp_dir)
+            ds_dir = open_grib(dir_file, tmp_dir) if dir_file else None
+            with span("extract"):
+                df = extract_station_records(ds_speed, ds_dir, station_df, element_keys)
+            count("rows_extracted", len(df))
+            return df
+        except Exception as e:
+            fail(type(e).__name__)
+            print(f"❌ Failed to process {speed_file} + {dir_file}: {e}")
+        return pd.DataFrame()
+
+
+def extract_station_records(ds_speed, ds_dir, station_df, element_keys):
+    records = []
+    lats = ds_speed.latitude.values
+    lons = ds_speed.longitude.values - 360
+    steps = pd.to_timedelta(ds_speed.step.values)
+    valid_times = pd.to_datetime(ds_speed.valid_time.values)
+
+    if len(element_keys) > 1:
+        spd_key, dir_key, gust_key = element_keys
+        speed_array = ds_speed[spd_key].values
+        dir_array = ds_dir[dir_key].values if ds_dir else None
+    else:
+        spd_key = element_keys[0]
+        speed_array = ds_speed[spd_key].values
+        dir_array = None
+
+    for _, row in station_df.iterrows():
+        stid = row["stid"]
+        lat = row["latitude"]
+        lon = row["longitude"]
+
+        if stid in station_index_cache:
+            iy, ix = station_index_cache[stid]
+            count("station_index_cache_hits")
         else:
-            spd_key = element_keys[0]
-            speed_array = ds_speed[spd_key].values
-            dir_array = None
-
-        for _, row in station_df.iterrows():
-            stid = row["stid"]
-            lat = row["latitude"]
-            lon = row["longitude"]
-
-            if stid in station_index_cache:
-                iy, ix = station_index_cache[stid]
+            iy, ix = ll_to_index(lat, lon, lats, lons)
+            station_index_cache[stid] = (iy, ix)
+        
+        spd_values = speed_array[:, iy, ix]
+        dir_values = dir_array[:, iy, ix] if dir_array is not None else [None] * len(spd_values)
+
+        for step, valid_time, spd, direc in zip(steps, valid_times, spd_values, dir_values):
+            step_hr = int(step.total_seconds() / 3600)
+            record = {
+                "station_id": stid,
+                "valid_time": valid_time,
+                "forecast_hour": step_hr,
+            }
+            if config.ELEMENT == "Wind":
+                record["wind_speed_kt"] = round(float(spd * 1.94384), 2)
+                if direc is not None:
+                    record["wind_dir_deg"] = round(float(direc), 0)
+            elif config.ELEMENT == "Temperature":
+                record["temp_f"] = round(float(spd), 1)
             else:
-                iy, ix = ll_to_index(lat, lon, lats, lons)
-                station_index_cache[stid] = (iy, ix)
-            
-            spd_values = speed_array[:, iy, ix]
-            dir_values = dir_array[:, iy, ix] if dir_array is not None else [None] * len(spd_values)
-
-            for step, valid_time, spd, direc in zip(steps, valid_times, spd_values, dir_values):
-                step_hr = int(step.total_seconds() / 3600)
-                record = {
-                    "station_id": stid,
-                    "valid_time": valid_time,
-                    "forecast_hour": step_hr,
-                }
-                if config.ELEMENT == "Wind":
-                    record["wind_speed_kt"] = round(float(spd * 1.94384), 2)
-                    if direc is not None:
-                        record["wind_dir_deg"] = round(float(direc), 0)
-                elif config.ELEMENT == "Temperature":
-                    record["temp_f"] = round(float(spd), 1)
-                else:
-                    record[spd_key] = float(spd)
-
-                records.append(record)
+                record[spd_key] = float(spd)
+
+            records.append(record)
 
-    except Exception as e:
-        print(f"❌ Failed to process {speed_file} + {dir_file}: {e}")
     return pd.DataFrame.from_records(records)
 
-def extract_ndfd_forecasts_parallel(speed_files, direction_files, station_df, tmp_dir=config.TMP):
+def extract_ndfd_forecasts_parallel(speed_files, direction_files, station_df, tmp_dir=config.TMP, max_workers=8, executor=None,
+                                    failed=None):
+    """
+    Station rows from every speed/direction file pair. Pairs run on a thread pool of
+    max_workers, or on executor when given (routed by speed file, so a cluster worker that
+    already cached a file gets it again). Pairs that yield no rows are appended to failed.
+    """
     element_keys = config.NDFD_ELEMENT_STRINGS[config.ELEMENT]
 
     speed_with_time = sorted([(f, extract_timestamp(f)) for f in speed_files], key=lambda x: x[1])
@@ -194,7 +173,8 @@ def extract_ndfd_forecasts_parallel(speed_files, direction_files, station_df, tm
             min_diff = pd.Timedelta("2 minutes")
             for dir_file, dir_time in dir_with_time:
                 diff = abs(dir_time - speed_time)
-                if diff <= min_diff:
+                # the day 1-3 and day 4-7 products share a stamp, so match the product too
+                if diff <= min_diff and product_code(dir_file) == product_code(speed_file):
                     closest_match = dir_file
                     min_diff = diff
             matched_pairs.append((speed_file, closest_match))
@@ -203,17 +183,23 @@ def extract_ndfd_forecasts_parallel(speed_files, direction_files, station_df, tm
 
     print(f"🔄 Matched {len(matched_pairs)} file pairs.")
     results = []
-    with ThreadPoolExecutor(max_workers=8) as executor:
-        futures = [executor.submit(process_file_pair, s, d, station_df, tmp_dir, element_keys) for s, d in matched_pairs]
-        for i, future in enumerate(as_completed(futures), 1):
+    t0 = time.perf_counter()
+    with contextlib.nullcontext(executor) if executor else Executor("thread", max_workers) as ex:
+        futures = {ex.submit(process_file_pair, s, d, station_df, tmp_dir, element_keys, affinity=os.path.basename(s)): (s, d)
+                   for s, d in matched_pairs}
+        for i, future in enumerate(ex.as_completed(futures), 1):
             results.append(future.result())
-            print(f"✅ Completed {i}/{len(matched_pairs)} file pairs.")
+            if results[-1].empty and failed is not None:
+                failed.append(futures[future])
+            print(f"✅ Completed {i}/{len(matched_pairs)} file pairs ({time.perf_counter() - t0:.1f}s).")
     df_combined = pd.concat(results, ignore_index=True)
     return df_combined
 
 
 
 def write_partitioned_parquet(df, s3_uri, partition_cols):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
     try:
         # Add partition columns
         df["year"] = df["valid_time"].dt.year
@@ -229,7 +215,7 @@ def write_partitioned_parquet(df, s3_uri, partition_cols):
         key_prefix = "/".join(key_parts).rstrip("/")
 
         # Set up S3 filesystem with the correct bucket
-        s3 = pafs.S3FileSystem(region="us-east-2")
+        s3 = arrow_s3_filesystem()
 
         # Build full path within the bucket
         full_path = f"{bucket}/{key_prefix}" if key_prefix else bucket
@@ -248,31 +234,34 @@ def write_partitioned_parquet(df, s3_uri, partition_cols):
     except Exception as e:
         print(f"❌ Failed to write partitioned parquet: {e}")
 
-def write_to_s3(df, s3_parquet_path, region="us-east-2"):
+def write_to_s3(df, s3_parquet_path, region=config.AWS_REGION):
     try:
-        fs = fsspec.filesystem("s3", profile="default", client_kwargs={"region_name": region})
-        # Write the combined DataFrame back to S3
-        with fs.open(s3_parquet_path, "wb") as f:
-            df.to_parquet(f, index=False)
+        # station-major order with bounded row groups lets readers prune by station_id
+        df = df.sort_values(["station_id", "valid_time", "forecast_hour"], ignore_index=True)
+        with span("write", path=s3_parquet_path):
+            nbytes = write_parquet(df, s3_parquet_path, region=region, index=False,
+                                   row_group_size=config.PARQUET_ROW_GROUP_ROWS)
+        count("bytes_written", nbytes)
+        count("rows_written", len(df))
         print(f"✅ Successfully wrote to {s3_parquet_path}")
 
     except Exception as e:
+        fail("write")
         print(f"❌ Failed to update parquet at {s3_parquet_path}: {e}")
 
 def append_to_parquet_s3(
     df_new,
     s3_parquet_path,
-    region="us-east-2",
+    region=config.AWS_REGION,
     unique_keys=["station_id", "forecast_hour", "valid_time"]
 ):
     try:
-        fs = fsspec.filesystem("s3", profile="default", client_kwargs={"region_name": region})
+        fs = s3_filesystem(region=region)
 
         # If the file exists, read it from S3
         if fs.exists(s3_parquet_path):
             print(f"📥 Reading existing Parquet from {s3_parquet_path}")
-            with fs.open(s3_parquet_path, "rb") as f:
-                df_existing = pd.read_parquet(f)
+            df_existing = read_parquet(s3_parquet_path, region=region)
             print(f"📊 Existing records: {len(df_existing)}")
 
             # Combine and deduplicate
@@ -284,76 +273,293 @@ def append_to_parquet_s3(
             df_combined = df_new
 
         # Write the combined DataFrame back to S3
-        with fs.open(s3_parquet_path, "wb") as f:
-            df_combined.to_parquet(f, index=False)
+        write_parquet(df_combined, s3_parquet_path, region=region, index=False)
         print(f"✅ Successfully wrote to {s3_parquet_path}")
 
     except Exception as e:
         print(f"❌ Failed to update parquet at {s3_parquet_path}: {e}")
 
-if __name__ == "__main__":
-    # ensuring tmp storage
-    os.makedirs(config.TMP, exist_ok=True)
-    print(f"Temp cache is: {config.TMP}")
-    if not os.path.exists(os.path.join(config.OBS, config.METADATA)):
-        print(f"Couldn't find {config.METADATA} in {config.OBS}...will need to create the file")
-        ensure_dir(config.OBS)
-        print(f'Creating metadata file from {config.METADATA_URL}')
-        meta_json = create_wind_metadata(config.METADATA_URL, config.API_KEY, config.STATE, config.NETWORK, config.WIND_VARS, config.OBS_START)
-        meta_df = parse_metadata(meta_json)
-        meta_df.to_csv(os.path.join(config.OBS, config.METADATA), index=False)
-        print(f"All done creating metadata. Saved {config.METADATA} in {config.OBS}.")
-
-    station_df = pd.read_csv(os.path.join(config.OBS, config.METADATA))
-    speed_key, dir_key, gust_key = config.NDFD_FILE_STRINGS[config.ELEMENT]
-    parquet_file = f"alaska_ndfd_{config.ELEMENT.lower()}_forecasts.parquet"
-    #s3_output_path = f"{config.NDFD_S3_URL}{os.path.basename(parquet_file)}"
+def archive_root():
+    if config.USE_CLOUD_STORAGE:
+        return config.NDFD_S3_URL.rstrip("/")
+    return os.path.join(config.MODEL_DIR, config.NDFD_DIR)
+
+
+def archive_url(task):
+    return f"{archive_root()}/{config.NDFD_ARCHIVE_FILE.format(year=task.year, month=task.month)}"
+
+
+def run_url(run_id, task):
+    """A run's object for one month; it stays at this key once committed."""
+    return f"{archive_root()}/{config.NDFD_RUNS_DIR}/{run_id}/{os.path.basename(archive_url(task))}"
 
-    # Handle in monthly chunks
-    start = pd.to_datetime(config.OBS_START)
-    end = pd.to_datetime(config.OBS_END)
-    current = start
-    sites = station_df["stid"].values.tolist()
-    while current <= end:
-        chunk_end = (current + relativedelta(months=1)) - pd.Timedelta(minutes=1)
-        if chunk_end > end:
-            chunk_end = end
 
-        print(f"🗂️ Processing chunk: {current} to {chunk_end}")
+def manifest_url(task):
+    return f"{archive_root()}/{config.NDFD_MANIFEST_DIR}/{task:%Y_%m}.json"
 
-        filtered_files = get_ndfd_file_list(current.strftime("%Y%m%d%H%M"), chunk_end.strftime("%Y%m%d%H%M"), config.NDFD_DICT)
-        speed_files = filtered_files[speed_key]
-        direction_files = filtered_files.get(dir_key, [])
 
-        if not speed_files:
-            print(f"⚠️ No data for chunk {current} to {chunk_end} — skipping.")
+def read_manifest(task):
+    """(manifest, version) of a month; (None, None) before its first commit."""
+    data, version = read_versioned(manifest_url(task))
+    return (json.loads(data) if data else None), version
+
+
+def covered(manifest, files):
+    """True when a committed manifest already holds every planned file (one per product and cycle)."""
+    return set(files["path"].map(os.path.basename)) <= set((manifest or {}).get("fetched", []))
+
+
+def process_chunk(task, files, station_df, run_id, threads):
+    """
+    Fetch, decode and extract one month's planned files, then write them to this run's
+    object for the month. Runs in a backfill worker (a local process or a cluster node) with
+    its own GRIB cache directory. If the chunk fails the directory is kept, and the next
+    attempt at the month on the same worker claims it and starts from the files it holds.
+    """
+    tmp_dir = os.path.join(config.TMP, f"ndfd_{task:%Y_%m}_{run_id}")
+    speed_key, dir_key, gust_key = config.NDFD_FILE_STRINGS[config.ELEMENT]
+    speed_files = files.loc[files["component"] == speed_key, "path"].tolist()
+    direction_files = files.loc[files["component"] == dir_key, "path"].tolist()
+    result = {"task": str(task), "rows": 0, "files": len(files), "fetched": [], "staged": None}
+    if not speed_files:
+        print(f"⚠️ No speed files planned for {task:%Y-%m} — skipping.")
+        return result
+    # adopt the files a failed attempt at this month left on this host; the rename lets only
+    # one attempt claim them, so no two runs ever share a cache directory
+    for leftover in glob.glob(os.path.join(config.TMP, f"ndfd_{task:%Y_%m}_*.failed")):
+        try:
+            os.rename(leftover, tmp_dir)
+            print(f"🗂️ Reusing {leftover} for {task:%Y-%m}")
+            break
+        except OSError:
+            continue
+    os.makedirs(tmp_dir, exist_ok=True)
+    try:
+        with span("chunk", month=f"{task:%Y-%m}"):
+            failed = []
+            df_ndfd = extract_ndfd_forecasts_parallel(speed_files, direction_files, station_df, tmp_dir, max_workers=threads,
+                                                      failed=failed)
+            df_ndfd = df_ndfd.sort_values(["station_id", "valid_time", "forecast_hour"], ignore_index=True)
+            staged = run_url(run_id, task)
+            with span("write", path=staged):
+                result["bytes"] = write_parquet(df_ndfd, staged, index=False, row_group_size=config.PARQUET_ROW_GROUP_ROWS)
+            count("bytes_written", result["bytes"])
+            # only files that yielded rows count as archived, so a rerun retries the rest
+            missing = {os.path.basename(path) for pair in failed for path in pair if path}
+            fetched = sorted(set(files["path"].map(os.path.basename)) - missing)
+            result.update(rows=len(df_ndfd), fetched=fetched, staged=staged)
+    except Exception:
+        os.rename(tmp_dir, f"{tmp_dir}.failed")
+        print(f"⚠️ Keeping {tmp_dir}.failed for the retry of {task:%Y-%m}")
+        raise
+    # only this chunk's cache; other chunks are still reading theirs
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    return result
+
+
+def append_site_csvs(df_ndfd, sites):
+    # looping through sites and saving .csv files locally
+    for site in sites:
+        site_df = df_ndfd[df_ndfd["station_id"] == site]
+        site_file = os.path.join(os.path.join(config.MODEL_DIR,config.NDFD_DIR),f"{site}_ndfd_archive.csv")
+        if os.path.exists(site_file):
+            archive_df = pd.read_csv(site_file)
+            append_df = pd.concat([archive_df, site_df], ignore_index=True)
+            updated_df = append_df.drop_duplicates(subset=["valid_time", "forecast_hour"])
+            updated_df.to_csv(site_file, index=False)
         else:
-            df_ndfd = extract_ndfd_forecasts_parallel(speed_files, direction_files, station_df)
-            print(df_ndfd.head())
-            if config.USE_CLOUD_STORAGE:
-                # Partitioned write (current logic)
-                 #write_partitioned_parquet(df_ndfd, config.NDFD_S3_URL, partition_cols=["year", "month"])
-                s3_url = f'{config.NDFD_S3_URL}{current.year}_{current.month:02d}_ndfd_{config.ELEMENT.lower()}_archive.parquet'
-                write_to_s3(df_ndfd, s3_url)
+            archive_df = site_df.reset_index(drop=True)
+            archive_df.to_csv(site_file, index=False)
+
+
+def discard_staged(staged):
+    fs, path = filesystem(staged)
+    if fs.exists(path):
+        fs.rm(path)
+
+
+def merge_months(old_url, staged_df):
+    merged = pd.concat([read_parquet(old_url), staged_df], ignore_index=True)
+    merged = merged.drop_duplicates(subset=["station_id", "valid_time", "forecast_hour"], keep="last")
+    return merged.sort_values(["station_id", "valid_time", "forecast_hour"], ignore_index=True)
+
+
+def commit_chunk(result, run_id, sites):
+    """
+    Commit a month by pointing its manifest at this run's object. Objects stay at their
+    run-scoped keys and readers resolve the month through the manifest, so swapping the
+    manifest is the whole commit. The swap is a conditional put against the version read
+    here: when another run commits in between, the put fails and this run re-reads. A month
+    already committed by a newer run is left alone. When the committed object holds files
+    this run did not plan (e.g. the other product or an edge of an earlier backfill's
+    window), its rows are merged into this run's object rather than dropped.
+    """
+    task = pd.Timestamp(result["task"])
+    if not config.USE_CLOUD_STORAGE:
+        # the site CSVs are rewritten in place, so local commits take turns under a lock
+        with file_lock(os.path.join(archive_root(), config.NDFD_MANIFEST_DIR, "commit")):
+            return commit_local(result, run_id, sites, task)
+    staged_df = None
+    for attempt in range(config.NDFD_COMMIT_ATTEMPTS):
+        current, version = read_manifest(task)
+        if current and current["run_id"] > run_id:
+            print(f"⚠️ {task:%Y-%m} was committed by newer run {current['run_id']}; discarding this run's output.")
+            discard_staged(result["staged"])
+            return False
+        with span("commit", month=f"{task:%Y-%m}", attempt=attempt):
+            if current:
+                old = current.get("object")
+                merge = bool(old) and not set(current.get("fetched", [])) <= set(result["fetched"])
             else:
-                # looping through sites and saving .csv files locally
-                for site in sites:
-                    site_df = df_ndfd[df_ndfd["station_id"] == site]
-                    #print(site_df.head())
-                    site_file = os.path.join(os.path.join(config.MODEL_DIR,config.NDFD_DIR),f"{site}_ndfd_archive.csv")
-                    if os.path.exists(site_file):
-                        archive_df = pd.read_csv(site_file)
-                        append_df = pd.concat([archive_df, site_df], ignore_index=True)
-                        updated_df = append_df.drop_duplicates(subset=["valid_time", "forecast_hour"])
-                        updated_df.to_csv(site_file, index=False)
-                    else:
-                        archive_df = site_df.reset_index(drop=True)
-                        archive_df.to_csv(site_file, index=False)
-
-        # 🔁 Clean up and recreate the cache dir
-        shutil.rmtree(config.TMP, ignore_errors=True)
-        os.makedirs(config.TMP)
-
-        current += relativedelta(months=1)
-
-## TODO Work on functionality for model archive (NBM) and observation archive
\ No newline at end of file
+                # a fixed-name object written before manifests has no file list, so it is always merged
+                old = archive_url(task)
+                fs, path = filesystem(old)
+                merge = fs.exists(path)
+            if merge:
+                staged_df = read_parquet(result["staged"]) if staged_df is None else staged_df
+                merged = merge_months(old, staged_df)
+                write_parquet(merged, result["staged"], index=False, row_group_size=config.PARQUET_ROW_GROUP_ROWS)
+                result["rows"] = len(merged)
+            fetched = set(result["fetched"]) | set((current or {}).get("fetched", []))
+            manifest = {**result, "fetched": sorted(fetched), "run_id": run_id, "object": result["staged"],
+                        "previous": current.get("object") if current else None,
+                        "committed_at": pd.Timestamp.now(tz="UTC").isoformat()}
+            manifest.pop("staged")
+            try:
+                put_if(manifest_url(task), json.dumps(manifest, indent=1).encode(), version)
+            except PreconditionFailed:
+                count("commit_conflicts")
+                print(f"⚠️ {task:%Y-%m} manifest changed during commit; retrying")
+                continue
+        # readers that resolved the previous manifest may still be reading its object, so
+        # only the one before that is removed
+        stale = (current or {}).get("previous")
+        if stale and stale not in (manifest["previous"], manifest["object"]):
+            discard_staged(stale)
+        print(f"✅ Committed {task:%Y-%m}: {result['rows']} rows from {result['files']} files")
+        return True
+    raise RuntimeError(f"Could not commit {task:%Y-%m} after {config.NDFD_COMMIT_ATTEMPTS} attempts")
+
+
+def commit_local(result, run_id, sites, task):
+    """Local CSV mode: append the month to the site CSVs and record it, under the commit lock."""
+    current, version = read_manifest(task)
+    if current and current["run_id"] > run_id:
+        print(f"⚠️ {task:%Y-%m} was committed by newer run {current['run_id']}; discarding this run's output.")
+        discard_staged(result["staged"])
+        return False
+    with span("commit", month=f"{task:%Y-%m}"):
+        append_site_csvs(pd.read_parquet(result["staged"]), sites)
+        os.remove(result["staged"])
+        fetched = set(result["fetched"]) | set((current or {}).get("fetched", []))
+        manifest = {**result, "fetched": sorted(fetched), "run_id": run_id, "object": None,
+                    "committed_at": pd.Timestamp.now(tz="UTC").isoformat()}
+        manifest.pop("staged")
+        put_if(manifest_url(task), json.dumps(manifest, indent=1).encode(), version)
+    print(f"✅ Committed {task:%Y-%m}: {result['rows']} rows from {result['files']} files")
+    return True
+
+
+def chunk_concurrency(n_chunks, max_chunks, memory_gb):
+    """Month chunks to run at once: capped by the chunk count, max_chunks and the memory budget."""
+    by_memory = max(1, int(memory_gb // config.NDFD_CHUNK_MEMORY_GB))
+    return max(1, min(n_chunks, max_chunks, by_memory))
+
+
+def backfill(start, end, station_df, max_chunks=config.NDFD_BACKFILL_CHUNKS, threads=config.NDFD_BACKFILL_THREADS,
+             memory_gb=config.NDFD_MEMORY_BUDGET_GB, force=False, dry_run=False, rates=None, backend=None, address=None):
+    """
+    Archive the forecasts valid in start..end. The planner picks exactly the issuance cycles
+    that reach the window and assigns each file to its cycle's month. Months run concurrently
+    on the executor backend (local processes or a dask cluster, one month per task routed by
+    month), each writing straight to this run's object for the month, and the parent commits them as
+    they finish. On a cluster max_chunks and threads describe one node: each chunk gets
+    threads // max_chunks file-pair threads, and the cluster's slots set the concurrency.
+    Months whose manifest already lists every planned file are skipped unless force is set,
+    so a rerun picks up where a failed backfill stopped.
+    """
+    # run ids sort by start time, so a later run's commit is never replaced by an earlier one
+    run_id = f"{pd.Timestamp.now(tz='UTC'):%Y%m%dT%H%M%S}_{uuid.uuid4().hex[:6]}"
+    sites = station_df["stid"].values.tolist()
+    files = plan_files(start, end)
+    todo = {}
+    for task, task_files in files.groupby("task"):
+        done = None if force else read_manifest(task)[0]
+        if covered(done, task_files):
+            print(f"⏭️ {task:%Y-%m} already committed by {done['run_id']}")
+            continue
+        todo[task] = task_files
+    if not todo:
+        print("✅ Nothing to do.")
+        return []
+    workers = chunk_concurrency(len(todo), max_chunks, memory_gb)
+    committed, failed = [], {}
+    with Executor(backend, workers, address) as executor:
+        if executor.remote:
+            if not config.USE_CLOUD_STORAGE:
+                raise ValueError("A remote cluster needs USE_CLOUD_STORAGE so its workers can stage to the archive bucket")
+            workers, per_chunk = min(len(todo), executor.slots), max(1, threads // max_chunks)
+            print_estimate(*estimate(pd.concat(todo.values()), workers, per_chunk * workers, rates))
+        else:
+            per_chunk = max(1, threads // workers)
+            print_estimate(*estimate(pd.concat(todo.values()), workers, threads, rates))
+        if dry_run:
+            return []
+        print(f"🗂️ Backfill {run_id}: {len(todo)} months, {workers} at a time with {per_chunk} threads each")
+
+        futures = {executor.submit(process_chunk, task, task_files, station_df, run_id, per_chunk,
+                                   affinity=f"ndfd_{task:%Y_%m}"): task
+                   for task, task_files in todo.items()}
+        for future in executor.as_completed(futures):
+            task = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failed[task] = e
+                count("failures", category="chunk")
+                print(f"❌ Chunk {task:%Y-%m} failed: {e}")
+                continue
+            if not result["staged"]:
+                continue
+            try:
+                if commit_chunk(result, run_id, sites):
+                    committed.append(task)
+            except Exception as e:
+                # the staged object is left in place; a rerun plans this month again
+                failed[task] = e
+                count("failures", category="commit")
+                print(f"❌ Commit of {task:%Y-%m} failed: {e}")
+    print(f"✅ Backfill {run_id}: {len(committed)} months committed, {len(failed)} failed")
+    return committed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill the NDFD forecast archive for forecasts valid in start..end.")
+    parser.add_argument("--start", default=config.OBS_START, help="YYYYmmddHHMM")
+    parser.add_argument("--end", default=config.OBS_END, help="YYYYmmddHHMM")
+    parser.add_argument("--chunks", type=int, default=config.NDFD_BACKFILL_CHUNKS, help="months processed at once")
+    parser.add_argument("--threads", type=int, default=config.NDFD_BACKFILL_THREADS, help="file-pair threads shared by all chunks")
+    parser.add_argument("--memory-gb", type=float, default=config.NDFD_MEMORY_BUDGET_GB)
+    parser.add_argument("--force", action="store_true", help="redo months that already have a manifest")
+    parser.add_argument("--dry-run", action="store_true", help="print the plan and cost estimate only")
+    parser.add_argument("--calibrate", help="metrics .jsonl of an earlier run, for the estimate")
+    parser.add_argument("--executor", default=config.EXECUTOR, choices=BACKENDS, help="where month chunks run")
+    parser.add_argument("--address", default=config.DASK_SCHEDULER, help='dask scheduler address or "local"')
+    args = parser.parse_args(argv)
+    start = pd.to_datetime(args.start, format="%Y%m%d%H%M")
+    end = pd.to_datetime(args.end, format="%Y%m%d%H%M")
+
+    # ensuring tmp storage
+    os.makedirs(config.TMP, exist_ok=True)
+    print(f"Temp cache is: {config.TMP}")
+    station_df = load_station_catalog()
+    with run("ndfd_archive"):
+        backfill(start, end, station_df, args.chunks, args.threads,
+                 args.memory_gb, args.force, args.dry_run, calibrate(args.calibrate) if args.calibrate else None,
+                 args.executor, args.address)
+
+    ## TODO Work on functionality for model archive (NBM) and observation archive
+
+
+if __name__ == "__main__":
+    main()
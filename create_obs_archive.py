@@ -1,10 +1,35 @@
 import os 
 import time
+import random
+import argparse
 import requests
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 import pandas as pd
-from glob import glob
-import concurrent.futures
+import pyarrow as pa
+import pyarrow.parquet as pq
+from functools import partial
 import wind_config as config
+from station_catalog import load_station_catalog
+from obs_rollup import update_obs_rollup
+from obs_qc import run_qc, summarize_qc, QC_DUPLICATE
+from pipeline_metrics import run, span, count, fail, flush_counters
+from storage import file_lock
+from executors import Executor, BACKENDS
+
+# Typed schema for the obs archive. Rows are keyed on (stid, timestamp), speeds are in
+# knots, qc_flags holds the obs_qc bits and the dataset is hive partitioned by
+# year/month of the observation time.
+OBS_SCHEMA = pa.schema([
+    ("stid", pa.string()),
+    ("timestamp", pa.timestamp("ns", tz="UTC")),
+    ("wind_direction", pa.float64()),
+    ("wind_speed", pa.float64()),
+    ("wind_gust", pa.float64()),
+    ("qc_flags", pa.uint16()),
+])
+
+OBS_KEYS = ["stid", "timestamp"]
 
 
 def ensure_dir(directory):
@@ -16,25 +41,123 @@ def ensure_dir(directory):
         print(f"{directory} already exists...skipping creation step.")
 
 
-def create_wind_metadata(url, token, state, networks, vars, obrange):
-    # setting up synoptic params
-    # Parameters for the API request
-    params = {
-        "token": token,
-        "vars": vars,  # Variables to retrieve
-        "obrange": obrange,
-        "network": networks,
-        "state": state,
-        "output": "json"           # Output format
-    }
+def obs_frame_from_json(data, stid):
+    """Convert a Synoptic timeseries response into a typed obs frame (empty if no data)."""
+    if "STATION" not in data or len(data["STATION"]) == 0:
+        return pd.DataFrame(columns=OBS_SCHEMA.names)
+    station_data = data["STATION"][0]
 
-    # Make the API request
-    response = requests.get(url, params=params)
+    # Extract timestamps, wind speed, and wind direction
+    timestamps = station_data["OBSERVATIONS"]["date_time"]
+    wind_directions = station_data["OBSERVATIONS"].get("wind_direction_set_1", [None]*len(timestamps))
+    wind_speeds = station_data["OBSERVATIONS"].get("wind_speed_set_1", [None]*len(timestamps))
+    wind_gusts = station_data["OBSERVATIONS"].get("wind_gust_set_1", [None]*len(timestamps))
+
+    # Normalize speeds to knots using the units reported with the response
+    speed_units = data.get("UNITS", {}).get("wind_speed", "knots").lower()
+    if speed_units not in config.KNOTS_PER_UNIT:
+        print(f"⚠️ Unknown wind speed units '{speed_units}' for {stid}; storing values unconverted.")
+    to_knots = config.KNOTS_PER_UNIT.get(speed_units, 1.0)
+
+    # Create a DataFrame for the station
+    df_station = pd.DataFrame({
+        "stid": station_data.get("STID", stid),
+        "timestamp": pd.to_datetime(timestamps, utc=True),
+        "wind_direction": pd.to_numeric(pd.Series(wind_directions, dtype="object"), errors="coerce").astype("float64"),
+        "wind_speed": pd.to_numeric(pd.Series(wind_speeds, dtype="object"), errors="coerce").astype("float64"),
+        "wind_gust": pd.to_numeric(pd.Series(wind_gusts, dtype="object"), errors="coerce").astype("float64"),
+    })
+    df_station["wind_speed"] = (df_station["wind_speed"] * to_knots).round(2)
+    df_station["wind_gust"] = (df_station["wind_gust"] * to_knots).round(2)
+    return df_station
+
+
+def partition_path(archive_dir, year, month):
+    return os.path.join(archive_dir, f"year={year}", f"month={month}", "part-0.parquet")
+
+
+def previous_tail(archive_dir, year, month, stids, hours=config.QC_FLATLINE_HOURS):
+    """The last hours of the previous month's partition for stids, as QC context across the boundary."""
+    month_start = pd.Timestamp(year=year, month=month, day=1, tz="UTC")
+    prev = month_start - pd.Timedelta(days=1)
+    path = partition_path(archive_dir, prev.year, prev.month)
+    if not os.path.exists(path):
+        return None
+    table = pq.read_table(path, schema=OBS_SCHEMA, filters=[("stid", "in", list(stids)),
+                                                            ("timestamp", ">=", month_start - pd.Timedelta(hours=hours))])
+    return table.to_pandas()
+
+
+def write_obs_batch(df, archive_dir):
+    """
+    Merge a QC'd batch of obs into the partitioned Parquet archive.
+    Only the year/month partitions touched by the batch are read and rewritten, and
+    duplicates on (stid, timestamp) are resolved in favour of the newest batch. Each
+    partition is merged under a file lock, so the archiver and the plotting job's
+    write-back of stale stations never overwrite each other's rows. QC is re-run over the
+    batch stations' merged rows (plus the previous month's last QC_FLATLINE_HOURS for context),
+    so flatlines that span batches and repeat fetches that disagree with the archive are
+    flagged; other stations in the partition keep their stored flags.
+    """
+    if df.empty:
+        return 0
+    df = df.astype({"stid": "string"})
+    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True)
+    times = df["timestamp"].dt
+    written = 0
+    for (year, month), part in df.groupby([times.year, times.month], sort=True):
+        written += len(part)
+        outfile = partition_path(archive_dir, year, month)
+        with file_lock(outfile):
+            stids = part["stid"].unique()
+            frames = [part.assign(context=False)]
+            others = sticky = None
+            if os.path.exists(outfile):
+                existing = pq.read_table(outfile, schema=OBS_SCHEMA).to_pandas()
+                # only the batch's stations are re-checked; the rest keep their stored flags
+                mine = existing["stid"].isin(stids).to_numpy()
+                others, existing = existing[~mine], existing[mine]
+                # a conflict flagged by an earlier write stays flagged once the losing row is gone
+                sticky = existing.loc[(existing["qc_flags"] & QC_DUPLICATE) > 0, OBS_KEYS]
+                frames.insert(0, existing.assign(context=False))
+            tail = previous_tail(archive_dir, year, month, stids)
+            if tail is not None:
+                frames.insert(0, tail.assign(context=True))
+            # QC before dropping repeats, so a re-fetch that disagrees with the archive is flagged
+            part = run_qc(pd.concat(frames, ignore_index=True))
+            part = part[~part["context"].to_numpy(dtype=bool)]
+            # keep the most recent fetch for any repeated key
+            part = part.drop_duplicates(subset=OBS_KEYS, keep="last")
+            if sticky is not None and len(sticky):
+                was_dup = pd.MultiIndex.from_frame(part[OBS_KEYS]).isin(pd.MultiIndex.from_frame(sticky))
+                part.loc[was_dup, "qc_flags"] |= QC_DUPLICATE
+            if others is not None:
+                part = pd.concat([others, part[OBS_SCHEMA.names]], ignore_index=True)
+            part = part.sort_values(OBS_KEYS)
+            table = pa.Table.from_pandas(part[OBS_SCHEMA.names], schema=OBS_SCHEMA, preserve_index=False)
+            # write next to the target and swap in so readers never see a partial file
+            tmpfile = f"{outfile}.tmp"
+            pq.write_table(table, tmpfile, compression="zstd", row_group_size=config.PARQUET_ROW_GROUP_ROWS)
+            os.replace(tmpfile, outfile)
+    return written
+
+
+def report_qc(batch, counts):
+    """Add the QC flag counts for a list of station frames to the running totals."""
+    for df in batch:
+        for name, n in summarize_qc(df).items():
+            counts[name] = counts.get(name, 0) + n
+    return counts
+
+
+def read_obs_archive(archive_dir, filters=None, columns=None):
+    """
+    Read the obs archive, pushing any pyarrow filters down to the partition scan.
+    Pass obs_qc.qc_filter() (or [("qc_flags", "=", 0)]) to drop rows that failed QC.
+    """
+    table = pq.read_table(archive_dir, columns=columns, filters=filters, partitioning="hive")
+    return table.to_pandas()
 
-    # Check if the request was successful
-    if response.status_code == 200:
-        data = response.json()
-    return data
 
 def fetch_wind_obs(base_url, stid, token, vars, start, end, outputdir):
     print(f"Fetching data for station: {stid}...")
@@ -51,60 +174,29 @@ def fetch_wind_obs(base_url, stid, token, vars, start, end, outputdir):
     }
     
     # Make the API request
-    response = requests.get(base_url, params=params)
-
-    if response.status_code == 200:
-        data = response.json()
-
-        if "STATION" in data and len(data["STATION"]) > 0:
-            station_data = data["STATION"][0]
-
-            # Extract timestamps, wind speed, and wind direction
-            timestamps = station_data["OBSERVATIONS"]["date_time"]
-            wind_directions = station_data["OBSERVATIONS"].get("wind_direction_set_1", [None]*len(timestamps))
-            wind_speeds = station_data["OBSERVATIONS"].get("wind_speed_set_1", [None]*len(timestamps))
-            wind_gusts = station_data["OBSERVATIONS"].get("wind_gust_set_1", [None]*len(timestamps))
-
-            # Create a DataFrame for the station
-            df_station = pd.DataFrame({
-                "timestamp": timestamps,
-                "wind_direction": wind_directions,
-                "wind_speed": wind_speeds,
-                "wind_gust": wind_gusts
-            })
-            # converting timestamps
-            df_station["timestamp"] = pd.to_datetime(df_station["timestamp"])
-            # save dataframe
-            outfile = f"{stid}_WindObs.csv"
-            #Check to see if we already have a file and if so, append the data
-            if not os.path.exists(os.path.join(outputdir, outfile)):
-                # we don't have a file so create and save dataframe
-                df_station.to_csv(os.path.join(outputdir, outfile), index=False)
-            else:
-                #open existing file and append
-                archive = pd.read_csv(os.path.join(outputdir, outfile))
-                update = pd.concat([archive, df_station])
-                # dropping duplicate times
-                final_update = update.drop_duplicates(subset=["timestamp"])
-                #saving our updated file
-                final_update.to_csv(os.path.join(outputdir, outfile), index=False)
-
-            print(f"Successfully saved {outfile} to {outputdir}!")
+    response = fetch_with_retries(base_url, params)
+
+    if response is not None:
+        df_station = obs_frame_from_json(response.json(), stid)
+        if not df_station.empty:
+            df_station = run_qc(df_station)
+            rows = write_obs_batch(df_station, outputdir)
+            print(f"Successfully merged {rows} rows for {stid} into {outputdir}!")
         else:
             print(f"Failed to fetch data for station {stid} (Status Code: {response.status_code})")
 
         time.sleep(1)
 
 
-def fetch_wind_obs_multiprocess(stid):
+def fetch_wind_obs_multiprocess(stid, start=None, end=None, base_url=None):
     print(f"Fetching data for station: {stid}...")
     global config
     token = config.API_KEY
     windvars = config.WIND_VARS
-    start = config.OBS_START
-    end = config.OBS_END
-    base_url = config.TIMESERIES_URL
-    outputdir = config.OBS
+    start = start or config.OBS_START
+    end = end or config.OBS_END
+    # passed in by main so spawned and cluster workers see a --base-url override
+    base_url = base_url or config.TIMESERIES_URL
     # API request parameters
     params = {
         "token": token,
@@ -117,135 +209,168 @@ def fetch_wind_obs_multiprocess(stid):
         "output": "json",
     }
     
-    response = fetch_with_retries(base_url, params)
-    if response is None:
-        print(f"❌ Failed to fetch data for station {stid} after retries.")
-        return  # Exit early
-
-    if response.status_code == 200:
-        data = response.json()
-
-        if "STATION" in data and len(data["STATION"]) > 0:
-            station_data = data["STATION"][0]
-
-            # Extract timestamps, wind speed, and wind direction
-            timestamps = station_data["OBSERVATIONS"]["date_time"]
-            wind_directions = station_data["OBSERVATIONS"].get("wind_direction_set_1", [None]*len(timestamps))
-            wind_speeds = station_data["OBSERVATIONS"].get("wind_speed_set_1", [None]*len(timestamps))
-            wind_gusts = station_data["OBSERVATIONS"].get("wind_gust_set_1", [None]*len(timestamps))
-
-            # Create a DataFrame for the station
-            df_station = pd.DataFrame({
-                "timestamp": timestamps,
-                "wind_direction": wind_directions,
-                "wind_speed": wind_speeds,
-                "wind_gust": wind_gusts
-            })
-            # converting timestamps
-            df_station["timestamp"] = pd.to_datetime(df_station["timestamp"])
-            # save dataframe
-            outfile = f"{stid}_WindObs.csv"
-            #Check to see if we already have a file and if so, append the data
-            if not os.path.exists(os.path.join(outputdir, outfile)):
-                # we don't have a file so create and save dataframe
-                df_station.to_csv(os.path.join(outputdir, outfile), index=False)
-            else:
-                #open existing file and append
-                archive = pd.read_csv(os.path.join(outputdir, outfile))
-                update = pd.concat([archive, df_station])
-                # dropping duplicate times
-                final_update = update.drop_duplicates(subset=["timestamp"])
-                #saving our updated file
-                final_update.to_csv(os.path.join(outputdir, outfile), index=False)
-
-            print(f"Successfully saved {outfile} to {outputdir}!")
-        else:
+    # counts raised after the last span (empty responses, rows fetched) are flushed when the task
+    # returns, so a pool worker's last station isn't lost with its process
+    try:
+        with span("fetch", stid=stid):
+            response = fetch_with_retries(base_url, params)
+        if response is None:
+            print(f"❌ Failed to fetch data for station {stid} after retries.")
+            return None  # Exit early
+        count("bytes_fetched", len(response.content))
+
+        with span("decode", stid=stid):
+            df_station = obs_frame_from_json(response.json(), stid)
+        if df_station.empty:
+            fail("empty")
             print(f"Failed to fetch data for station {stid} (Status Code: {response.status_code})")
+            return None
+        count("rows_fetched", len(df_station))
+        # QC runs in the worker so the checks are spread across processes
+        with span("qc", stid=stid):
+            return run_qc(df_station)
+    finally:
+        flush_counters()
 
         
+# one keep-alive session per process so repeated station requests reuse connections
+_session = None
+
+
+def get_session():
+    global _session
+    if _session is None:
+        _session = requests.Session()
+    return _session
+
+
+def retry_after(response):
+    """Seconds requested by a Retry-After header (delta-seconds or HTTP date), or None."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+
 def fetch_with_retries(url, params):
+    """
+    GET a Synoptic endpoint and return the response once it holds valid JSON. 429s wait for
+    Retry-After when given; 5xx, timeouts and truncated bodies back off exponentially with
+    jitter; other 4xx are not retried.
+    """
     global config
     for attempt in range(1, config.MAX_RETRIES + 1):
+        wait_time = None
         try:
-            response = requests.get(url, params=params, timeout=10)
+            response = get_session().get(url, params=params, timeout=config.REQUEST_TIMEOUT)
             if response.status_code == 200:
+                response.json()
                 return response
+            elif response.status_code == 429:
+                wait_time = retry_after(response)
+                reason = "http_429"
+                print(f"⚠️ Attempt {attempt}: rate limited (429)")
+            elif 400 <= response.status_code < 500:
+                fail(f"http_{response.status_code}")
+                print(f"❌ Received status {response.status_code}; not retrying.")
+                return None
             else:
+                reason = "http_5xx"
                 print(f"⚠️ Attempt {attempt}: Received status {response.status_code}")
+        except requests.Timeout as e:
+            reason = "timeout"
+            print(f"⚠️ Attempt {attempt}: Request timed out: {e}")
         except requests.RequestException as e:
+            reason = "connection"
             print(f"⚠️ Attempt {attempt}: Request error: {e}")
+        except ValueError:
+            reason = "bad_json"
+            print(f"⚠️ Attempt {attempt}: Response was not valid JSON")
+        count("request_errors", reason=reason)
 
-        wait_time = config.INITIAL_WAIT * attempt
-        print(f"⏳ Waiting {wait_time} seconds before retry...")
+        if attempt == config.MAX_RETRIES:
+            break
+        if wait_time is None:
+            wait_time = random.uniform(0, min(config.RETRY_MAX_WAIT, config.INITIAL_WAIT * 2 ** (attempt - 1)))
+        print(f"⏳ Waiting {wait_time:.1f} seconds before retry...")
+        count("retries", reason=reason)
+        count("retry_wait_s", wait_time)
         time.sleep(wait_time)
 
+    fail("max_retries")
     print("❌ Max retries exceeded.")
     return None
 
 
-def parse_metadata(data):
-    stn_dict = {"stid": [], "name": [], "latitude": [], "longitude": [], "elevation": []}
-    for stn in data["STATION"]:
-        stn_dict['stid'].append(stn['STID'])
-        stn_dict['name'].append(stn['NAME'])
-        stn_dict['latitude'].append(stn['LATITUDE'])
-        stn_dict['longitude'].append(stn['LONGITUDE'])
-        stn_dict['elevation'].append(stn['ELEVATION'])
-    meta_df = pd.DataFrame(stn_dict)
-    return meta_df
+def use_synoptic_base_url(base_url):
+    """Send timeseries/metadata requests to base_url (e.g. a mock server), here and in spawned workers."""
+    os.environ["SYNOPTIC_BASE_URL"] = base_url
+    config.SYNOPTIC_BASE_URL = base_url
+    config.TIMESERIES_URL = f"{base_url}/stations/timeseries"
+    config.METADATA_URL = f"{base_url}/stations/metadata"
 
-def melt_forecast_csv(file_path, stid):
-    df = pd.read_csv(file_path, parse_dates=["timestamp"])
-    long_df = pd.melt(df, id_vars="timestamp", var_name="column", value_name="value")
 
-    # Extract step and variable name from column
-    long_df["variable"] = long_df["column"].str.extract(r"(speed|direction|gust)", expand=False).str.lower()
-    long_df["stid"] = stid
-    long_df = long_df[["stid", "timestamp", "variable", "value"]]
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the obs archive from Synoptic (or MADIS).")
+    parser.add_argument("--base-url", help="Synoptic API base URL override, e.g. http://127.0.0.1:8080/v2")
+    parser.add_argument("--executor", default=config.EXECUTOR, choices=BACKENDS, help="where station fetches run")
+    parser.add_argument("--address", default=config.DASK_SCHEDULER, help='dask scheduler address or "local"')
+    args = parser.parse_args(argv)
+    if args.base_url:
+        use_synoptic_base_url(args.base_url.rstrip("/"))
+    
+    with run("obs_archive"):
+        # grabbing wind archive at our synoptic metadata sites
+        # Load station list from the cached station catalog
+        df_sites = load_station_catalog()
+        station_ids = df_sites["stid"].dropna().tolist()
+    
+        ensure_dir(config.OBS_ARCHIVE_DIR)
+        if config.OBS_SOURCE == "madis":
+            # bulk hourly files cover every station at once, so skip the per-station API calls
+            from madis_obs import ingest_madis
+            total_rows = ingest_madis(config.MADIS_DIR, config.OBS_START, config.OBS_END, station_ids, config.OBS_ARCHIVE_DIR)
+            print(f"✅ Merged {total_rows} MADIS obs rows into {config.OBS_ARCHIVE_DIR}.")
+        else:
+            # Workers fetch, parse and QC; the parent merges batches into the archive so
+            # there is a single writer per partition.
+            batch = []
+            total_rows = 0
+            qc_counts = {}
+            fetch = partial(fetch_wind_obs_multiprocess, base_url=config.TIMESERIES_URL)
+            with Executor(args.executor, address=args.address) as executor:
+                for stid, df_station in zip(station_ids, executor.map(fetch, station_ids)):
+                    print(f'Fetched obs for {stid}')
+                    if df_station is not None:
+                        batch.append(df_station)
+                    if len(batch) >= config.OBS_BATCH_SIZE:
+                        qc_counts = report_qc(batch, qc_counts)
+                        with span("write", stations=len(batch)):
+                            total_rows += write_obs_batch(pd.concat(batch, ignore_index=True), config.OBS_ARCHIVE_DIR)
+                        batch = []
+            if batch:
+                qc_counts = report_qc(batch, qc_counts)
+                with span("write", stations=len(batch)):
+                    total_rows += write_obs_batch(pd.concat(batch, ignore_index=True), config.OBS_ARCHIVE_DIR)
+            count("rows_written", total_rows)
+            print("Data collection complete!")
+            print(f"🧪 QC flag counts: {qc_counts}")
+            for flag, n in qc_counts.items():
+                count("qc_flags", n, flag=flag)
+            print(f"✅ Merged {total_rows} obs rows into the archive. Check {config.OBS_ARCHIVE_DIR} for data.")
+
+        # refresh the valid-time rollup for the months we just touched
+        with span("rollup"):
+            update_obs_rollup(config.OBS_ARCHIVE_DIR, config.OBS_ROLLUP_DIR,
+                              pd.to_datetime(config.OBS_START, format="%Y%m%d%H%M"), pd.to_datetime(config.OBS_END, format="%Y%m%d%H%M"))
+        print(f"✅ Obs rollup updated in {config.OBS_ROLLUP_DIR}.")
 
-    return long_df
-        
-def build_parquet_archive(input_dir, output_file):
-    all_files = glob(os.path.join(input_dir, "*_WindObs.csv"))
-    df_all = pd.concat(
-        [melt_forecast_csv(f, os.path.basename(f).split("_")[0].upper()) for f in all_files],
-        ignore_index=True
-    )
-    df_all.to_parquet(output_file, index=False)
-    print(f"✅ Saved combined obs archive to {output_file}")
-
-def remove_files(dir, wild_card):
-    all_files = glob(os.path.join(dir, wild_card))
-    for f in all_files:
-        os.remove(os.path.join(dir, f))
-        print(f'Done removing {f} from {dir}')
 
 if __name__ == "__main__":
-    if not os.path.exists(os.path.join(config.OBS, config.METADATA)):
-        print(f"Couldn't find {config.METADATA} in {config.OBS}...will need to create the file")
-        ensure_dir(config.OBS)
-        # getting our metadata if we don't have it
-        print(f'Creating metadata file from {config.METADATA_URL}')
-        meta_json = create_wind_metadata(config.METADATA_URL, config.API_KEY, config.STATE, config.NETWORK, config.WIND_VARS, config.OBS_START)
-        meta_df = parse_metadata(meta_json)
-        meta_df.to_csv(os.path.join(config.OBS, config.METADATA), index=False)
-        print(f"All done creating metadata.  Saved {config.METADATA} in {config.OBS}.")
-    
-    # grabbing wind archive at our synoptic metadata sites
-    # Load station list from CSV
-    df_sites = pd.read_csv(os.path.join(config.OBS, config.METADATA))  
-    station_ids = df_sites["stid"].dropna().tolist()
-    
-    with concurrent.futures.ProcessPoolExecutor() as executor:
-        for number, stid in zip(station_ids, executor.map(fetch_wind_obs_multiprocess, station_ids)):
-            print(f'Fetching obs for {number}')
-    print("Data collection complete!")
-    # Now concatenating and creating our parquet file for DuckDB
-    # Now creating our database file
-    output_parquet = os.path.join(config.OBS, f"alaska_{config.ELEMENT.lower()}_obs.parquet")
-    print(f"Building archive {output_parquet}")
-    build_parquet_archive(config.OBS, output_parquet)
-    print(f"Archive complete! Check {output_parquet} for data.")
-    # removing temporary .csv files
-    remove_files(config.OBS, f"*{config.ELEMENT}Obs.csv")
-    
\ No newline at end of file
+    main()
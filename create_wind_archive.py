@@ -5,6 +5,7 @@ import pandas as pd
 from glob import glob
 import concurrent.futures
 import wind_config as config
+from station_catalog import load_station_catalog
 
 
 def ensure_dir(directory):
@@ -16,26 +17,6 @@ def ensure_dir(directory):
         print(f"{directory} already exists...skipping creation step.")
 
 
-def create_wind_metadata(url, token, state, networks, vars, obrange):
-    # setting up synoptic params
-    # Parameters for the API request
-    params = {
-        "token": token,
-        "vars": vars,  # Variables to retrieve
-        "obrange": obrange,
-        "network": networks,
-        "state": state,
-        "output": "json"           # Output format
-    }
-
-    # Make the API request
-    response = requests.get(url, params=params)
-
-    # Check if the request was successful
-    if response.status_code == 200:
-        data = response.json()
-    return data
-
 def fetch_wind_obs(base_url, stid, token, vars, start, end, outputdir):
     print(f"Fetching data for station: {stid}...")
     # API request parameters
@@ -163,17 +144,6 @@ def fetch_wind_obs_multiprocess(stid):
         time.sleep(1)
 
 
-def parse_metadata(data):
-    stn_dict = {"stid": [], "name": [], "latitude": [], "longitude": [], "elevation": []}
-    for stn in data["STATION"]:
-        stn_dict['stid'].append(stn['STID'])
-        stn_dict['name'].append(stn['NAME'])
-        stn_dict['latitude'].append(stn['LATITUDE'])
-        stn_dict['longitude'].append(stn['LONGITUDE'])
-        stn_dict['elevation'].append(stn['ELEVATION'])
-    meta_df = pd.DataFrame(stn_dict)
-    return meta_df
-
 def melt_forecast_csv(file_path, stid):
     df = pd.read_csv(file_path, parse_dates=["timestamp"])
     long_df = pd.melt(df, id_vars="timestamp", var_name="column", value_name="value")
@@ -195,19 +165,10 @@ def build_parquet_archive(input_dir, output_file):
     print(f"✅ Saved combined forecast archive to {output_file}")
 
 if __name__ == "__main__":
-    if not os.path.exists(os.path.join(config.OBS, config.METADATA)):
-        print(f"Couldn't find {config.METADATA} in {config.OBS}...will need to create the file")
-        ensure_dir(config.OBS)
-        # getting our metadata if we don't have it
-        print(f'Creating metadata file from {config.METADATA_URL}')
-        meta_json = create_wind_metadata(config.METADATA_URL, config.API_KEY, config.STATE, config.NETWORK, config.WIND_VARS, config.OBS_START)
-        meta_df = parse_metadata(meta_json)
-        meta_df.to_csv(os.path.join(config.OBS, config.METADATA), index=False)
-        print(f"All done creating metadata.  Saved {config.METADATA} in {config.OBS}.")
     
     # grabbing wind archive at our synoptic metadata sites
-    # Load station list from CSV
-    df_sites = pd.read_csv(os.path.join(config.OBS, config.METADATA))  
+    # Load station list from the cached station catalog
+    df_sites = load_station_catalog()
     station_ids = df_sites["stid"].dropna().tolist()
     
     with concurrent.futures.ProcessPoolExecutor() as executor:
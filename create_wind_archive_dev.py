@@ -5,6 +5,7 @@ import pandas as pd
 import aiohttp
 import asyncio
 import wind_config as config
+from station_catalog import load_station_catalog
 
 def ensure_dir(directory):
     """Ensure a directory exists. If not, create it."""
@@ -15,26 +16,6 @@ def ensure_dir(directory):
         print(f"{directory} already exists...skipping creation step.")
 
 
-def create_wind_metadata(url, token, state, networks, vars, obrange):
-    # setting up synoptic params
-    # Parameters for the API request
-    params = {
-        "token": token,
-        "vars": vars,  # Variables to retrieve
-        "obrange": obrange,
-        "network": networks,
-        "state": state,
-        "output": "json"           # Output format
-    }
-
-    # Make the API request
-    response = requests.get(url, params=params)
-
-    # Check if the request was successful
-    if response.status_code == 200:
-        data = response.json()
-    return data
-
 def fetch_wind_obs(base_url, stid, token, vars, start, end, outputdir):
     print(f"Fetching data for station: {stid}...")
     # API request parameters
@@ -95,17 +76,6 @@ def fetch_wind_obs(base_url, stid, token, vars, start, end, outputdir):
         # Respect API rate limits
         time.sleep(1)
 
-def parse_metadata(data):
-    stn_dict = {"stid": [], "name": [], "latitude": [], "longitude": [], "elevation": []}
-    for stn in data["STATION"]:
-        stn_dict['stid'].append(stn['STID'])
-        stn_dict['name'].append(stn['NAME'])
-        stn_dict['latitude'].append(stn['LATITUDE'])
-        stn_dict['longitude'].append(stn['LONGITUDE'])
-        stn_dict['elevation'].append(stn['ELEVATION'])
-    meta_df = pd.DataFrame(stn_dict)
-    return meta_df
-
 async def fetch_wind_obs(session, base_url, stid, token, vars, start, end, outputdir):
     """Fetch wind observations asynchronously and save to CSV."""
     print(f"Fetching data for station: {stid}...")
@@ -173,7 +143,7 @@ async def main():
     start_time = time.time()
 
     # Read station IDs from metadata file
-    df_sites = pd.read_csv(os.path.join(config.OBS, config.METADATA))
+    df_sites = load_station_catalog()
     station_ids = df_sites["stid"].dropna().tolist()
 
     async with aiohttp.ClientSession() as session:
@@ -188,23 +158,13 @@ async def main():
     print(f"Data collection complete in {time.time() - start_time:.2f} seconds!")
 
 if __name__ == "__main__":
-    if not os.path.exists(os.path.join(config.OBS, config.METADATA)):
-        print(f"Couldn't find {config.METADATA} in {config.OBS}...will need to create the file")
-        ensure_dir(config.OBS)
-        # getting our metadata if we don't have it
-        print(f'Creating metadata file from {config.METADATA_URL}')
-        meta_json = create_wind_metadata(config.METADATA_URL, config.API_KEY, config.STATE, config.NETWORK, config.WIND_VARS, config.OBS_START)
-        meta_df = parse_metadata(meta_json)
-        meta_df.to_csv(os.path.join(config.OBS, config.METADATA), index=False)
-        print(f"All done creating metadata.  Saved {config.METADATA} in {config.OBS}.")
-        
     # grabbing data at our synoptic metadata sites
     asyncio.run(main())
 
 
     # # grabbing wind archive at our synoptic metadata sites
-    # # Load station list from CSV
-    # df_sites = pd.read_csv(os.path.join(config.OBS, config.METADATA))  
+    # # Load station list from the cached station catalog
+    # df_sites = load_station_catalog()
     # station_ids = df_sites["stid"].dropna().tolist()
     
     # # fetching obs
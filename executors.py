@@ -0,0 +1,209 @@
+import os
+import time
+import zlib
+import socket
+import argparse
+import threading
+import contextlib
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+import wind_config as config
+from pipeline_metrics import ENV_FILE, ENV_RUN, ENV_JOB
+
+"""
+Pluggable task execution for the archive pipelines. Executor(backend) runs tasks on a local
+thread or process pool, or on a dask.distributed cluster, behind one submit/map/as_completed
+interface. On a cluster a task submitted with an affinity key (a backfill month, a model lead,
+a GRIB file) goes to the worker chosen by rendezvous hashing of that key, so reruns land where
+the GRIB downloads, Herbie KD-trees and station index caches already are; adding workers moves
+only the keys the new workers win. Cluster tasks should write their output to shared storage
+(s3://) and return a small result, as the NDFD backfill chunks do.
+
+    with Executor("dask", address="tcp://scheduler:8786") as ex:
+        futures = [ex.submit(process_chunk, month, ..., affinity=month) for month in months]
+        for future in ex.as_completed(futures):
+            ...
+
+    dask scheduler                                   # on the head node
+    dask worker tcp://scheduler:8786 --nthreads 2    # on each node; --nthreads = chunks per node
+    python executors.py --backend dask --address local --tasks 32
+"""
+
+BACKENDS = ("thread", "process", "dask")
+
+# worker list refresh interval for affinity routing, so new nodes are picked up mid-run
+WORKER_REFRESH_S = 10
+
+
+def rendezvous(key, workers):
+    """The worker with the highest hash for key; stable while that worker stays in the cluster."""
+    return max(workers, key=lambda w: zlib.crc32(f"{key}|{w}".encode()))
+
+
+# tasks of one run share a worker's metrics environment; it is set by the first and restored by the last
+_env_lock = threading.Lock()
+_env_state = {"tasks": 0, "saved": {}}
+
+
+@contextlib.contextmanager
+def _run_env(env):
+    with _env_lock:
+        if _env_state["tasks"] == 0:
+            _env_state["saved"] = {k: os.environ.get(k) for k in env}
+            os.environ.update(env)
+        _env_state["tasks"] += 1
+    try:
+        yield
+    finally:
+        with _env_lock:
+            _env_state["tasks"] -= 1
+            if _env_state["tasks"] == 0:
+                for k, v in _env_state["saved"].items():
+                    if v is None:
+                        os.environ.pop(k, None)
+                    else:
+                        os.environ[k] = v
+
+
+def _with_env(env, remote, fn, args, kwargs):
+    # cluster workers don't inherit the driver's environment; carry the metrics run over.
+    # The driver's metrics path only exists on its own host, so remote workers write a
+    # per-host file under their own METRICS_DIR instead.
+    if remote and ENV_FILE in env:
+        os.makedirs(config.METRICS_DIR, exist_ok=True)
+        name = f"{env.get(ENV_JOB, 'run')}_{env.get(ENV_RUN, 'adhoc')}_{socket.gethostname()}.jsonl"
+        env = {**env, ENV_FILE: os.path.join(config.METRICS_DIR, name)}
+    with _run_env(env):
+        return fn(*args, **kwargs)
+
+
+class Executor:
+    """
+    Thread, process or dask task runner. submit() returns a future with .result();
+    affinity is honoured on dask and ignored by the local pools, which share one disk.
+    """
+
+    def __init__(self, backend=None, max_workers=None, address=None):
+        self.backend = backend or config.EXECUTOR
+        if self.backend not in BACKENDS:
+            raise ValueError(f"Unknown executor backend {self.backend!r}; expected one of {BACKENDS}")
+        self.max_workers = max_workers
+        self.address = address or config.DASK_SCHEDULER
+        self._pool = self._client = self._cluster = None
+        self._workers, self._workers_at = [], 0.0
+
+    def __enter__(self):
+        if self.backend == "thread":
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        elif self.backend == "process":
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        else:
+            try:
+                from dask.distributed import Client, LocalCluster
+            except ImportError as e:
+                raise RuntimeError("backend='dask' needs dask.distributed (pip install 'dask[distributed]')") from e
+            if self.address == "local":
+                self._cluster = LocalCluster(n_workers=self.max_workers or config.DASK_LOCAL_WORKERS, threads_per_worker=1,
+                                             processes=True, dashboard_address=None)
+                self._client = Client(self._cluster)
+            else:
+                self._client = Client(self.address)
+            print(f"🗂️ dask: {len(self.workers())} workers, {self.slots} slots at {self._client.scheduler.address}")
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+        if self._client is not None:
+            self._client.close()
+        if self._cluster is not None:
+            self._cluster.close()
+        self._pool = self._client = self._cluster = None
+
+    @property
+    def remote(self):
+        """True when tasks may run on another host, so local paths are not shared with the driver."""
+        return self.backend == "dask" and self._cluster is None
+
+    @property
+    def slots(self):
+        """Tasks that can run at once."""
+        if self.backend == "dask":
+            return sum(w["nthreads"] for w in self._client.scheduler_info()["workers"].values()) or 1
+        return self._pool._max_workers
+
+    def workers(self):
+        """Current dask worker addresses, refreshed every WORKER_REFRESH_S."""
+        if time.monotonic() - self._workers_at > WORKER_REFRESH_S:
+            self._workers = sorted(self._client.scheduler_info()["workers"])
+            self._workers_at = time.monotonic()
+        return self._workers
+
+    def submit(self, fn, *args, affinity=None, **kwargs):
+        if self.backend != "dask":
+            return self._pool.submit(fn, *args, **kwargs)
+        env = {k: os.environ[k] for k in (ENV_FILE, ENV_RUN, ENV_JOB) if k in os.environ}
+        workers = self.workers()
+        target = [rendezvous(affinity, workers)] if affinity is not None and workers else None
+        # a preference, not a pin: the scheduler may still move the task if that worker is gone or busy
+        return self._client.submit(_with_env, env, self.remote, fn, args, kwargs, workers=target,
+                                   allow_other_workers=target is not None, pure=False,
+                                   key=f"{getattr(fn, '__name__', 'task')}-{os.urandom(4).hex()}")
+
+    def as_completed(self, futures):
+        if self.backend != "dask":
+            return as_completed(futures)
+        from dask.distributed import as_completed as dask_as_completed
+        return dask_as_completed(futures)
+
+    def map(self, fn, items, affinity=None):
+        """Results of fn(item) in item order; affinity(item) gives each task's key."""
+        futures = deque(self.submit(fn, item, affinity=affinity(item) if affinity else None) for item in items)
+        while futures:
+            # drop each future once read so the cluster can release its result
+            yield futures.popleft().result()
+
+
+def where(key):
+    """Host, pid and (on dask) worker address a task ran on."""
+    try:
+        from dask.distributed import get_worker
+        worker = get_worker().address
+    except (ImportError, ValueError):
+        worker = None
+    return key, f"{socket.gethostname()}:{os.getpid()}", worker
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check an execution backend and where its tasks are routed.")
+    parser.add_argument("--backend", default=config.EXECUTOR, choices=BACKENDS)
+    parser.add_argument("--address", default=config.DASK_SCHEDULER, help='dask scheduler address or "local"')
+    parser.add_argument("--workers", type=int, help="pool size or LocalCluster workers")
+    parser.add_argument("--tasks", type=int, default=16, help="affinity keys to route, twice each")
+    args = parser.parse_args(argv)
+
+    with Executor(args.backend, args.workers, args.address) as ex:
+        t0 = time.perf_counter()
+        keys = [f"key{i}" for i in range(args.tasks)] * 2
+        ran = defaultdict(set)
+        for key, proc, worker in ex.map(where, keys, affinity=lambda key: key):
+            ran[key].add(worker or proc)
+        spread = Counter(next(iter(places)) for places in ran.values())
+        moved = sum(len(places) > 1 for places in ran.values())
+        print(f"⏱️ {len(keys)} tasks in {time.perf_counter() - t0:.2f}s on {ex.slots} slots")
+        for place, n in sorted(spread.items()):
+            print(f"   {place}: {n} keys")
+        if ex.backend == "dask":
+            print(f"{'⚠️' if moved else '✅'} {moved}/{args.tasks} keys ran on more than one worker")
+        else:
+            print("📋 local pools share one disk, so affinity is not applied")
+
+
+if __name__ == "__main__":
+    # run from the importable module so dask pickles the task wrappers by reference, not by value
+    from executors import main
+    main()
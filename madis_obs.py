@@ -0,0 +1,82 @@
+import io
+import fsspec
+import numpy as np
+import pandas as pd
+import xarray as xr
+from concurrent.futures import ThreadPoolExecutor
+import wind_config as config
+from create_obs_archive import OBS_SCHEMA, write_obs_batch
+from obs_qc import run_qc
+
+"""
+Bulk obs source built on hourly MADIS NetCDF files. Each file holds every reporting
+station for one hour, so a network-wide backfill reads one file per hour instead of
+making one API call per station. Rows are filtered to the station catalog and written
+into the same archive schema as the Synoptic path.
+"""
+
+
+def madis_file_urls(madis_dir, start, end, suffix=config.MADIS_SUFFIX):
+    """Build the hourly file names covering start..end without listing the directory."""
+    start = pd.to_datetime(start, format="%Y%m%d%H%M").floor("h")
+    end = pd.to_datetime(end, format="%Y%m%d%H%M")
+    hours = pd.date_range(start, end, freq="h")
+    return [f"{madis_dir.rstrip('/')}/{t:%Y%m%d_%H%M}{suffix}" for t in hours]
+
+
+def decode_station_ids(ids):
+    # char arrays come back either as fixed-width byte strings or as (n, len) S1 arrays
+    if ids.ndim == 2:
+        ids = ids.view(f"S{ids.shape[1]}").ravel()
+    if ids.dtype.kind == "S":
+        ids = np.char.decode(ids, "ascii", errors="ignore")
+    return np.char.upper(np.char.strip(ids.astype(str)))
+
+
+def read_madis_file(url, station_ids, storage_options=None):
+    """Read one MADIS file and return the rows for stations in station_ids."""
+    names = config.MADIS_VARS
+    storage_options = storage_options if storage_options is not None else config.MADIS_STORAGE_OPTIONS
+    try:
+        with fsspec.open(url, "rb", compression="infer", **storage_options) as f:
+            raw = f.read()
+    except FileNotFoundError:
+        print(f"⚠️ Missing MADIS file {url} — skipping.")
+        return None
+
+    with xr.open_dataset(io.BytesIO(raw), mask_and_scale=True) as ds:
+        ids = decode_station_ids(ds[names["stid"]].values)
+        # vectorized catalog match instead of per-station lookups
+        mask = np.isin(ids, np.asarray(station_ids, dtype=str))
+        if not mask.any():
+            return None
+        frame = {"stid": ids[mask], "timestamp": pd.to_datetime(ds[names["timestamp"]].values[mask], utc=True)}
+        for column in ["wind_direction", "wind_speed", "wind_gust"]:
+            var = names[column]
+            if var in ds:
+                frame[column] = ds[var].values[mask].astype("float64")
+            else:
+                frame[column] = np.full(mask.sum(), np.nan)
+
+    df = pd.DataFrame(frame)
+    to_knots = config.KNOTS_PER_UNIT[config.MADIS_SPEED_UNITS]
+    df["wind_speed"] = (df["wind_speed"] * to_knots).round(2)
+    df["wind_gust"] = (df["wind_gust"] * to_knots).round(2)
+    return df[[c for c in OBS_SCHEMA.names if c != "qc_flags"]]
+
+
+def ingest_madis(madis_dir, start, end, station_ids, archive_dir, workers=config.MADIS_WORKERS):
+    """Read hourly MADIS files for start..end and merge them into the obs archive."""
+    station_ids = [str(s).upper() for s in station_ids]
+    urls = madis_file_urls(madis_dir, start, end)
+    print(f"📂 Reading {len(urls)} MADIS files from {madis_dir}")
+    total_rows = 0
+    step = config.MADIS_FILES_PER_BATCH
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for i in range(0, len(urls), step):
+            chunk = urls[i:i + step]
+            frames = [df for df in executor.map(lambda u: read_madis_file(u, station_ids), chunk) if df is not None]
+            if frames:
+                total_rows += write_obs_batch(run_qc(pd.concat(frames, ignore_index=True)), archive_dir)
+            print(f"✅ Completed {min(i + step, len(urls))}/{len(urls)} MADIS files.")
+    return total_rows
@@ -0,0 +1,274 @@
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+import wind_config as config
+
+"""
+Deterministic offline fixtures at production shape and volume:
+
+  ndfd/wmo/{wspd,wdir}/YYYY/MM/DD/YCRZ9x_KWBN_YYYYmmddHHMM   NDFD AK GRIB2 (10 m speed / direction)
+  nbm/blend.YYYYmmdd/HH/core/blend.tHHz.core.fFFF.ak.grib2 (+ .idx)   NBM-like WIND/WDIR/GUST
+  synoptic/{stid}_{year}.json, synoptic_csv/{stid}_{year}.csv  Synoptic timeseries payloads
+  synoptic_metadata.json                                    Synoptic metadata for the catalog
+
+Grids use the NDFD Alaska polar-stereographic definition (config.AK_GRID); --coarsen k keeps
+the same domain with k-times larger cells for laptop runs. Fields are smooth synthetic wind
+patterns that drift with issuance and step, so station series and forecast errors look
+plausible. Everything is seeded, so the same arguments produce byte-identical files.
+
+    python make_fixtures.py --days 3 --stations 300 --years 1
+"""
+
+# NDFD step layout per product: days 1-3 (YCRZ98/YBRZ98) and days 4-7 (YCRZ97/YBRZ97)
+NDFD_STEPS = {
+    "98": list(range(1, 37)) + list(range(39, 73, 3)),
+    "97": list(range(78, 169, 6)),
+}
+NDFD_PRODUCTS = {"wspd": (config.NDFD_SPEED_STRING[:4], 1), "wdir": (config.NDFD_DIR_STRING[:4], 0)}
+
+NBM_STEPS = list(range(1, 37)) + list(range(39, 193, 3))
+# name -> (parameterNumber, idx level text)
+NBM_FIELDS = {"WIND": 1, "WDIR": 0, "GUST": 22}
+
+KT_PER_MS = config.KNOTS_PER_UNIT["m/s"]
+
+
+def grid_definition(coarsen=1):
+    grid = dict(config.AK_GRID)
+    grid["Nx"] = (grid["Nx"] - 1) // coarsen + 1
+    grid["Ny"] = (grid["Ny"] - 1) // coarsen + 1
+    grid["DxInMetres"] *= coarsen
+    grid["DyInMetres"] *= coarsen
+    return grid
+
+
+def base_message(grid):
+    """GRIB2 handle with the AK polar-stereographic grid and a 10 m height surface."""
+    import eccodes as ec
+    h = ec.codes_grib_new_from_samples("GRIB2")
+    ec.codes_set(h, "centre", 7)
+    ec.codes_set(h, "gridDefinitionTemplateNumber", 20)
+    keys = dict(shapeOfTheEarth=1, scaleFactorOfRadiusOfSphericalEarth=0, scaledValueOfRadiusOfSphericalEarth=6371200,
+                projectionCentreFlag=0, iScansNegatively=0, jScansPositively=1, **grid)
+    keys.update(discipline=0, parameterCategory=2, typeOfFirstFixedSurface=103, scaleFactorOfFirstFixedSurface=0,
+                scaledValueOfFirstFixedSurface=10, stepUnits=1, packingType="grid_simple", bitsPerValue=12)
+    for key, value in keys.items():
+        ec.codes_set(h, key, value)
+    return h
+
+
+def wind_fields(grid, ref_time, step, seed):
+    """Smooth speed (m/s) and direction (deg) fields for one valid time."""
+    ny, nx = grid["Ny"], grid["Nx"]
+    y, x = np.meshgrid(np.linspace(0, 1, ny, dtype="float32"), np.linspace(0, 1, nx, dtype="float32"), indexing="ij")
+    valid_hours = (ref_time - pd.Timestamp("2000-01-01")) / pd.Timedelta("1h") + step
+    phase = np.float32(2 * np.pi * valid_hours / 96.0)
+    rng = np.random.default_rng([seed, int(valid_hours)])
+    # forecast error grows with step
+    noise = rng.normal(0, 0.02 + 0.003 * step, size=2).astype("float32")
+    speed = 6 + 5 * np.sin(3 * x + phase + noise[0]) * np.cos(2 * y - phase) + 3 * y
+    direction = (180 + 150 * np.sin(2 * x - phase + noise[1]) + 60 * y) % 360
+    return np.clip(speed, 0, None).ravel(), direction.ravel()
+
+
+def write_ndfd_file(path, grid, ref_time, component, steps, seed):
+    import eccodes as ec
+    base = base_message(grid)
+    number = NDFD_PRODUCTS[component][1]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.tmp", "wb") as f:
+        for step in steps:
+            h = ec.codes_clone(base)
+            ec.codes_set(h, "parameterNumber", number)
+            ec.codes_set(h, "dataDate", int(ref_time.strftime("%Y%m%d")))
+            ec.codes_set(h, "dataTime", int(ref_time.strftime("%H%M")))
+            ec.codes_set(h, "forecastTime", step)
+            speed, direction = wind_fields(grid, ref_time, step, seed)
+            ec.codes_set_values(h, speed if component == "wspd" else direction)
+            ec.codes_write(h, f)
+            ec.codes_release(h)
+    ec.codes_release(base)
+    os.replace(f"{path}.tmp", path)
+    return path
+
+
+def ndfd_jobs(out_dir, start, days, grid, seed):
+    """One job per (issuance, component, day range); files land at 11Z/23Z like the feed."""
+    jobs = []
+    for ref_time in pd.date_range(start, periods=days * 2, freq="12h"):
+        # the 00Z/12Z issuances are transmitted around 23Z/11Z of the previous half day
+        stamp = ref_time - pd.Timedelta("37min")
+        for component, (prefix, _) in NDFD_PRODUCTS.items():
+            for suffix, steps in NDFD_STEPS.items():
+                name = f"{prefix}{suffix}_KWBN_{stamp:%Y%m%d%H%M}"
+                path = os.path.join(out_dir, "ndfd", "wmo", component, f"{stamp:%Y}", f"{stamp:%m}", f"{stamp:%d}", name)
+                jobs.append((write_ndfd_file, path, grid, ref_time, component, steps, seed))
+    return jobs
+
+
+def write_nbm_file(path, grid, ref_time, step, seed):
+    """One NBM-like forecast-hour file with WIND/WDIR/GUST and a wgrib2-style .idx."""
+    import eccodes as ec
+    base = base_message(grid)
+    speed, direction = wind_fields(grid, ref_time, step, seed + 1)
+    values = {"WIND": speed, "WDIR": direction, "GUST": speed * 1.4 + 1.5}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    idx_lines = []
+    with open(f"{path}.tmp", "wb") as f:
+        for n, (name, number) in enumerate(NBM_FIELDS.items(), 1):
+            h = ec.codes_clone(base)
+            ec.codes_set(h, "parameterNumber", number)
+            ec.codes_set(h, "dataDate", int(ref_time.strftime("%Y%m%d")))
+            ec.codes_set(h, "dataTime", int(ref_time.strftime("%H%M")))
+            ec.codes_set(h, "forecastTime", step)
+            ec.codes_set_values(h, values[name])
+            idx_lines.append(f"{n}:{f.tell()}:d={ref_time:%Y%m%d%H}:{name}:10 m above ground:{step} hour fcst:\n")
+            ec.codes_write(h, f)
+            ec.codes_release(h)
+    ec.codes_release(base)
+    with open(f"{path}.idx", "w") as f:
+        f.writelines(idx_lines)
+    os.replace(f"{path}.tmp", path)
+    return path
+
+
+def nbm_jobs(out_dir, start, days, grid, seed, steps=NBM_STEPS):
+    jobs = []
+    for ref_time in pd.date_range(start, periods=days * 8, freq="3h"):
+        for step in steps:
+            path = os.path.join(out_dir, "nbm", f"blend.{ref_time:%Y%m%d}", f"{ref_time:%H}", "core",
+                                f"blend.t{ref_time:%H}z.core.f{step:03d}.ak.grib2")
+            jobs.append((write_nbm_file, path, grid, ref_time, step, seed))
+    return jobs
+
+
+def fixture_stations(n, seed):
+    """Stations spread over mainland Alaska and the coast, with Synoptic-style ids."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "stid": [f"FX{i:04d}" for i in range(n)],
+        "name": [f"Fixture station {i}" for i in range(n)],
+        "latitude": rng.uniform(55.0, 70.5, n).round(5),
+        "longitude": rng.uniform(-165.0, -141.0, n).round(5),
+        "elevation": rng.uniform(0, 3000, n).round(0),
+    })
+
+
+def station_obs(stid, index, start, end, freq, seed):
+    """Synoptic-like obs for one station: missing reports, null values, calm spells, some junk."""
+    rng = np.random.default_rng([seed, index])
+    times = pd.date_range(start, end, freq=freq, inclusive="left", tz="UTC")
+    times = times[rng.random(len(times)) > 0.03]
+    hours = ((times - pd.Timestamp("2000-01-01", tz="UTC")) / pd.Timedelta("1h")).to_numpy()
+    speed = np.clip(12 + 10 * np.sin(2 * np.pi * hours / 96 + index) + rng.normal(0, 3, len(times)), 0, None)
+    direction = (200 + 120 * np.sin(2 * np.pi * hours / 96 - index) + rng.normal(0, 15, len(times))) % 360
+    gust = np.where(rng.random(len(times)) < 0.3, speed * 1.4 + rng.uniform(2, 8, len(times)), np.nan)
+    speed[rng.random(len(times)) < 0.01] = np.nan
+    speed[rng.random(len(times)) < 0.0005] = 400.0
+    return times, speed.round(2), np.round(direction), gust.round(2)
+
+
+def as_list(values):
+    return [None if np.isnan(v) else float(v) for v in values]
+
+
+def write_station_obs(out_dir, stn, index, years, freq, seed):
+    """One Synoptic timeseries JSON (units=english, knots) and CSV per station-year."""
+    paths = []
+    for year in years:
+        start, end = pd.Timestamp(f"{year}-01-01"), pd.Timestamp(f"{year + 1}-01-01")
+        times, speed, direction, gust = station_obs(stn['stid'], index, start, end, freq, seed + year)
+        stamps = times.strftime("%Y-%m-%dT%H:%M:%SZ").tolist()
+        payload = {
+            "SUMMARY": {"RESPONSE_CODE": 1, "RESPONSE_MESSAGE": "OK", "NUMBER_OF_OBJECTS": 1},
+            "UNITS": {"position": "ft", "elevation": "ft", "wind_speed": "knots", "wind_direction": "Degrees", "wind_gust": "knots"},
+            "STATION": [{
+                "STID": stn['stid'], "NAME": stn['name'], "LATITUDE": str(stn['latitude']), "LONGITUDE": str(stn['longitude']),
+                "ELEVATION": str(stn['elevation']), "STATE": "AK", "TIMEZONE": "America/Anchorage",
+                "OBSERVATIONS": {
+                    "date_time": stamps,
+                    "wind_speed_set_1": as_list(speed),
+                    "wind_direction_set_1": as_list(direction),
+                    "wind_gust_set_1": as_list(gust),
+                },
+            }],
+        }
+        path = os.path.join(out_dir, "synoptic", f"{stn['stid']}_{year}.json")
+        with open(path, "w") as f:
+            json.dump(payload, f, separators=(",", ":"))
+        csv_path = os.path.join(out_dir, "synoptic_csv", f"{stn['stid']}_{year}.csv")
+        with open(csv_path, "w") as f:
+            f.write(f"# STATION: {stn['stid']}\n# STATION NAME: {stn['name']}\n# LATITUDE: {stn['latitude']}\n"
+                    f"# LONGITUDE: {stn['longitude']}\n# ELEVATION [ft]: {stn['elevation']}\n# STATE: AK\n")
+            f.write("Station_ID,Date_Time,wind_speed_set_1,wind_direction_set_1,wind_gust_set_1\n")
+            f.write(",,knots,Degrees,knots\n")
+            pd.DataFrame({"s": stn['stid'], "t": stamps, "ws": speed, "wd": direction, "wg": gust}).to_csv(
+                f, header=False, index=False)
+        paths += [path, csv_path]
+    return paths
+
+
+def write_metadata(out_dir, stations):
+    """Synoptic metadata response for the station catalog."""
+    payload = {"SUMMARY": {"RESPONSE_CODE": 1, "NUMBER_OF_OBJECTS": len(stations)}, "STATION": [
+        {"STID": s.stid, "NAME": s.name, "LATITUDE": str(s.latitude), "LONGITUDE": str(s.longitude),
+         "ELEVATION": str(s.elevation), "STATUS": "ACTIVE", "STATE": "AK",
+         "PERIOD_OF_RECORD": {"start": "2000-01-01T00:00:00Z", "end": pd.Timestamp.now(tz="UTC").strftime("%Y-01-01T00:00:00Z")}}
+        for s in stations.itertuples()]}
+    path = os.path.join(out_dir, "synoptic_metadata.json")
+    with open(path, "w") as f:
+        json.dump(payload, f, separators=(",", ":"))
+    return path
+
+
+def run_jobs(jobs, workers):
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(fn, *args) for fn, *args in jobs]
+        for fut in futures:
+            fut.result()
+            done += 1
+            if done % 50 == 0 or done == len(jobs):
+                print(f"✅ {done}/{len(jobs)} files")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write synthetic NDFD/NBM GRIB2 and Synoptic obs fixtures.")
+    parser.add_argument("--out", default=config.BENCH_FIXTURES_DIR)
+    parser.add_argument("--what", nargs="+", choices=["ndfd", "nbm", "obs"], default=["ndfd", "nbm", "obs"])
+    parser.add_argument("--start", default="2021-01-01", help="first forecast issuance (00Z)")
+    parser.add_argument("--days", type=int, default=2, help="days of NDFD/NBM issuances")
+    parser.add_argument("--nbm-steps", type=int, nargs="+", help="NBM forecast hours (default: full 1-192 h layout)")
+    parser.add_argument("--coarsen", type=int, default=1, help="keep the AK domain with k-times larger grid cells")
+    parser.add_argument("--stations", type=int, default=300)
+    parser.add_argument("--years", type=int, default=1, help="years of obs starting with --start's year")
+    parser.add_argument("--obs-freq", default="20min")
+    parser.add_argument("--seed", type=int, default=2021)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args(argv)
+
+    grid = grid_definition(args.coarsen)
+    start = pd.Timestamp(args.start).floor("D")
+    jobs = []
+    if "ndfd" in args.what:
+        jobs += ndfd_jobs(args.out, start, args.days, grid, args.seed)
+    if "nbm" in args.what:
+        jobs += nbm_jobs(args.out, start, args.days, grid, args.seed, args.nbm_steps or NBM_STEPS)
+    if "obs" in args.what:
+        stations = fixture_stations(args.stations, args.seed)
+        years = list(range(start.year, start.year + args.years))
+        os.makedirs(os.path.join(args.out, "synoptic"), exist_ok=True)
+        os.makedirs(os.path.join(args.out, "synoptic_csv"), exist_ok=True)
+        write_metadata(args.out, stations)
+        stations.to_csv(os.path.join(args.out, "stations.csv"), index=False)
+        jobs += [(write_station_obs, args.out, stn, i, years, args.obs_freq, args.seed)
+                 for i, stn in enumerate(stations.to_dict("records"))]
+    print(f"Writing {len(jobs)} fixture jobs to {args.out} (grid {grid['Nx']}x{grid['Ny']})")
+    run_jobs(jobs, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+import os
+import json
+import time
+import random
+import argparse
+import threading
+import zlib
+from functools import lru_cache
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import wind_config as config
+from make_fixtures import fixture_stations, station_obs
+
+"""
+Local stand-in for the Synoptic v2 API. /v2/stations/timeseries and /v2/stations/metadata
+are served from make_fixtures output when present, otherwise synthesized on the fly with
+the same generator, so any station id works. Latency, 429 rate limiting (token bucket with
+Retry-After), 5xx errors, slow responses and truncated bodies can be injected to exercise
+the obs fetchers' concurrency and backoff. /stats returns request counters.
+
+    python mock_synoptic.py serve --rate 20 --latency-ms 150 --error-rate 0.02
+    python mock_synoptic.py load --stations 300 --workers 16 --rate 20
+"""
+
+
+class Faults:
+    """Injected behavior, shared by all handler threads."""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, rate=None, burst=None, retry_after=1, error_rate=0.0,
+                 slow_rate=0.0, slow_s=15.0, truncate_rate=0.0, seed=0):
+        self.latency_ms, self.jitter_ms = latency_ms, jitter_ms
+        self.rate, self.burst = rate, burst or (rate or 1)
+        self.retry_after = retry_after
+        self.error_rate, self.slow_rate, self.slow_s, self.truncate_rate = error_rate, slow_rate, slow_s, truncate_rate
+        self.rng = random.Random(seed)
+        self.tokens, self.stamp = float(self.burst), time.monotonic()
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "ok": 0, "rate_limited": 0, "errors": 0, "slow": 0, "truncated": 0, "bytes": 0}
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.stats[key] += n
+
+    def take_token(self):
+        if not self.rate:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def roll(self, p):
+        with self.lock:
+            return self.rng.random() < p
+
+
+class MockData:
+    """Fixture-backed (or synthesized) payloads."""
+
+    def __init__(self, fixtures_dir=config.BENCH_FIXTURES_DIR, obs_freq="20min", seed=2021):
+        self.fixtures_dir, self.obs_freq, self.seed = fixtures_dir, obs_freq, seed
+        stations_csv = os.path.join(fixtures_dir, "stations.csv")
+        self.stations = pd.read_csv(stations_csv) if os.path.exists(stations_csv) else fixture_stations(300, seed)
+        self.index = {stid: i for i, stid in enumerate(self.stations.stid)}
+
+    @lru_cache(maxsize=4096)
+    def fixture_year(self, stid, year):
+        path = os.path.join(self.fixtures_dir, "synoptic", f"{stid}_{year}.json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)["STATION"][0]
+
+    def station_meta(self, stid):
+        i = self.index.get(stid)
+        if i is None:
+            # unknown ids still get a stable location so fetchers see a normal station
+            key = zlib.crc32(stid.encode())
+            rng = np.random.default_rng(key)
+            return {"STID": stid, "NAME": stid, "LATITUDE": f"{rng.uniform(55, 70):.4f}",
+                    "LONGITUDE": f"{rng.uniform(-165, -141):.4f}", "ELEVATION": "100", "STATE": "AK"}, 10_000 + key % 10_000
+        row = self.stations.iloc[i]
+        return {"STID": stid, "NAME": str(row["name"]), "LATITUDE": str(row["latitude"]), "LONGITUDE": str(row["longitude"]),
+                "ELEVATION": str(row["elevation"]), "STATE": "AK"}, i
+
+    def observations(self, stid, start, end, units):
+        meta, i = self.station_meta(stid)
+        pieces = []
+        for year in range(start.year, end.year + 1):
+            station = self.fixture_year(stid, year)
+            if station is not None:
+                obs = station["OBSERVATIONS"]
+                df = pd.DataFrame({"t": pd.to_datetime(obs["date_time"], utc=True), "ws": obs["wind_speed_set_1"],
+                                   "wd": obs["wind_direction_set_1"], "wg": obs["wind_gust_set_1"]})
+            else:
+                y0, y1 = pd.Timestamp(f"{year}-01-01"), pd.Timestamp(f"{year + 1}-01-01")
+                times, ws, wd, wg = station_obs(stid, i, y0, y1, self.obs_freq, self.seed + year)
+                df = pd.DataFrame({"t": times, "ws": ws, "wd": wd, "wg": wg})
+            pieces.append(df[(df.t >= start) & (df.t <= end)])
+        df = pd.concat(pieces, ignore_index=True) if pieces else pd.DataFrame(columns=["t", "ws", "wd", "wg"])
+        to_units = 1.0 if units == "english" else 1 / config.KNOTS_PER_UNIT["m/s"]
+        vals = {k: [None if v is None or v != v else round(float(v) * (to_units if k != "wd" else 1), 2) for v in df[k]]
+                for k in ["ws", "wd", "wg"]}
+        meta["OBSERVATIONS"] = {
+            "date_time": df.t.dt.strftime("%Y-%m-%dT%H:%M:%SZ").tolist(),
+            "wind_speed_set_1": vals["ws"], "wind_direction_set_1": vals["wd"], "wind_gust_set_1": vals["wg"],
+        }
+        return meta
+
+
+def parse_time(value):
+    return pd.to_datetime(value, format="%Y%m%d%H%M", utc=True)
+
+
+def make_handler(data, faults):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def send_json(self, status, payload, headers=None, truncate=False):
+            body = json.dumps(payload, separators=(",", ":")).encode()
+            if truncate:
+                body = body[: max(1, len(body) // 2)]
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+            faults.count("bytes", len(body))
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            if url.path == "/stats":
+                return self.send_json(200, faults.stats)
+            faults.count("requests")
+            if not faults.take_token():
+                faults.count("rate_limited")
+                return self.send_json(429, {"SUMMARY": {"RESPONSE_CODE": 429, "RESPONSE_MESSAGE": "Rate limit exceeded"}},
+                                      {"Retry-After": str(faults.retry_after)})
+            delay = max(0.0, faults.latency_ms + faults.rng.uniform(-faults.jitter_ms, faults.jitter_ms)) / 1000
+            if faults.roll(faults.slow_rate):
+                faults.count("slow")
+                delay = faults.slow_s
+            time.sleep(delay)
+            if faults.roll(faults.error_rate):
+                faults.count("errors")
+                return self.send_json(503, {"SUMMARY": {"RESPONSE_CODE": -1, "RESPONSE_MESSAGE": "Injected error"}})
+            if not query.get("token"):
+                return self.send_json(401, {"SUMMARY": {"RESPONSE_CODE": 2, "RESPONSE_MESSAGE": "Invalid token."}})
+
+            if url.path.endswith("/stations/timeseries"):
+                start, end = parse_time(query["start"]), parse_time(query["end"])
+                units = query.get("units", "metric")
+                stations = [data.observations(stid, start, end, units) for stid in query.get("stid", "").split(",") if stid]
+                speed_units = "knots" if units == "english" else "m/s"
+                payload = {"SUMMARY": {"RESPONSE_CODE": 1, "RESPONSE_MESSAGE": "OK", "NUMBER_OF_OBJECTS": len(stations)},
+                           "UNITS": {"wind_speed": speed_units, "wind_gust": speed_units, "wind_direction": "Degrees"},
+                           "STATION": stations}
+            elif url.path.endswith("/stations/metadata"):
+                stations = [data.station_meta(stid)[0] for stid in data.stations.stid]
+                payload = {"SUMMARY": {"RESPONSE_CODE": 1, "NUMBER_OF_OBJECTS": len(stations)}, "STATION": stations}
+            else:
+                return self.send_json(404, {"SUMMARY": {"RESPONSE_CODE": -1, "RESPONSE_MESSAGE": "Unknown endpoint"}})
+
+            truncate = faults.roll(faults.truncate_rate)
+            faults.count("truncated" if truncate else "ok")
+            self.send_json(200, payload, truncate=truncate)
+
+    return Handler
+
+
+class MockSynoptic:
+    """Serve the mock API on a background thread and point config/env at it while open."""
+
+    def __init__(self, faults=None, data=None, port=0):
+        self.faults = faults or Faults()
+        self.data = data or MockData()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(self.data, self.faults))
+        self.server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/v2"
+
+    def __enter__(self):
+        from create_obs_archive import use_synoptic_base_url
+        self._saved = config.SYNOPTIC_BASE_URL
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        use_synoptic_base_url(self.base_url)
+        return self
+
+    def __exit__(self, *exc):
+        from create_obs_archive import use_synoptic_base_url
+        self.server.shutdown()
+        self.server.server_close()
+        use_synoptic_base_url(self._saved)
+
+
+def load_test(stations, workers, start, end):
+    """Drive fetch_wind_obs_multiprocess like create_obs_archive does and report throughput."""
+    from create_obs_archive import fetch_wind_obs_multiprocess
+    t0 = time.perf_counter()
+    rows = failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(fetch_wind_obs_multiprocess, stid, start, end) for stid in stations]
+        for fut in futures:
+            df = fut.result()
+            if df is None:
+                failed += 1
+            else:
+                rows += len(df)
+    wall = time.perf_counter() - t0
+    print(f"✅ {len(stations)} stations, {workers} workers: {wall:.1f}s, {len(stations) / wall:.1f} stations/s, "
+          f"{rows / wall:,.0f} rows/s, {failed} failed")
+    return {"wall_s": wall, "rows": rows, "failed": failed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mock Synoptic API for ingest testing.")
+    parser.add_argument("command", choices=["serve", "load"])
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--fixtures", default=config.BENCH_FIXTURES_DIR)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--rate", type=float, help="requests/s before 429s (token bucket)")
+    parser.add_argument("--burst", type=int)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--slow-rate", type=float, default=0, help="fraction of requests held past the client timeout")
+    parser.add_argument("--truncate-rate", type=float, default=0)
+    parser.add_argument("--stations", type=int, default=100, help="load: number of stations to fetch")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--start", default=config.OBS_START)
+    parser.add_argument("--end", default=config.OBS_END)
+    args = parser.parse_args(argv)
+
+    faults = Faults(args.latency_ms, args.jitter_ms, args.rate, args.burst, args.retry_after, args.error_rate,
+                    args.slow_rate, config.REQUEST_TIMEOUT + 5, args.truncate_rate)
+    mock = MockSynoptic(faults, MockData(args.fixtures), port=0 if args.command == "load" else args.port)
+    with mock:
+        if args.command == "serve":
+            print(f"Serving mock Synoptic at {mock.base_url}; export SYNOPTIC_BASE_URL={mock.base_url}")
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                pass
+        else:
+            load_test(list(mock.data.stations.stid[: args.stations]), args.workers, args.start, args.end)
+            print(f"📊 Server: {faults.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import os
+import argparse
+from datetime import datetime
+import pandas as pd
+import wind_config as config
+from storage import filesystem
+from pipeline_metrics import span, count, fail, read_events
+
+"""
+Backfill planning for the NDFD archive. Every NDFD file is one issuance cycle of one product,
+and its valid times span cycle + config.NDFD_LEAD_HOURS for that product (days 1-3 or 4-7).
+plan_files() lists only the cycles whose valid times reach the requested window. It then
+assigns each file to the month of its cycle, so every issuance lands in exactly one monthly
+task and adjacent months never repeat work. estimate() turns a plan into files, bytes and
+expected wall time for a given concurrency, so a backfill can be sized before it runs.
+
+    python ndfd_planner.py --start 201501010000 --end 202501010000 --chunks 8 --threads 32
+    python ndfd_planner.py ... --calibrate ~/metrics/ndfd_archive_<run>.jsonl
+"""
+
+PLAN_COLUMNS = ["path", "component", "prefix", "cycle", "bytes", "first_valid", "last_valid", "task"]
+
+
+def file_cycle(path):
+    """Issuance cycle for a feed file: the stamp is the transmission time in the hour before the cycle."""
+    stamp = datetime.strptime(os.path.basename(path).split("_")[-1], "%Y%m%d%H%M")
+    return (pd.Timestamp(stamp) + pd.Timedelta(hours=1)).floor("h")
+
+
+def lead_hours(prefix):
+    return config.NDFD_LEAD_HOURS[prefix[-2:]]
+
+
+def list_cycle_files(cycle_start, cycle_end, element_dict=config.NDFD_DICT, element_type="Wind", base_url=None):
+    """
+    Every 00Z/12Z file whose cycle falls in cycle_start..cycle_end, with its size.
+    One listing per component, product and transmission day.
+    """
+    base_url = base_url or config.NDFD_SOURCE_URL
+    fs, base_path = filesystem(base_url, anon=True)
+    cycle_start, cycle_end = pd.Timestamp(cycle_start), pd.Timestamp(cycle_end)
+    rows = []
+    # a cycle's file is stamped during the hour before it, possibly the previous day
+    days = pd.date_range((cycle_start - pd.Timedelta(hours=1)).floor("D"), cycle_end.floor("D"), freq="D")
+    for component, prefixes in element_dict[element_type].items():
+        for day in days:
+            for prefix in prefixes:
+                pattern = f"{base_path}/{component}/{day:%Y}/{day:%m}/{day:%d}/{prefix}_*"
+                try:
+                    with span("list", component=component):
+                        found = fs.glob(pattern, detail=True)
+                except Exception as e:
+                    fail("list")
+                    print(f"⚠️ Could not fetch files for {pattern}: {e}")
+                    continue
+                for path, info in found.items():
+                    try:
+                        stamp_hour = int(os.path.basename(path).split("_")[-1][8:10])
+                        cycle = file_cycle(path)
+                    except ValueError:
+                        continue
+                    if stamp_hour in config.NDFD_CYCLE_FILE_HOURS and cycle_start <= cycle <= cycle_end:
+                        rows.append((path, component, prefix, cycle, int(info.get("size") or 0)))
+    files = pd.DataFrame(rows, columns=PLAN_COLUMNS[:5])
+    return files.sort_values(["cycle", "component", "prefix"], ignore_index=True)
+
+
+def plan_files(start, end, element_dict=config.NDFD_DICT, element_type="Wind", base_url=None):
+    """
+    Files with valid times in start..end, each tagged with its task (the first day of its
+    cycle's month). Only cycles in [start - longest lead, end - shortest lead] are listed.
+    """
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    first_lead = min(lead[0] for lead in config.NDFD_LEAD_HOURS.values())
+    last_lead = max(lead[1] for lead in config.NDFD_LEAD_HOURS.values())
+    files = list_cycle_files(start - pd.Timedelta(hours=last_lead), end - pd.Timedelta(hours=first_lead),
+                             element_dict, element_type, base_url)
+    if files.empty:
+        # nothing listed (no files in the period, or every listing failed): an empty, typed plan
+        return pd.DataFrame(columns=PLAN_COLUMNS).astype({"cycle": "datetime64[ns]", "bytes": "int64",
+                                                          "first_valid": "datetime64[ns]", "last_valid": "datetime64[ns]",
+                                                          "task": "datetime64[ns]"})
+    leads = files["prefix"].map(lead_hours)
+    files["first_valid"] = files["cycle"] + pd.to_timedelta(leads.str[0], unit="h")
+    files["last_valid"] = files["cycle"] + pd.to_timedelta(leads.str[1], unit="h")
+    files = files[(files["first_valid"] <= end) & (files["last_valid"] >= start)].copy()
+    files["task"] = files["cycle"].dt.to_period("M").dt.start_time
+    for component, n in files["component"].value_counts().items():
+        count("files_listed", int(n), component=component)
+    return files.reset_index(drop=True)
+
+
+def calibrate(metrics_path):
+    """Fetch rate and per-file decode+extract time measured by an earlier ndfd_archive run."""
+    fetch_s = decode_s = 0.0
+    decodes = fetched = 0
+    for e in read_events(metrics_path):
+        if e["event"] == "span" and e["stage"] == "fetch":
+            fetch_s += e["wall_s"]
+        elif e["event"] == "span" and e["stage"] in ("decode", "extract"):
+            decode_s += e["wall_s"]
+            decodes += e["stage"] == "decode"
+        elif e["event"] == "counters":
+            fetched += sum(c["value"] for c in e["counters"] if c["name"] == "bytes_fetched")
+    rates = {"fetch_mbps": config.NDFD_EST_FETCH_MBPS, "decode_s": config.NDFD_EST_DECODE_S}
+    if fetch_s and fetched:
+        rates["fetch_mbps"] = fetched / 2**20 / fetch_s
+    if decodes:
+        rates["decode_s"] = decode_s / decodes
+    return rates
+
+
+def estimate(files, chunks, threads, rates=None):
+    """Per-task files, bytes and thread-seconds, and the expected wall time at this concurrency."""
+    rates = rates or {"fetch_mbps": config.NDFD_EST_FETCH_MBPS, "decode_s": config.NDFD_EST_DECODE_S}
+    tasks = files.groupby("task").agg(cycles=("cycle", "nunique"), files=("path", "size"), bytes=("bytes", "sum"))
+    tasks["work_s"] = tasks["bytes"] / 2**20 / rates["fetch_mbps"] + tasks["files"] * rates["decode_s"]
+    concurrent = max(1, min(chunks, len(tasks)))
+    per_chunk = max(1, threads // concurrent)
+    tasks["wall_s"] = tasks["work_s"] / per_chunk
+    # longest-first onto the chunk slots, as the pool will roughly do
+    slots = [0.0] * concurrent
+    for wall in sorted(tasks["wall_s"], reverse=True):
+        slots[slots.index(min(slots))] += wall
+    summary = {
+        "tasks": len(tasks), "cycles": int(files["cycle"].nunique()), "files": len(files), "bytes": int(files["bytes"].sum()),
+        "chunks": concurrent, "threads_per_chunk": per_chunk, "wall_s": max(slots) if slots else 0.0,
+        "memory_gb": concurrent * config.NDFD_CHUNK_MEMORY_GB, **rates,
+    }
+    return tasks, summary
+
+
+def print_estimate(tasks, summary):
+    print(f"{'task':<10}{'cycles':>8}{'files':>8}{'MB':>10}{'est min':>10}")
+    for task, t in tasks.iterrows():
+        print(f"{task:%Y-%m}{'':<3}{int(t['cycles']):>8}{int(t['files']):>8}{t['bytes'] / 2**20:>10.1f}{t['wall_s'] / 60:>10.1f}")
+    print(f"📋 {summary['tasks']} tasks, {summary['cycles']} cycles, {summary['files']} files, "
+          f"{summary['bytes'] / 2**30:.2f} GB; {summary['chunks']} chunks x {summary['threads_per_chunk']} threads, "
+          f"~{summary['wall_s'] / 3600:.2f} h, ~{summary['memory_gb']:.0f} GB peak "
+          f"(at {summary['fetch_mbps']:.0f} MB/s, {summary['decode_s']:.2f} s/file)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Dry-run plan and cost estimate for an NDFD backfill.")
+    parser.add_argument("--start", default=config.OBS_START, help="first valid time, YYYYmmddHHMM")
+    parser.add_argument("--end", default=config.OBS_END, help="last valid time, YYYYmmddHHMM")
+    parser.add_argument("--chunks", type=int, default=config.NDFD_BACKFILL_CHUNKS)
+    parser.add_argument("--threads", type=int, default=config.NDFD_BACKFILL_THREADS)
+    parser.add_argument("--base-url", help="bucket or local mirror (default config.NDFD_SOURCE_URL)")
+    parser.add_argument("--calibrate", help="metrics .jsonl of an earlier ndfd_archive run")
+    parser.add_argument("--csv", help="write the per-file plan here")
+    args = parser.parse_args(argv)
+    files = plan_files(pd.to_datetime(args.start, format="%Y%m%d%H%M"), pd.to_datetime(args.end, format="%Y%m%d%H%M"),
+                       base_url=args.base_url)
+    tasks, summary = estimate(files, args.chunks, args.threads, calibrate(args.calibrate) if args.calibrate else None)
+    print_estimate(tasks, summary)
+    if args.csv:
+        files.to_csv(args.csv, index=False)
+
+
+if __name__ == "__main__":
+    main()
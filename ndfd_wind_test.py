@@ -2,11 +2,11 @@ import xarray as xr
 import fsspec
 import pandas as pd
 import numpy as np
-import requests
 from collections import defaultdict
 from datetime import datetime, timedelta
 import os
 import wind_config as config
+from station_catalog import load_station_catalog
 
 def ensure_dir(directory):
     """Ensure a directory exists. If not, create it."""
@@ -25,37 +25,6 @@ def ll_to_index(loclat, loclon, datalats, datalons):
     latlon_idx = np.unravel_index(latlon_idx_flat, datalons.shape)
     return latlon_idx
 
-def create_wind_metadata(url, token, state, networks, vars, obrange):
-    # setting up synoptic params
-    # Parameters for the API request
-    params = {
-        "token": token,
-        "vars": vars,  # Variables to retrieve
-        "obrange": obrange,
-        "network": networks,
-        "state": state,
-        "output": "json"           # Output format
-    }
-
-    # Make the API request
-    response = requests.get(url, params=params)
-
-    # Check if the request was successful
-    if response.status_code == 200:
-        data = response.json()
-    return data
-
-def parse_metadata(data):
-    stn_dict = {"stid": [], "name": [], "latitude": [], "longitude": [], "elevation": []}
-    for stn in data["STATION"]:
-        stn_dict['stid'].append(stn['STID'])
-        stn_dict['name'].append(stn['NAME'])
-        stn_dict['latitude'].append(stn['LATITUDE'])
-        stn_dict['longitude'].append(stn['LONGITUDE'])
-        stn_dict['elevation'].append(stn['ELEVATION'])
-    meta_df = pd.DataFrame(stn_dict)
-    return meta_df
-
 def extract_timestamp(filename):
     time_str = os.path.basename(filename).split("_")[-1]
     return datetime.strptime(time_str, "%Y%m%d%H%M")
@@ -171,17 +140,8 @@ def extract_ndfd_forecasts(speed_files, direction_files, station_df, tmp_dir="tm
 # Example usage:
 if __name__ == "__main__":
 
-    if not os.path.exists(os.path.join(config.OBS, config.METADATA)):
-        print(f"Couldn't find {config.METADATA} in {config.OBS}...will need to create the file")
-        ensure_dir(config.OBS)
-        # getting our metadata if we don't have it
-        print(f'Creating metadata file from {config.METADATA_URL}')
-        meta_json = create_wind_metadata(config.METADATA_URL, config.API_KEY, config.STATE, config.NETWORK, config.WIND_VARS, config.OBS_START)
-        meta_df = parse_metadata(meta_json)
-        meta_df.to_csv(os.path.join(config.OBS, config.METADATA), index=False)
-        print(f"All done creating metadata.  Saved {config.METADATA} in {config.OBS}.")
-
-    station_df = pd.read_csv(os.path.join(config.OBS, config.METADATA))
+
+    station_df = load_station_catalog()
     filtered_files = get_ndfd_file_list(config.OBS_START, config.OBS_END, config.NDFD_DICT)
 
     # Access them like this:
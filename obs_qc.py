@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pyarrow.compute as pc
+import wind_config as config
+
+"""
+Vectorized QC for obs batches. Each check sets one bit in a uint16 qc_flags column that is
+stored with the data, so consumers filter with a Parquet predicate (qc_flags == 0, or a
+bitmask expression) instead of re-running the checks over years of obs.
+"""
+
+QC_SPEED_RANGE = 1        # speed negative or above QC_MAX_SPEED_KT
+QC_GUST_RANGE = 2         # gust negative or above QC_MAX_GUST_KT
+QC_GUST_LT_SPEED = 4      # gust reported below the sustained speed
+QC_DIR_RANGE = 8          # direction outside 0-360
+QC_SPEED_FLATLINE = 16    # speed stuck on one non-calm value
+QC_DIR_FLATLINE = 32      # direction stuck on one value while the wind is blowing
+QC_DUPLICATE = 64         # conflicting values reported for the same (stid, timestamp)
+
+QC_NAMES = {
+    QC_SPEED_RANGE: "speed_range",
+    QC_GUST_RANGE: "gust_range",
+    QC_GUST_LT_SPEED: "gust_lt_speed",
+    QC_DIR_RANGE: "dir_range",
+    QC_SPEED_FLATLINE: "speed_flatline",
+    QC_DIR_FLATLINE: "dir_flatline",
+    QC_DUPLICATE: "duplicate",
+}
+
+
+def flatline_mask(stid, times, values, active, min_duration):
+    """
+    Flag rows that belong to a run of identical values lasting at least min_duration.
+    Inputs must be sorted by station then time; runs break on station or value changes.
+    """
+    values = np.asarray(values, dtype="float64")
+    same = np.r_[False, (values[1:] == values[:-1]) & (stid[1:] == stid[:-1])]
+    run_id = np.cumsum(~same)
+    t = times.astype("int64")
+    run_start = pd.Series(t).groupby(run_id).transform("min").values
+    run_end = pd.Series(t).groupby(run_id).transform("max").values
+    return active & ~np.isnan(values) & ((run_end - run_start) >= min_duration.value)
+
+
+def run_qc(df, flatline_hours=config.QC_FLATLINE_HOURS):
+    """Return the batch sorted by (stid, timestamp) with a qc_flags column."""
+    df = df.sort_values(["stid", "timestamp"], kind="stable").reset_index(drop=True)
+    speed = df["wind_speed"].to_numpy(dtype="float64")
+    gust = df["wind_gust"].to_numpy(dtype="float64")
+    direction = df["wind_direction"].to_numpy(dtype="float64")
+    stid = df["stid"].to_numpy(dtype=str)
+    times = pd.to_datetime(df["timestamp"], utc=True).dt.tz_convert(None).to_numpy("datetime64[ns]")
+    flags = np.zeros(len(df), dtype="uint16")
+
+    # comparisons with NaN are False, so missing values never trip a check
+    with np.errstate(invalid="ignore"):
+        flags |= np.where((speed < 0) | (speed > config.QC_MAX_SPEED_KT), QC_SPEED_RANGE, 0).astype("uint16")
+        flags |= np.where((gust < 0) | (gust > config.QC_MAX_GUST_KT), QC_GUST_RANGE, 0).astype("uint16")
+        flags |= np.where(gust < speed, QC_GUST_LT_SPEED, 0).astype("uint16")
+        flags |= np.where((direction < 0) | (direction > 360), QC_DIR_RANGE, 0).astype("uint16")
+
+        min_duration = pd.Timedelta(hours=flatline_hours)
+        flags |= np.where(flatline_mask(stid, times, speed, speed > 0, min_duration), QC_SPEED_FLATLINE, 0).astype("uint16")
+        flags |= np.where(flatline_mask(stid, times, direction, speed > 0, min_duration), QC_DIR_FLATLINE, 0).astype("uint16")
+
+    # repeated keys are only suspicious when the reported values disagree
+    keyed = df[["stid", "timestamp"]]
+    dup_keys = keyed.duplicated(keep=False).to_numpy()
+    if dup_keys.any():
+        values = df.loc[dup_keys, ["stid", "timestamp", "wind_speed", "wind_direction", "wind_gust"]]
+        distinct = values.drop_duplicates().groupby(["stid", "timestamp"]).size()
+        conflicted = distinct[distinct > 1].index
+        conflict = pd.MultiIndex.from_frame(keyed).isin(conflicted)
+        flags |= np.where(conflict, QC_DUPLICATE, 0).astype("uint16")
+
+    df["qc_flags"] = flags
+    return df
+
+
+def qc_filter(mask=0xFFFF):
+    """Pyarrow filter expression keeping rows with none of the bits in mask set."""
+    return pc.equal(pc.bit_wise_and(pc.field("qc_flags"), pc.scalar(mask).cast("uint16")), pc.scalar(0).cast("uint16"))
+
+
+def summarize_qc(df):
+    """Count rows tripping each QC check."""
+    flags = df["qc_flags"].to_numpy(dtype="uint16")
+    return {name: int(((flags & bit) != 0).sum()) for bit, name in QC_NAMES.items()}
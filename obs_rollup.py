@@ -0,0 +1,118 @@
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.compute as pc
+import wind_config as config
+from obs_qc import qc_filter
+
+"""
+Precomputed obs rollup aligned to forecast valid times. Every station is binned in one
+grouped pass: speed is averaged, direction is vector (u/v) averaged, gust takes the max.
+Bins are centered on the valid time, so the 12Z 3h bin holds obs from 10:30Z to 13:30Z.
+"""
+
+ROLLUP_SCHEMA = pa.schema([
+    ("stid", pa.string()),
+    ("valid_time", pa.timestamp("ns", tz="UTC")),
+    ("wind_speed", pa.float64()),
+    ("wind_direction", pa.float64()),
+    ("wind_gust", pa.float64()),
+    ("n_obs", pa.int32()),
+])
+
+
+def bin_valid_time(times, freq):
+    """Snap timestamps to the nearest valid time (half-open bins, ties go to the later time)."""
+    half = pd.Timedelta(freq) / 2
+    return (times + half).dt.floor(freq)
+
+
+def rollup_obs(obs_df, freq, time_col="timestamp"):
+    """
+    Bin wide obs (stid, time, wind_speed, wind_direction, wind_gust) to valid times for all
+    stations at once. Direction is averaged from speed-weighted u/v components, falling
+    back to unit vectors where speed is missing.
+    """
+    if obs_df.empty:
+        return pd.DataFrame(columns=ROLLUP_SCHEMA.names)
+    times = pd.to_datetime(obs_df[time_col], utc=True)
+    speed = obs_df["wind_speed"].astype("float64")
+    direction = np.radians(obs_df["wind_direction"].astype("float64"))
+    weight = speed.where(speed.notna(), 1.0)
+    work = pd.DataFrame({
+        "stid": obs_df["stid"].values,
+        "valid_time": bin_valid_time(times, freq).values,
+        "wind_speed": speed.values,
+        "u": (-weight * np.sin(direction)).values,
+        "v": (-weight * np.cos(direction)).values,
+        "wind_gust": obs_df["wind_gust"].astype("float64").values,
+    })
+    grouped = work.groupby(["stid", "valid_time"], sort=True).agg(
+        wind_speed=("wind_speed", "mean"),
+        u=("u", "mean"),
+        v=("v", "mean"),
+        wind_gust=("wind_gust", "max"),
+        n_obs=("stid", "size"),
+    ).reset_index()
+    direction = (np.degrees(np.arctan2(-grouped["u"], -grouped["v"])) + 360) % 360
+    # a zero resultant vector has no meaningful direction
+    calm = np.hypot(grouped["u"], grouped["v"]) < 1e-9
+    grouped["wind_direction"] = direction.where(~calm & grouped["u"].notna()).round(0)
+    grouped["wind_speed"] = grouped["wind_speed"].round(2)
+    grouped["n_obs"] = grouped["n_obs"].astype("int32")
+    grouped["valid_time"] = pd.to_datetime(grouped["valid_time"], utc=True)
+    return grouped[ROLLUP_SCHEMA.names]
+
+
+def rollup_partition_path(rollup_dir, freq, year, month):
+    return os.path.join(rollup_dir, f"freq={freq}", f"year={year}", f"month={month}", "part-0.parquet")
+
+
+def update_obs_rollup(archive_dir, rollup_dir, start, end, freqs=config.OBS_ROLLUP_FREQS):
+    """
+    Rebuild the rollup months overlapping start..end from the QC-passed obs archive. Each
+    month is read with half a bin of margin on both sides so bins at month edges are complete.
+    """
+    months = pd.period_range(pd.Timestamp(start).to_period("M"), pd.Timestamp(end).to_period("M"), freq="M")
+    max_half = max(pd.Timedelta(f) for f in freqs) / 2
+    written = 0
+    for month in months:
+        month_start = as_utc(month.start_time)
+        month_end = as_utc((month + 1).start_time)
+        # only obs that passed every QC check feed the rollup
+        filters = ((pc.field("timestamp") >= pc.scalar(month_start - max_half))
+                   & (pc.field("timestamp") < pc.scalar(month_end + max_half))
+                   & qc_filter())
+        obs = pq.read_table(archive_dir, filters=filters, partitioning="hive").to_pandas()
+        for freq in freqs:
+            rolled = rollup_obs(obs, freq)
+            rolled = rolled[(rolled["valid_time"] >= month_start) & (rolled["valid_time"] < month_end)]
+            outfile = rollup_partition_path(rollup_dir, freq, month.year, month.month)
+            os.makedirs(os.path.dirname(outfile), exist_ok=True)
+            table = pa.Table.from_pandas(rolled, schema=ROLLUP_SCHEMA, preserve_index=False)
+            tmpfile = f"{outfile}.tmp"
+            pq.write_table(table, tmpfile, compression="zstd")
+            os.replace(tmpfile, outfile)
+            written += len(rolled)
+        print(f"✅ Rolled up obs for {month} ({', '.join(freqs)}).")
+    return written
+
+
+def as_utc(ts):
+    ts = pd.Timestamp(ts)
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+
+
+def read_obs_rollup(rollup_dir, freq, stations=None, start=None, end=None):
+    """Read one rollup frequency, pushing station and time filters into the scan."""
+    filters = []
+    if stations is not None:
+        filters.append(("stid", "in", list(stations)))
+    if start is not None:
+        filters.append(("valid_time", ">=", as_utc(start)))
+    if end is not None:
+        filters.append(("valid_time", "<=", as_utc(end)))
+    table = pq.read_table(os.path.join(rollup_dir, f"freq={freq}"), filters=filters or None, partitioning="hive")
+    return table.to_pandas()[ROLLUP_SCHEMA.names]
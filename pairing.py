@@ -0,0 +1,214 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from concurrent.futures import ThreadPoolExecutor
+import wind_config as config
+from obs_qc import qc_filter
+from storage import filesystem, read_versioned
+
+"""
+Forecast-to-observation pairing. Forecast archives (NDFD, NBM) are harmonized to one
+schema, then each forecast row is matched to the nearest QC-passed obs for its station
+within config.PAIR_TOLERANCE using a sorted as-of join. Work runs one valid month at a
+time so memory stays bounded, and the paired table is written as source/year/month
+partitions.
+"""
+
+PAIRED_SCHEMA = pa.schema([
+    ("source", pa.string()),
+    ("stid", pa.string()),
+    ("valid_time", pa.timestamp("ns", tz="UTC")),
+    ("lead_hr", pa.int32()),
+    ("fcst_speed_kt", pa.float64()),
+    ("fcst_dir_deg", pa.float64()),
+    ("obs_time", pa.timestamp("ns", tz="UTC")),
+    ("obs_speed_kt", pa.float64()),
+    ("obs_dir_deg", pa.float64()),
+    ("obs_gust_kt", pa.float64()),
+])
+
+FCST_COLUMNS = ["stid", "valid_time", "lead_hr", "fcst_speed_kt", "fcst_dir_deg"]
+
+PAIR_KEYS = ["stid", "valid_time", "lead_hr"]
+
+
+def normalize_stid(stid):
+    return stid.astype("string").str.strip().str.upper()
+
+
+def harmonize_ndfd(df):
+    """NDFD rows (station_id, valid_time, forecast_hour, wind_speed_kt, wind_dir_deg)."""
+    out = pd.DataFrame({
+        "stid": normalize_stid(df["station_id"]),
+        "valid_time": pd.to_datetime(df["valid_time"], utc=True),
+        "lead_hr": df["forecast_hour"].astype("int32"),
+        "fcst_speed_kt": df["wind_speed_kt"].astype("float64"),
+        "fcst_dir_deg": df["wind_dir_deg"].astype("float64") if "wind_dir_deg" in df else np.nan,
+    })
+    return out
+
+
+def harmonize_nbm(df):
+    """NBM long rows (stid, valid_time, step_hr, variable in speed/direction, value in kt)."""
+    wide = df.pivot_table(index=["stid", "valid_time", "step_hr"], columns="variable", values="value", aggfunc="first")
+    wide = wide.reindex(columns=["speed", "direction"]).reset_index()
+    out = pd.DataFrame({
+        "stid": normalize_stid(wide["stid"]),
+        "valid_time": pd.to_datetime(wide["valid_time"], utc=True),
+        "lead_hr": wide["step_hr"].astype("int32"),
+        "fcst_speed_kt": wide["speed"].astype("float64"),
+        "fcst_dir_deg": wide["direction"].astype("float64"),
+    })
+    return out
+
+
+HARMONIZERS = {"ndfd": harmonize_ndfd, "nbm": harmonize_nbm}
+
+
+def time_bound(field_type, ts):
+    """Match a bound's timezone to the column so the filter can be pushed into the scan."""
+    ts = pd.Timestamp(ts)
+    ts = ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+    if getattr(field_type, "tz", None) is None:
+        ts = ts.tz_convert(None)
+    return pa.scalar(ts, type=field_type)
+
+
+def scan_parquet(paths, time_col, start, end, filesystem=None, extra_filter=None, columns=None):
+    """Read the rows with start <= time_col < end from existing Parquet paths via a filtered dataset scan."""
+    if not paths:
+        return None
+    dataset = ds.dataset(paths, format="parquet", filesystem=filesystem, partitioning="hive")
+    field_type = dataset.schema.field(time_col).type
+    expr = (ds.field(time_col) >= time_bound(field_type, start)) & (ds.field(time_col) < time_bound(field_type, end))
+    if extra_filter is not None:
+        expr = expr & extra_filter
+    return dataset.to_table(filter=expr, columns=columns).to_pandas()
+
+
+def month_object(template, month):
+    """
+    The committed file for one month of an archive: the object the month's manifest points at
+    (see create_ndfd_archive.commit_chunk), or the plain monthly name when there is no manifest.
+    """
+    data, _ = read_versioned(f"{os.path.dirname(template)}/{config.NDFD_MANIFEST_DIR}/{month.year}_{month.month:02d}.json")
+    return (json.loads(data).get("object") if data else None) or template.format(year=month.year, month=month.month)
+
+
+def archive_paths(template, start, end):
+    """
+    Resolve an archive path template to the files that can hold valid times in start..end.
+    Monthly files hold the issuance cycles of their month, so the range is widened by the
+    longest lead on the left only.
+    """
+    if "{year}" not in template:
+        return [template]
+    first = (pd.Timestamp(start) - pd.Timedelta(hours=config.NDFD_MAX_LEAD_HOURS)).to_period("M")
+    last = pd.Timestamp(end).to_period("M")
+    return [month_object(template, p) for p in pd.period_range(first, last, freq="M")]
+
+
+def read_forecasts(source, start, end, template=None):
+    template = template or config.FORECAST_ARCHIVES[source]
+    fs, _ = filesystem(template)
+    # monthly files are named, not listed; months that were never archived are skipped
+    paths = [fs._strip_protocol(p) for p in archive_paths(template, start, end)]
+    paths = [p for p in paths if fs.exists(p)]
+    df = scan_parquet(paths, "valid_time", start, end, filesystem=fs)
+    if df is None or df.empty:
+        return pd.DataFrame(columns=FCST_COLUMNS)
+    fcst = HARMONIZERS[source](df)
+    # overlapping monthly chunks can carry the same issuance twice
+    return fcst.drop_duplicates(subset=PAIR_KEYS, keep="last")
+
+
+def read_obs(obs_dir, start, end, stations=None):
+    extra = qc_filter()
+    if stations is not None:
+        extra = extra & ds.field("stid").isin(list(stations))
+    obs = scan_parquet(obs_dir, "timestamp", start, end, extra_filter=extra,
+                       columns=["stid", "timestamp", "wind_speed", "wind_direction", "wind_gust"])
+    if obs is None:
+        return pd.DataFrame(columns=["stid", "timestamp", "wind_speed", "wind_direction", "wind_gust"])
+    obs["stid"] = normalize_stid(obs["stid"])
+    return obs
+
+
+def pair_forecasts(fcst, obs, tolerance=config.PAIR_TOLERANCE, source=""):
+    """Match each forecast row to the nearest obs of the same station within tolerance."""
+    fcst = fcst.dropna(subset=["valid_time"]).sort_values("valid_time", kind="stable")
+    fcst["valid_time"] = fcst["valid_time"].astype("datetime64[ns, UTC]")
+    obs = obs.rename(columns={
+        "wind_speed": "obs_speed_kt", "wind_direction": "obs_dir_deg", "wind_gust": "obs_gust_kt",
+    })
+    obs = obs.assign(obs_time=pd.to_datetime(obs["timestamp"], utc=True).astype("datetime64[ns, UTC]")).drop(columns="timestamp")
+    obs = obs.dropna(subset=["obs_time"]).sort_values("obs_time", kind="stable")
+    paired = pd.merge_asof(
+        fcst, obs,
+        left_on="valid_time", right_on="obs_time",
+        by="stid", direction="nearest",
+        tolerance=pd.Timedelta(tolerance),
+    )
+    paired.insert(0, "source", source)
+    return paired[PAIRED_SCHEMA.names]
+
+
+def paired_partition_path(paired_dir, source, year, month):
+    return os.path.join(paired_dir, f"source={source}", f"year={year}", f"month={month}", "part-0.parquet")
+
+
+def pair_month(source, month, obs_dir=config.OBS_ARCHIVE_DIR, paired_dir=config.PAIRED_DIR, tolerance=config.PAIR_TOLERANCE):
+    """Pair every forecast valid in one month and rewrite that month's partition."""
+    start = month.start_time
+    end = (month + 1).start_time
+    fcst = read_forecasts(source, start, end)
+    if fcst.empty:
+        print(f"⚠️ No {source} forecasts valid in {month} — skipping.")
+        return 0
+    margin = pd.Timedelta(tolerance)
+    obs = read_obs(obs_dir, start - margin, end + margin, stations=fcst["stid"].unique())
+    paired = pair_forecasts(fcst, obs, tolerance, source)
+    outfile = paired_partition_path(paired_dir, source, month.year, month.month)
+    os.makedirs(os.path.dirname(outfile), exist_ok=True)
+    # source/year/month live in the partition path rather than the file
+    file_schema = PAIRED_SCHEMA.remove(PAIRED_SCHEMA.get_field_index("source"))
+    table = pa.Table.from_pandas(paired[file_schema.names], schema=file_schema, preserve_index=False)
+    tmpfile = f"{outfile}.tmp"
+    pq.write_table(table, tmpfile, compression="zstd")
+    os.replace(tmpfile, outfile)
+    matched = int(paired["obs_time"].notna().sum())
+    print(f"✅ Paired {source} {month}: {matched}/{len(paired)} forecasts matched an obs.")
+    return len(paired)
+
+
+def pair_archive(source, start, end, workers=config.PAIR_WORKERS, **kwargs):
+    """Pair all valid months in start..end, a few months at a time."""
+    months = pd.period_range(pd.Timestamp(start).to_period("M"), pd.Timestamp(end).to_period("M"), freq="M")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        rows = list(executor.map(lambda m: pair_month(source, m, **kwargs), months))
+    return sum(rows)
+
+
+def read_pairs(paired_dir=config.PAIRED_DIR, source=None, start=None, end=None):
+    """Read paired rows, pushing source and valid-time bounds into the partition scan."""
+    filters = []
+    if source is not None:
+        filters.append(("source", "=", source))
+    if start is not None:
+        filters.append(("valid_time", ">=", time_bound(pa.timestamp("ns", tz="UTC"), start)))
+    if end is not None:
+        filters.append(("valid_time", "<", time_bound(pa.timestamp("ns", tz="UTC"), end)))
+    return pq.read_table(paired_dir, filters=filters or None, partitioning="hive").to_pandas()
+
+
+if __name__ == "__main__":
+    start = pd.to_datetime(config.OBS_START, format="%Y%m%d%H%M")
+    end = pd.to_datetime(config.OBS_END, format="%Y%m%d%H%M")
+    for source in config.FORECAST_ARCHIVES:
+        print(f"🔗 Pairing {source} forecasts with obs from {start} to {end}")
+        rows = pair_archive(source, start, end)
+        print(f"✅ Wrote {rows} paired {source} rows to {config.PAIRED_DIR}")
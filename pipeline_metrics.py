@@ -0,0 +1,297 @@
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import signal
+import argparse
+import resource
+import threading
+import contextlib
+import subprocess
+from collections import defaultdict
+import wind_config as config
+
+"""
+Run instrumentation for the archive, obs and plotting entry points. A run() opens a
+JSON-lines event file; span(stage) records wall and thread CPU time, peak RSS and errors
+for a block, and count(name, n, **labels) tallies bytes, rows, cache hits, retries and
+failures. Events are appended with single O_APPEND writes, so pool workers (which inherit
+the run through the environment) write to the same file. When the run ends a per-stage
+summary is printed and written as a Prometheus textfile.
+
+    with run("ndfd_archive"):
+        with span("fetch", file=name):
+            ...
+            count("bytes_fetched", nbytes)
+
+    python pipeline_metrics.py summary ~/metrics/ndfd_archive_<run>.jsonl
+    PIPELINE_PROFILE=decode python create_ndfd_archive.py   # cProfile each decode span
+"""
+
+ENV_FILE = "PIPELINE_METRICS_FILE"
+ENV_RUN = "PIPELINE_RUN_ID"
+ENV_JOB = "PIPELINE_JOB"
+
+_lock = threading.Lock()
+_local = threading.local()
+_state = {"pid": None, "fd": None, "path": None, "counters": defaultdict(float), "profiles": defaultdict(int)}
+
+
+def _process_state():
+    # forked workers inherit the parent's unflushed counters; start them from zero
+    if _state["pid"] != os.getpid():
+        _state.update(pid=os.getpid(), fd=None, path=None, counters=defaultdict(float), profiles=defaultdict(int))
+    return _state
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def emit(event):
+    """Append one event line to the current run's file; a no-op outside a run."""
+    path = os.environ.get(ENV_FILE)
+    if not path:
+        return
+    event = {"ts": round(time.time(), 3), "run": os.environ.get(ENV_RUN), "job": os.environ.get(ENV_JOB),
+             "pid": os.getpid(), **event}
+    line = (json.dumps(event, default=str, separators=(",", ":")) + "\n").encode()
+    with _lock:
+        state = _process_state()
+        if state["path"] != path:
+            if state["fd"] is not None:
+                os.close(state["fd"])
+            state.update(fd=os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644), path=path)
+        os.write(state["fd"], line)
+
+
+def count(name, value=1, **labels):
+    """Add to a counter; flushed with the next outermost span or at the end of the run."""
+    key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+    with _lock:
+        _process_state()["counters"][key] += value
+
+
+def flush_counters():
+    with _lock:
+        state = _process_state()
+        counters, state["counters"] = state["counters"], defaultdict(float)
+    if counters:
+        emit({"event": "counters", "counters": [{"name": name, "labels": dict(labels), "value": value}
+                                                 for (name, labels), value in counters.items()]})
+
+
+def _stack():
+    # a worker forked from inside a span must not inherit the parent's open spans
+    if getattr(_local, "pid", None) != os.getpid():
+        _local.stack, _local.pid = [], os.getpid()
+    return _local.stack
+
+
+@contextlib.contextmanager
+def profiled(stage):
+    """Profile the block when stage is config.PROFILE_STAGE, up to config.PROFILE_LIMIT times per process."""
+    with _lock:
+        n = _process_state()["profiles"][stage]
+        wanted = stage == config.PROFILE_STAGE and n < config.PROFILE_LIMIT
+        if wanted:
+            _state["profiles"][stage] += 1
+    if not wanted:
+        yield
+        return
+    os.makedirs(config.METRICS_DIR, exist_ok=True)
+    base = os.path.join(config.METRICS_DIR, f"{os.environ.get(ENV_RUN, 'adhoc')}_{stage}_{os.getpid()}_{n}")
+    if config.PROFILER == "py-spy" and shutil.which("py-spy"):
+        # py-spy samples this process from outside and writes the flamegraph on SIGINT
+        proc = subprocess.Popen(["py-spy", "record", "--pid", str(os.getpid()), "--output", f"{base}.svg", "--nonblocking"],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            yield
+        finally:
+            proc.send_signal(signal.SIGINT)
+            proc.wait(timeout=30)
+        return
+    import cProfile
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(f"{base}.prof")
+
+
+@contextlib.contextmanager
+def span(stage, **attrs):
+    """
+    Time a pipeline stage. Nested spans record their parent path; extra keyword
+    arguments (file, stid, month, ...) are stored with the event.
+    """
+    stack = _stack()
+    stack.append(stage)
+    t0, c0, rss0 = time.perf_counter(), time.thread_time(), peak_rss_mb()
+    status, error = "ok", None
+    try:
+        with profiled(stage):
+            yield
+    except BaseException as e:
+        status, error = "error", type(e).__name__
+        raise
+    finally:
+        rss = peak_rss_mb()
+        emit({"event": "span", "stage": stage, "path": "/".join(stack),
+              "wall_s": round(time.perf_counter() - t0, 4), "cpu_s": round(time.thread_time() - c0, 4),
+              "peak_rss_mb": round(rss, 1), "rss_growth_mb": round(rss - rss0, 1),
+              "status": status, "error": error, **attrs})
+        stack.pop()
+        if not stack:
+            flush_counters()
+
+
+def fail(category, **labels):
+    """Count a failure under a coarse category (http_429, timeout, decode, missing_file, ...)."""
+    count("failures", 1, category=category, **labels)
+
+
+@contextlib.contextmanager
+def run(job, metrics_dir=None):
+    """
+    Open a metrics run for an entry point. Workers started inside the block inherit
+    the run through the environment; nested run() calls join the outer one.
+    """
+    if os.environ.get(ENV_FILE):
+        with span(job):
+            yield os.environ[ENV_FILE]
+        return
+    metrics_dir = metrics_dir or config.METRICS_DIR
+    os.makedirs(metrics_dir, exist_ok=True)
+    run_id = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}_{uuid.uuid4().hex[:6]}"
+    path = os.path.join(metrics_dir, f"{job}_{run_id}.jsonl")
+    os.environ.update({ENV_FILE: path, ENV_RUN: run_id, ENV_JOB: job})
+    emit({"event": "run_start", "argv": sys.argv})
+    status = "ok"
+    t0 = time.perf_counter()
+    try:
+        with span(job):
+            yield path
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        flush_counters()
+        emit({"event": "run_end", "status": status, "wall_s": round(time.perf_counter() - t0, 3),
+              "peak_rss_mb": round(peak_rss_mb(), 1)})
+        for key in (ENV_FILE, ENV_RUN, ENV_JOB):
+            os.environ.pop(key, None)
+        summary = summarize(path)
+        print_summary(summary)
+        write_textfile(summary)
+
+
+def read_events(path):
+    with open(path) as f:
+        for line in f:
+            # a worker killed mid-write can leave a partial last line
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def summarize(path):
+    """Fold a run's events into per-stage totals and summed counters."""
+    stages = defaultdict(lambda: {"count": 0, "errors": 0, "wall_s": 0.0, "cpu_s": 0.0, "max_wall_s": 0.0, "peak_rss_mb": 0.0})
+    counters = defaultdict(float)
+    summary = {"path": path, "job": None, "run": None, "status": None, "wall_s": None, "peak_rss_mb": 0.0}
+    for e in read_events(path):
+        summary["job"], summary["run"] = e.get("job"), e.get("run")
+        if e["event"] == "span":
+            s = stages[e["stage"]]
+            s["count"] += 1
+            s["errors"] += e["status"] != "ok"
+            s["wall_s"] += e["wall_s"]
+            s["cpu_s"] += e["cpu_s"]
+            s["max_wall_s"] = max(s["max_wall_s"], e["wall_s"])
+            s["peak_rss_mb"] = max(s["peak_rss_mb"], e["peak_rss_mb"])
+            summary["peak_rss_mb"] = max(summary["peak_rss_mb"], e["peak_rss_mb"])
+        elif e["event"] == "counters":
+            for c in e["counters"]:
+                counters[(c["name"], tuple(sorted(c["labels"].items())))] += c["value"]
+        elif e["event"] == "run_end":
+            summary.update(status=e["status"], wall_s=e["wall_s"])
+    summary["stages"] = dict(stages)
+    summary["counters"] = [{"name": n, "labels": dict(l), "value": v} for (n, l), v in sorted(counters.items())]
+    return summary
+
+
+def print_summary(summary):
+    print(f"⏱️ {summary['job']} run {summary['run']}: {summary['wall_s']}s, peak RSS {summary['peak_rss_mb']:.0f} MB "
+          f"({summary['status']})")
+    print(f"{'stage':<24}{'spans':>8}{'errors':>8}{'wall s':>10}{'cpu s':>10}{'max s':>9}{'rss MB':>9}")
+    for stage, s in sorted(summary["stages"].items(), key=lambda kv: -kv[1]["wall_s"]):
+        print(f"{stage:<24}{s['count']:>8}{s['errors']:>8}{s['wall_s']:>10.2f}{s['cpu_s']:>10.2f}"
+              f"{s['max_wall_s']:>9.2f}{s['peak_rss_mb']:>9.0f}")
+    for c in summary["counters"]:
+        labels = ",".join(f"{k}={v}" for k, v in c["labels"].items())
+        print(f"  {c['name']}{'{' + labels + '}' if labels else ''} = {c['value']:,.0f}")
+
+
+def prom_labels(**labels):
+    return "{" + ",".join(f'{k}="{str(v).replace(chr(34), "")}"' for k, v in labels.items()) + "}"
+
+
+def write_textfile(summary, textfile_dir=None):
+    """Write the run summary in Prometheus text format, swapped in atomically for the collector."""
+    textfile_dir = textfile_dir or config.METRICS_TEXTFILE_DIR
+    os.makedirs(textfile_dir, exist_ok=True)
+    job = summary["job"]
+    lines = [
+        "# TYPE wind_pipeline_last_run_timestamp_seconds gauge",
+        f"wind_pipeline_last_run_timestamp_seconds{prom_labels(job=job)} {time.time():.0f}",
+        "# TYPE wind_pipeline_last_run_success gauge",
+        f"wind_pipeline_last_run_success{prom_labels(job=job)} {int(summary['status'] == 'ok')}",
+        "# TYPE wind_pipeline_run_seconds gauge",
+        f"wind_pipeline_run_seconds{prom_labels(job=job)} {summary['wall_s'] or 0}",
+        "# TYPE wind_pipeline_peak_rss_bytes gauge",
+        f"wind_pipeline_peak_rss_bytes{prom_labels(job=job)} {summary['peak_rss_mb'] * 2**20:.0f}",
+        "# TYPE wind_pipeline_stage_seconds summary",
+    ]
+    for stage, s in summary["stages"].items():
+        lines.append(f"wind_pipeline_stage_seconds_sum{prom_labels(job=job, stage=stage)} {s['wall_s']:.3f}")
+        lines.append(f"wind_pipeline_stage_seconds_count{prom_labels(job=job, stage=stage)} {s['count']}")
+    lines.append("# TYPE wind_pipeline_stage_errors gauge")
+    for stage, s in summary["stages"].items():
+        lines.append(f"wind_pipeline_stage_errors{prom_labels(job=job, stage=stage)} {s['errors']}")
+    names = sorted({c["name"] for c in summary["counters"]})
+    for name in names:
+        lines.append(f"# TYPE wind_pipeline_{name} gauge")
+        for c in summary["counters"]:
+            if c["name"] == name:
+                lines.append(f"wind_pipeline_{name}{prom_labels(job=job, **c['labels'])} {c['value']:g}")
+    path = os.path.join(textfile_dir, f"wind_pipeline_{job}.prom")
+    with open(f"{path}.tmp", "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(f"{path}.tmp", path)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize a pipeline metrics run.")
+    parser.add_argument("command", choices=["summary", "textfile"])
+    parser.add_argument("path", help="run .jsonl file")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args(argv)
+    summary = summarize(args.path)
+    if args.command == "textfile":
+        print(write_textfile(summary))
+    elif args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_summary(summary)
+
+
+if __name__ == "__main__":
+    main()
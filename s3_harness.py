@@ -0,0 +1,244 @@
+import os
+import glob
+import time
+import shutil
+import socket
+import logging
+import argparse
+import tempfile
+import subprocess
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import wind_config as config
+from storage import s3_filesystem, put_bytes, get_bytes
+
+"""
+Local S3 stand-in for end-to-end pipeline runs. LocalS3 starts a moto server (or a MinIO
+binary when one is on PATH and backend="minio"), points config.S3_ENDPOINT_URL and the
+AWS_* environment at it, and creates the buckets the pipelines use. seed() uploads the
+make_fixtures tree into the same keys the public NOAA buckets use, so the real code paths
+run offline against it.
+
+    python s3_harness.py serve --fixtures fixtures         # print env exports, keep running
+    python s3_harness.py e2e --fixtures fixtures           # list -> decode -> write -> query NDFD
+    python s3_harness.py writers -n 16                     # concurrent Parquet writers
+    python s3_harness.py multipart --size-mb 256           # multipart upload throughput
+"""
+
+STAND_IN_CREDENTIALS = {"AWS_ACCESS_KEY_ID": "harness", "AWS_SECRET_ACCESS_KEY": "harness-secret"}
+
+NBM_BUCKET = "noaa-nbm-grib2-pds"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def pipeline_buckets():
+    return sorted({urlparse(config.NDFD_SOURCE_URL).netloc, urlparse(config.NDFD_S3_URL).netloc, NBM_BUCKET})
+
+
+class LocalS3:
+    """Context manager running an S3-compatible endpoint for this process and its children."""
+
+    def __init__(self, backend="moto", port=None, data_dir=None):
+        self.backend = backend
+        self.port = port or free_port()
+        self.data_dir = data_dir
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._server = None
+        self._saved = {}
+        self._own_data_dir = False
+
+    def __enter__(self):
+        if self.backend == "minio":
+            if not shutil.which("minio"):
+                raise RuntimeError("backend='minio' needs the minio binary on PATH")
+            if not self.data_dir:
+                # a throwaway store, removed again in __exit__
+                self.data_dir, self._own_data_dir = tempfile.mkdtemp(prefix="minio_"), True
+            env = dict(os.environ, MINIO_ROOT_USER=STAND_IN_CREDENTIALS["AWS_ACCESS_KEY_ID"],
+                       MINIO_ROOT_PASSWORD=STAND_IN_CREDENTIALS["AWS_SECRET_ACCESS_KEY"])
+            self._server = subprocess.Popen(["minio", "server", self.data_dir, "--address", f"127.0.0.1:{self.port}", "--quiet"],
+                                            env=env, stdout=subprocess.DEVNULL)
+        else:
+            from moto.server import ThreadedMotoServer
+            logging.getLogger("werkzeug").setLevel(logging.ERROR)
+            self._server = ThreadedMotoServer(ip_address="127.0.0.1", port=self.port, verbose=False)
+            self._server.start()
+
+        env = dict(STAND_IN_CREDENTIALS, S3_ENDPOINT_URL=self.url, AWS_DEFAULT_REGION=config.AWS_REGION)
+        self._saved = {k: os.environ.get(k) for k in env}
+        os.environ.update(env)
+        self._saved_endpoint = config.S3_ENDPOINT_URL
+        config.S3_ENDPOINT_URL = self.url
+        self.wait_ready()
+        fs = self.fs()
+        for bucket in pipeline_buckets():
+            if not fs.exists(bucket):
+                fs.mkdir(bucket)
+        return self
+
+    def __exit__(self, *exc):
+        if self.backend == "minio":
+            self._server.terminate()
+            self._server.wait()
+            if self._own_data_dir:
+                shutil.rmtree(self.data_dir, ignore_errors=True)
+                self.data_dir, self._own_data_dir = None, False
+        else:
+            self._server.stop()
+        config.S3_ENDPOINT_URL = self._saved_endpoint
+        for k, v in self._saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+    def fs(self):
+        # storage pools clients per endpoint, so this is the stand-in's client
+        return s3_filesystem()
+
+    def wait_ready(self, timeout=30):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                with socket.create_connection(("127.0.0.1", self.port), timeout=1):
+                    return
+            except OSError:
+                time.sleep(0.2)
+        raise RuntimeError(f"S3 stand-in did not come up on {self.url}")
+
+    def seed(self, fixtures_dir=config.BENCH_FIXTURES_DIR):
+        """Upload the make_fixtures GRIB trees to the keys the public buckets use."""
+        fs = self.fs()
+        sources = {
+            os.path.join(fixtures_dir, "ndfd", "wmo"): config.NDFD_SOURCE_URL.replace("s3://", ""),
+            os.path.join(fixtures_dir, "nbm"): NBM_BUCKET,
+        }
+        uploads = []
+        for local_root, remote_root in sources.items():
+            for path in glob.glob(os.path.join(local_root, "**", "*"), recursive=True):
+                if os.path.isfile(path):
+                    uploads.append((path, f"{remote_root}/{os.path.relpath(path, local_root)}"))
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            list(executor.map(lambda pair: fs.put_file(*pair), uploads))
+        nbytes = sum(os.path.getsize(p) for p, _ in uploads)
+        print(f"✅ Seeded {len(uploads)} objects ({nbytes / 2**20:.1f} MB) in {time.perf_counter() - t0:.1f}s")
+        return len(uploads)
+
+
+def timed(label, fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    out = fn(*args, **kwargs)
+    print(f"⏱️ {label}: {time.perf_counter() - t0:.2f}s")
+    return out
+
+
+def run_e2e(fixtures_dir):
+    """NDFD list -> fetch/decode/extract -> monthly Parquet write -> query, all through the endpoint."""
+    from create_ndfd_archive import get_ndfd_file_list, extract_ndfd_forecasts_parallel, extract_timestamp, write_to_s3
+    from archive_query import get_series
+    stations = pd.read_csv(os.path.join(fixtures_dir, "stations.csv"))
+    stamps = [extract_timestamp(f) for f in glob.glob(os.path.join(fixtures_dir, "ndfd", "wmo", "wspd", "*", "*", "*", "*"))]
+    start, end = pd.Timestamp(min(stamps)).floor("D"), pd.Timestamp(max(stamps)).ceil("D")
+    speed_key, dir_key, _ = config.NDFD_FILE_STRINGS[config.ELEMENT]
+
+    files = timed("list", get_ndfd_file_list, start.strftime("%Y%m%d%H%M"), end.strftime("%Y%m%d%H%M"), config.NDFD_DICT)
+    with tempfile.TemporaryDirectory(prefix="ndfd_cache_") as cache_dir:
+        df = timed("fetch+decode+extract", extract_ndfd_forecasts_parallel, files[speed_key], files.get(dir_key, []), stations,
+                   cache_dir)
+    month = pd.Timestamp(max(stamps)) + pd.Timedelta(hours=1)
+    url = config.NDFD_S3_URL + config.NDFD_ARCHIVE_FILE.format(year=month.year, month=month.month)
+    timed("write", write_to_s3, df, url)
+    series = timed("query", get_series, "ndfd", list(stations.stid[:5]), start, end + pd.Timedelta(days=8))
+    print(f"✅ e2e: {len(df)} forecast rows archived, {len(series)} read back for 5 stations")
+    return df, series
+
+
+def run_writers(n, rows=200_000):
+    """n threads writing Parquet at once: distinct keys, then all on one key (last writer wins)."""
+    from create_ndfd_archive import write_to_s3
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "station_id": np.repeat([f"W{i:04d}" for i in range(rows // 100)], 100),
+        "valid_time": pd.Timestamp("2021-01-01") + pd.to_timedelta(np.tile(np.arange(100), rows // 100), unit="h"),
+        "forecast_hour": np.tile(np.arange(100), rows // 100),
+        "wind_speed_kt": rng.gamma(2, 5, rows),
+        "wind_dir_deg": rng.uniform(0, 360, rows).round(),
+    })
+    bucket = urlparse(config.NDFD_S3_URL).netloc
+    for label, keys in [("distinct keys", [f"s3://{bucket}/harness/writer_{i}.parquet" for i in range(n)]),
+                        ("same key", [f"s3://{bucket}/harness/shared.parquet"] * n)]:
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=n) as executor:
+            list(executor.map(lambda key: write_to_s3(df, key), keys))
+        wall = time.perf_counter() - t0
+        fs = s3_filesystem()
+        with fs.open(keys[0], "rb") as f:
+            intact = len(pd.read_parquet(f)) == len(df)
+        print(f"{'✅' if intact else '❌'} {n} writers, {label}: {wall:.2f}s, {n * len(df) / wall:,.0f} rows/s, object intact={intact}")
+
+
+def run_multipart(size_mb, block_mb):
+    """A streamed upload (one part at a time) against storage.put_bytes/get_bytes (parts in parallel)."""
+    fs = s3_filesystem()
+    bucket = urlparse(config.NDFD_S3_URL).netloc
+    key = f"{bucket}/harness/multipart.bin"
+    chunk = np.random.default_rng(0).bytes(2**20)
+    t0 = time.perf_counter()
+    with fs.open(key, "wb", block_size=block_mb * 2**20) as f:
+        for _ in range(size_mb):
+            f.write(chunk)
+    wall = time.perf_counter() - t0
+    info = fs.info(key)
+    print(f"✅ streamed multipart: {size_mb} MB in {wall:.2f}s ({size_mb / wall:.1f} MB/s), "
+          f"size ok={info['size'] == size_mb * 2**20}, etag={info.get('ETag')}")
+
+    data = chunk * size_mb
+    t0 = time.perf_counter()
+    put_bytes(f"s3://{key}", data)
+    wall = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    same = get_bytes(f"s3://{key}") == data
+    read = time.perf_counter() - t0
+    print(f"✅ parallel multipart: {size_mb} MB up in {wall:.2f}s ({size_mb / wall:.1f} MB/s), "
+          f"down in {read:.2f}s ({size_mb / read:.1f} MB/s), round trip ok={same}, etag={fs.info(key).get('ETag')}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run pipeline storage against a local S3 stand-in.")
+    parser.add_argument("command", choices=["serve", "e2e", "writers", "multipart"])
+    parser.add_argument("--backend", choices=["moto", "minio"], default="moto")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--fixtures", default=config.BENCH_FIXTURES_DIR)
+    parser.add_argument("-n", "--writers", type=int, default=8)
+    parser.add_argument("--size-mb", type=int, default=64)
+    parser.add_argument("--block-mb", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    with LocalS3(args.backend, args.port) as s3:
+        if args.command in ("serve", "e2e") and os.path.isdir(args.fixtures):
+            s3.seed(args.fixtures)
+        if args.command == "serve":
+            print(f"export S3_ENDPOINT_URL={s3.url} " + " ".join(f"{k}={v}" for k, v in STAND_IN_CREDENTIALS.items()))
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                pass
+        elif args.command == "e2e":
+            run_e2e(args.fixtures)
+        elif args.command == "writers":
+            run_writers(args.writers)
+        else:
+            run_multipart(args.size_mb, args.block_mb)
+
+
+if __name__ == "__main__":
+    main()
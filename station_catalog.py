@@ -0,0 +1,161 @@
+import os
+import time
+import requests
+import numpy as np
+import pandas as pd
+import wind_config as config
+
+"""
+Shared station catalog for the archive pipelines. Station metadata from the Synoptic
+metadata endpoint is cached as a small Parquet file and refreshed incrementally once it is
+older than config.STATION_CATALOG_TTL_HOURS. Rows are stored sorted by a lat/lon grid cell
+id, which acts as the spatial index for bbox and radius lookups via searchsorted.
+"""
+
+CATALOG_COLUMNS = ["stid", "name", "latitude", "longitude", "elevation", "last_seen", "cell"]
+
+EARTH_RADIUS_KM = 6371.0
+
+# in-process cache so repeated loads within a run skip the Parquet read
+_catalog_cache = {}
+
+
+def fetch_metadata(url, token, state, networks, vars, obrange):
+    """Request station metadata from Synoptic for the stations reporting in obrange."""
+    params = {
+        "token": token,
+        "vars": vars,  # Variables to retrieve
+        "obrange": obrange,
+        "network": networks,
+        "state": state,
+        "output": "json"           # Output format
+    }
+    response = requests.get(url, params=params, timeout=30)
+    response.raise_for_status()
+    return response.json()
+
+
+def parse_metadata(data):
+    stations = data.get("STATION", [])
+    meta_df = pd.DataFrame({
+        "stid": [stn["STID"] for stn in stations],
+        "name": [stn["NAME"] for stn in stations],
+        "latitude": pd.to_numeric([stn["LATITUDE"] for stn in stations], errors="coerce"),
+        "longitude": pd.to_numeric([stn["LONGITUDE"] for stn in stations], errors="coerce"),
+        "elevation": pd.to_numeric([stn["ELEVATION"] for stn in stations], errors="coerce"),
+    })
+    return meta_df.dropna(subset=["latitude", "longitude"])
+
+
+def grid_cell(lat, lon, res=config.SPATIAL_INDEX_RES_DEG):
+    """Map lat/lon to an integer grid cell id (row-major, longitude wrapped to [-180, 180))."""
+    ncols = int(np.ceil(360 / res))
+    lon = (np.asarray(lon, dtype="float64") + 180) % 360 - 180
+    row = np.floor((np.asarray(lat, dtype="float64") + 90) / res).astype("int64")
+    col = np.floor((lon + 180) / res).astype("int64")
+    return row * ncols + col
+
+
+def build_index(meta_df, res=config.SPATIAL_INDEX_RES_DEG):
+    meta_df = meta_df.copy()
+    meta_df["cell"] = grid_cell(meta_df["latitude"].values, meta_df["longitude"].values, res)
+    return meta_df.sort_values(["cell", "stid"]).reset_index(drop=True)
+
+
+def catalog_path():
+    return os.path.join(config.OBS, config.STATION_CATALOG)
+
+
+def refresh_station_catalog(path=None, full=False):
+    """
+    Pull metadata from Synoptic and upsert it into the cached catalog. Incremental refreshes
+    only ask for stations reporting since the last refresh; stations that stop reporting are
+    kept with their last_seen time.
+    """
+    path = path or catalog_path()
+    now = pd.Timestamp.now(tz="UTC").floor("min")
+    existing = None
+    obrange = config.OBS_START
+    if os.path.exists(path) and not full:
+        existing = pd.read_parquet(path)
+        if len(existing):
+            obrange = f"{existing['last_seen'].max():%Y%m%d%H%M},{now:%Y%m%d%H%M}"
+
+    print(f"Refreshing station catalog from {config.METADATA_URL} (obrange={obrange})")
+    meta_json = fetch_metadata(config.METADATA_URL, config.API_KEY, config.STATE, config.NETWORK, config.WIND_VARS, obrange)
+    meta_df = parse_metadata(meta_json)
+    meta_df["last_seen"] = now
+    if existing is not None:
+        meta_df = pd.concat([existing.drop(columns="cell"), meta_df], ignore_index=True)
+        meta_df = meta_df.drop_duplicates(subset="stid", keep="last")
+
+    catalog = build_index(meta_df)[CATALOG_COLUMNS]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmpfile = f"{path}.tmp"
+    catalog.to_parquet(tmpfile, index=False)
+    os.replace(tmpfile, path)
+    print(f"✅ Station catalog has {len(catalog)} stations. Saved to {path}.")
+    return catalog
+
+
+def load_station_catalog(max_age_hours=config.STATION_CATALOG_TTL_HOURS, path=None):
+    """Return the station catalog, refreshing it first if it is missing or older than the TTL."""
+    path = path or catalog_path()
+    if not os.path.exists(path) or (time.time() - os.path.getmtime(path)) > max_age_hours * 3600:
+        try:
+            refresh_station_catalog(path)
+        except requests.RequestException as e:
+            if not os.path.exists(path):
+                raise
+            print(f"⚠️ Could not refresh station catalog, using cached copy: {e}")
+
+    key = (path, os.path.getmtime(path))
+    if key not in _catalog_cache:
+        _catalog_cache.clear()
+        _catalog_cache[key] = pd.read_parquet(path)
+    return _catalog_cache[key]
+
+
+def stations_in_group(catalog, group):
+    """Return catalog rows for a named station group from config.STATION_GROUPS."""
+    members = config.STATION_GROUPS[group]
+    return catalog[catalog["stid"].isin(members)]
+
+
+def stations_in_bbox(catalog, lat_min, lat_max, lon_min, lon_max, res=config.SPATIAL_INDEX_RES_DEG):
+    """Return stations inside a lat/lon box. lon_min > lon_max wraps across the antimeridian."""
+    ncols = int(np.ceil(360 / res))
+    cells = catalog["cell"].values
+    lon_min = (lon_min + 180) % 360 - 180
+    lon_max = (lon_max + 180) % 360 - 180
+    col_spans = [(lon_min, lon_max)] if lon_min <= lon_max else [(lon_min, 180 - 1e-9), (-180, lon_max)]
+    row_lo, row_hi = grid_cell(lat_min, -180, res) // ncols, grid_cell(lat_max, -180, res) // ncols
+    picks = []
+    # each grid row is one contiguous block of cell ids, so every row is a single searchsorted slice
+    for row in range(int(row_lo), int(row_hi) + 1):
+        for west, east in col_spans:
+            lo = row * ncols + int(np.floor((west + 180) / res))
+            hi = row * ncols + int(np.floor((east + 180) / res))
+            i0 = np.searchsorted(cells, lo, side="left")
+            i1 = np.searchsorted(cells, hi, side="right")
+            if i1 > i0:
+                picks.append(np.arange(i0, i1))
+    if not picks:
+        return catalog.iloc[0:0]
+    subset = catalog.iloc[np.concatenate(picks)]
+    lon = (subset["longitude"] + 180) % 360 - 180
+    in_lon = (lon >= lon_min) & (lon <= lon_max) if lon_min <= lon_max else (lon >= lon_min) | (lon <= lon_max)
+    return subset[(subset["latitude"] >= lat_min) & (subset["latitude"] <= lat_max) & in_lon]
+
+
+def stations_near(catalog, lat, lon, radius_km):
+    """Return stations within radius_km of a point, nearest first, with a distance_km column."""
+    dlat = np.degrees(radius_km / EARTH_RADIUS_KM)
+    dlon = min(180.0, dlat / max(np.cos(np.radians(min(abs(lat) + dlat, 89.9))), 1e-6))
+    candidates = stations_in_bbox(catalog, lat - dlat, lat + dlat, lon - dlon, lon + dlon).copy()
+    phi1, phi2 = np.radians(lat), np.radians(candidates["latitude"].values)
+    dphi = phi2 - phi1
+    dlmb = np.radians(candidates["longitude"].values - lon)
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlmb / 2) ** 2
+    candidates["distance_km"] = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+    return candidates[candidates["distance_km"] <= radius_km].sort_values("distance_km")
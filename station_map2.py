@@ -1,46 +1,128 @@
-import synoptic
-import xarray as xr
+import os
+import json
 import pandas as pd
 import folium
-from folium import IFrame
-import base64
-
-'''
-allSites=['PAAQ','PANC','PAFR','ARCA2','PHMA2','AYSA2','PATO','NDBCPPXA2',
-'NDBCWIXA2','NDBCPOTA2','RHRA2','MCPA2','NDBCAMAA2','ACRA2','PABI','AFTA2',
-'SRFA2','PAYA','PAGY','NDBCCSPA2','NDBCRIXA2','NDBCSISA2','NDBDPRTA2',
-'NDBCLIXA2','NDBCERXA2','NDBCMRNA2','NDBCPRBA2','NDBCMIXA2','TRMA2','JMLA2',
-'PAJN','NDBCPXGA2','PAMD','NDBCLCNA2','NDBCCDXA2','NDBCSPXA2','NDBCCDXA2',
-'PASI','PAOM','PADU','PASN','PACD']
-
-end=pd.Timestamp(f'{pd.Timestamp.now():%Y%m%d}')
-start=end-pd.Timedelta('7d')
-
-df = synoptic.TimeSeries(
-	stid=allSites,
-	start=start,
-	end=end,
-	vars="wind_speed,wind_direction,wind_gust",
-	units='metric',
-	verbose=False,
-	).df()
-	
-obs=df.to_pandas()
-obs.set_index('date_time',inplace=True)
-stn=df['stid','latitude','longitude'].unique().to_pandas()
-'''
-
-m = folium.Map(center=(65, -150))
-Filename ='test_pic.png'
-encoded = base64.b64encode(open(Filename, 'rb').read())
-html='<img src="data:image/png;base64,{}">'.format
-resolution, width, height = 75, 50, 25
-iframe = IFrame(html(encoded.decode('UTF-8')), width=(width*resolution)+20, height=(height*resolution)+20)
-popup = folium.Popup(iframe, max_width=100)
-icon = folium.Icon(color="red", icon="ok")
-marker = folium.Marker(location=[37.426, -122.085], popup=popup, icon=icon)
-marker.add_to(m)
-
-
-m.save('/var/www/html/verification/test.html')
-	
+from folium.plugins import MarkerCluster
+from branca.element import MacroElement
+from jinja2 import Template
+from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+from station_catalog import load_station_catalog
+
+"""
+Station map with lazily loaded popups. Markers come from one compact GeoJSON file and are
+clustered; a popup's <img> tags are only built when its marker is opened, and they point
+at small thumbnails that link to the full-size plots published by stn_wind_plots.
+"""
+
+mapDir='/var/www/html/verification'
+imageDir=f'{mapDir}/images'
+thumbDir=f'{mapDir}/thumbs'
+
+models=['hrrrak','nbm','urma_ak','rtma_ak','gfs']
+params=['wind_speed','wind_direction','wind_gust']
+thumbSize=(240,160)
+
+#---------------------------------------------------------
+def station_images(image_dir):
+	# station -> model -> image files, from the fingerprint manifest published
+	# alongside the plots
+	with open(f'{image_dir}/fingerprints.json') as f:
+		manifest=json.load(f)
+	images={}
+	for key,entry in manifest.items():
+		# model names contain underscores, so match the known suffixes
+		model=next((m for m in models if key.endswith(f'_{m}')),None)
+		if model:
+			images.setdefault(key[:-len(model)-1],{})[model]=entry['files']
+	return images
+
+#---------------------------------------------------------
+def make_thumbnail(src,dst,size=thumbSize):
+	# skip thumbnails that are newer than their plot; unchanged plots are
+	# hardlinked between published versions so their mtime does not move
+	if os.path.exists(dst) and os.path.getmtime(dst)>=os.path.getmtime(src):
+		return False
+	with Image.open(src) as im:
+		im.thumbnail(size)
+		im.convert('P',palette=Image.ADAPTIVE).save(f'{dst}.tmp.png',optimize=True)
+	os.replace(f'{dst}.tmp.png',dst)
+	return True
+
+def make_thumbnails(images,image_dir,thumb_dir):
+	os.makedirs(thumb_dir,exist_ok=True)
+	files=[f for by_model in images.values() for fs in by_model.values() for f in fs]
+	with ThreadPoolExecutor(max_workers=8) as executor:
+		made=sum(executor.map(lambda f:make_thumbnail(f'{image_dir}/{f}',f'{thumb_dir}/{f}'),files))
+	# drop thumbnails whose plot is gone
+	keep=set(files)
+	for f in os.listdir(thumb_dir):
+		if f not in keep:
+			os.remove(f'{thumb_dir}/{f}')
+	print(f'✅ {made} thumbnails rebuilt, {len(files)-made} unchanged')
+
+#---------------------------------------------------------
+def write_geojson(stns,images,path):
+	# one feature per station; popups rebuild image URLs from stid/model/param
+	features=[]
+	for row in stns.itertuples():
+		if row.stid not in images:
+			continue
+		features.append({'type':'Feature',
+			'geometry':{'type':'Point','coordinates':[round(row.longitude,4),round(row.latitude,4)]},
+			'properties':{'id':row.stid,'n':row.name if isinstance(row.name,str) else '',
+				'm':[m for m in models if m in images[row.stid]]}})
+	with open(f'{path}.tmp','w') as f:
+		json.dump({'type':'FeatureCollection','features':features},f,separators=(',',':'))
+	os.replace(f'{path}.tmp',path)
+	print(f'✅ Wrote {len(features)} stations to {path}')
+
+#---------------------------------------------------------
+def build_map(geojson_url,out_file):
+	m=folium.Map(location=(62,-152),zoom_start=4,tiles='OpenTopoMap',prefer_canvas=True)
+	cluster=MarkerCluster(name='Stations').add_to(m)
+	js=f"""
+	const PARAMS={json.dumps(params)};
+	// station names are free text from the catalog; escape them before they go into markup
+	function esc(s){{
+		return String(s).replace(/[&<>"']/g,c=>({{'&':'&amp;','<':'&lt;','>':'&gt;','"':'&quot;',"'":'&#39;'}})[c]);
+	}}
+	function stationPopup(p){{
+		let html=`<b>${{esc(p.id)}}</b> ${{esc(p.n)}}<table>`;
+		for (const model of p.m){{
+			html+=`<tr><td>${{model.toUpperCase()}}</td>`;
+			for (const param of PARAMS){{
+				const f=`${{p.id}}_${{param}}_${{model}}.png`;
+				html+=`<td><a href="images/${{f}}" target="_blank"><img src="thumbs/${{f}}" width="{thumbSize[0]//2}" loading="lazy"></a></td>`;
+			}}
+			html+='</tr>';
+		}}
+		return html+'</table>';
+	}}
+	fetch('{geojson_url}').then(r=>r.json()).then(data=>{{
+		L.geoJSON(data,{{
+			pointToLayer:(f,latlng)=>L.circleMarker(latlng,{{radius:6,color:'#c0392b',fillOpacity:0.8}}),
+			onEachFeature:(f,layer)=>{{
+				layer.bindTooltip(f.properties.id);
+				layer.bindPopup(()=>stationPopup(f.properties),{{maxWidth:{thumbSize[0]*2}}});
+			}}
+		}}).addTo({cluster.get_name()});
+	}});
+	"""
+	# rendered after the cluster layer so its variable is defined
+	loader=MacroElement()
+	loader._template=Template('{% macro script(this, kwargs) %}{% raw %}'+js+'{% endraw %}{% endmacro %}')
+	m.add_child(loader)
+	m.save(f'{out_file}.tmp')
+	os.replace(f'{out_file}.tmp',out_file)
+	print(f'✅ Saved station map to {out_file}')
+
+#---------------------------------------------------------
+if __name__=='__main__':
+
+	images=station_images(imageDir)
+	stns=load_station_catalog()
+	stns=stns[stns.stid.isin(images)]
+	make_thumbnails(images,imageDir,thumbDir)
+	write_geojson(stns,images,f'{mapDir}/stations.geojson')
+	build_map('stations.geojson',f'{mapDir}/station_map.html')
@@ -1,24 +1,27 @@
 #!/usr/bin/env python
 
-import matplotlib as mpl
-mpl.use('agg')
-import matplotlib.pyplot as plt
-import cartopy.crs as ccrs
-from herbie import FastHerbie, Herbie
-import synoptic
-import polars as pl
 import pandas as pd
-import xarray as xr
-from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from tqdm import tqdm
 import concurrent.futures as cf
-import subprocess
 import warnings
+import hashlib
+import contextlib
+import json
+import argparse
+import shutil
 import os, sys
+import wind_config as config
+from archive_query import get_series, get_obs_rollup, missing_valid_times, stale_stations
+from create_obs_archive import fetch_wind_obs_multiprocess, write_obs_batch
+from station_catalog import load_station_catalog
+from pipeline_metrics import run, span, count, fail
 
-WANT_POOL=False
+WANT_POOL=True
+POOL_WORKERS=8
 
 imageDir='/home/tspindler/ATPG/Verification/images'
+webDir='/var/www/html/verification/images'
 
 allSites=['PAAQ','PANC','PAFR','ARCA2','PHMA2','AYSA2','PATO','NDBCPPXA2',
 'NDBCWIXA2','NDBCPOTA2','RHRA2','MCPA2','NDBCAMAA2','ACRA2','PABI','AFTA2',
@@ -28,177 +31,311 @@ allSites=['PAAQ','PANC','PAFR','ARCA2','PHMA2','AYSA2','PATO','NDBCPPXA2',
 'PASI','PAOM','PADU','PASN','PACD']
 
 #---------------------------------------------------------
-def get_stations(start,end):
-	print('Getting observations from Synoptic')
-	
-	df = synoptic.TimeSeries(
-		#stid=allSites.values(),
-		stid=allSites,
-		#recent=pd.Timedelta(24,'h'),
-		start=start,
-		end=end,
-		vars="wind_speed,wind_direction,wind_gust",
-		units='metric',
-		verbose=False,
-		).df()
-	
-	obs=df.to_pandas()
-	obs.set_index('date_time',inplace=True)
-	stn=df['stid','latitude','longitude'].unique().to_pandas()
-	return stn, obs
+def get_obs(stations,start,end):
+	# obs come from the archive; only stations that are missing or stale there
+	# are fetched from Synoptic, and those fetches are written back
+	obs=get_series('obs',stations,start,end)
+	stale=stale_stations(obs,stations,end)
+	if len(stale):
+		print(f'Fetching {len(stale)} stale stations from Synoptic')
+		with ThreadPoolExecutor(max_workers=8) as executor:
+			futures=[executor.submit(fetch_wind_obs_multiprocess,stid,
+				(start if pd.isna(last) else last.tz_convert(None)).strftime('%Y%m%d%H%M'),
+				end.strftime('%Y%m%d%H%M')) for stid,last in stale.items()]
+			fetched=[f.result() for f in futures]
+		fetched=[df for df in fetched if df is not None and len(df)]
+		if fetched:
+			write_obs_batch(pd.concat(fetched,ignore_index=True),config.OBS_ARCHIVE_DIR)
+			obs=get_series('obs',stations,start,end)
+	return obs
 
 #---------------------------------------------------------
-def FasterHerbie(dates,model,fxx,product):
-	
-	# nice way to get the latest date at 00Z
-	recent = pd.Timestamp("now").floor("12h") - pd.Timedelta("12h")
-	
-	store = []
-	for var, lev in zip(["UGRD", "VGRD"], ["TGL_10","TGL_10"]):
-		_ds = Herbie(
-			dates,
-			model=model,
-			fxx=fxx,
-			product=product,
-			variable=var,
-			level=lev,
-			).xarray()
-		store.append(_ds)
-			
-	ds = xr.merge(store)
-	
-	return ds
+def points_to_series(pts):
+	# Herbie pick_points output -> the archive series schema (knots)
+	df=pts.to_dataframe().reset_index()
+	if 'valid_time' not in df:
+		df['valid_time']=df['time']+df['step']
+	kt=config.KNOTS_PER_UNIT['m/s']
+	gust=next((c for c in ['gust','i10fg'] if c in df),None)
+	return pd.DataFrame({
+		'stid':df['point_stid'],
+		'valid_time':pd.to_datetime(df['valid_time'],utc=True),
+		'lead_hr':(df['step'].dt.total_seconds()//3600).astype('int32') if 'step' in df else 0,
+		'wind_speed_kt':df['si10']*kt,
+		'wind_dir_deg':df['wdir10'],
+		'wind_gust_kt':df[gust]*kt if gust else float('nan'),
+		})
+
 #---------------------------------------------------------
-def get_model(model,dates,stns):
-
-	products={'nbm':'ak',
-			'gfs':'pgrb2.0p25',
-			'hrrrak':'sfc',
-			'rtma_ak':'ges',
-			'urma_ak':'ges'
-			}
-			
-	fcsts={
-		'nbm':[24,48,72,96],
-		'gfs':[24,48,72,96],
-		'hrrrak':[12,24,36],
-		'rtma_ak':[0],  # hourly run, no fcsts, just analysis
-		'urma_ak':[0],  # same as rtma, no fcsts, just analysis
-		}
-			
-	print(f'getting {model} data with Herbie')
-	all_dates=[]
-	for fcst in fcsts[model]:
-		rdates=dates-pd.Timedelta(fcst,unit='hours')
-		if model in ['rtma_ak','urma_ak']:
-			H=FastHerbie(rdates,model=model,product=products[model],
-				priority=['aws'])
-			H.download()
-		else:
-			H=FastHerbie(rdates,model=model,fxx=[fcst],
-				product=products[model],priority=['aws'])
-		if model=='nbm':
-			ds1=H.xarray(':WIND:10 m above',remove_grib=False)
-			ds2=H.xarray(':WDIR:10 m above',remove_grib=False)
-			ds3=H.xarray(':GUST:',remove_grib=False)
-			ds=xr.merge([ds1,ds2,ds3])
-		else:
-			ds1=H.xarray(':[UV]GRD:10 m above',remove_grib=False).herbie.with_wind()
-			ds2=H.xarray(':GUST:',remove_grib=False)
-			ds=xr.merge([ds1,ds2])
-			ds=ds.drop_vars(['u10','v10'])
-		pts = ds.herbie.pick_points(stns,method='weighted',tree_name=f'{model}_tree',use_cached_tree=True)	
-		if 'k' in pts.dims:
-			pts=pts.drop_dims('k')
-		all_dates.append(pts)
+def get_forecasts(model,stns,dates):
+	# archived forecasts first; Herbie downloads only for valid times the
+	# archive does not cover yet
+	leads=config.HERBIE_FORECASTS[model]
+	fcst=get_series(model,list(stns.stid),dates[0],dates[-1]+pd.Timedelta('1s'),leads=leads)
+	gaps=missing_valid_times(fcst,dates,leads)
+	if len(gaps):
+		print(f'{model}: fetching {len(gaps)} of {len(dates)} valid times with Herbie')
+		from create_model_archive import get_model
+		pts=get_model(model,gaps.tz_convert(None),stns)
+		fetched=points_to_series(pts)
+		fetched=fetched[fetched.lead_hr.isin(leads)]
+		fcst=pd.concat([fcst,fetched],ignore_index=True).drop_duplicates(['stid','valid_time','lead_hr'],keep='first')
+	return fcst
+
+#---------------------------------------------------------
+def rollup_stations(obs,stations,cycle,start,end):
+	# obs binned to the model valid times (vector mean for direction, max for
+	# gust) from the stored rollup; only bins it lacks yet, such as stations
+	# just written back from Synoptic, are binned here from the fetched obs
+	rolled=get_obs_rollup(stations,cycle,start,end,obs=obs)
+	rolled['valid_time']=rolled['valid_time'].dt.tz_convert(None)
+	return rolled
+
+#---------------------------------------------------------
+def group_by_station(rolled,fcst):
+	# split obs and forecasts by station once, instead of filtering the
+	# full frames inside every plot call
+	obs_groups={stid:grp.set_index('valid_time') for stid,grp in rolled.groupby('stid')}
+	fcst=fcst.assign(valid_time=fcst['valid_time'].dt.tz_convert(None))
+	fcst_groups={stid:grp.drop(columns='stid').sort_values(['lead_hr','valid_time'],ignore_index=True)
+		for stid,grp in fcst.groupby('stid')}
+	return obs_groups,fcst_groups
 
-	all_dates=xr.combine_nested(all_dates,concat_dim='time')
+#---------------------------------------------------------
+# per-worker state, loaded once by init_worker rather than pickled into every task
+_shared={}
 
-	return all_dates
+def init_worker(obs_groups,pts_groups,model,units):
+	# matplotlib loads here, in the render workers, so importing this module for its
+	# fetch helpers stays inside the import budget
+	import matplotlib as mpl
+	mpl.use('agg')
+	import matplotlib.pyplot as plt
+	warnings.simplefilter("ignore")
+	fig,ax=plt.subplots(dpi=150)
+	_shared.update(obs=obs_groups,pts=pts_groups,model=model,units=units,fig=fig,ax=ax)
 
 #---------------------------------------------------------
-def plot_station(station,obs,pts,cycle,model):
+def plot_station(station):
 	
-	params=dict(wind_speed=[':WIND:','si10'],
-		wind_direction=[':WDIR:','wdir10'],
-		wind_gust=[':GUST:','gust'])
+	# obs column -> archive forecast column
+	params=dict(wind_speed='wind_speed_kt',
+		wind_direction='wind_dir_deg',
+		wind_gust='wind_gust_kt')
+	model=_shared['model']
+	fig,ax=_shared['fig'],_shared['ax']
 		
-	obs1=obs[obs.stid==station]
-	pts1=pts.where(pts.point_stid==station,drop=True).squeeze().to_dataframe()
+	obs1=_shared['obs'].get(station)
+	pts1=_shared['pts'].get(station)
+	if obs1 is None or pts1 is None:
+		return []
+	# the axis ends with the plotted data, so an image depends only on what fingerprint() hashes
+	window_end=max(obs1.index.max(),pts1['valid_time'].max())
 
-	for param in obs1.variable.unique().tolist():
-		obs2=obs1[obs1.variable==param]
-		obs2=obs2.value.resample(cycle).mean()
-		if obs2.dropna().size==0:
+	files=[]
+	for param in ['wind_speed','wind_direction','wind_gust']:
+		obs2=obs1[param].dropna()
+		if obs2.size==0:
 			continue
-		
-		# inconsistent names
-		if param=='wind_gust':
-			if model=='hrrrak' or model=='gfs':
-				newparam='gust'
-			else:
-				newparam='i10fg'
-		else:
-			newparam=params[param][1]
-						
-		fig=plt.figure(dpi=150)
-		ax=obs2.plot(color='black',linewidth=1,linestyle='--',label='obs')
+		newparam=params[param]
+		if pts1[newparam].isna().all():
+			continue
+
+		# reuse the worker's figure, only the artists change between plots
+		ax.clear()
+		ax.plot(obs2.index,obs2.values,color='black',linewidth=1,linestyle='--',label='obs')
 
 		if model in ['urma_ak','rtma_ak']:
-			pts1.plot(ax=ax,label=model,y=newparam,linewidth=1)
+			ax.plot(pts1['valid_time'],pts1[newparam],label=model,linewidth=1)
 		else:
-			pts2=pts1.groupby('step')
-			for grp in pts2:
-				grp[1].reset_index(inplace=True)
-				grp[1]['vtime']=grp[1]['time']+grp[0]
-				grp[1].plot(ax=ax,label=f'{grp[0].total_seconds()/60/60:02n} H fcst',x='vtime',y=newparam,linewidth=1)
+			for lead,grp in pts1.groupby('lead_hr'):
+				ax.plot(grp['valid_time'],grp[newparam],label=f'{lead:02d} H fcst',linewidth=1)
 				
-		plt.grid(which='both',axis='both')
-		ax.set_xlim(right=end)
+		ax.grid(which='both',axis='both')
+		ax.set_xlim(right=window_end)
 		ax.legend()
-		plt.title(f"{station} {model.upper()} {param.upper().replace('_',' ')}")
-		ax.set_ylabel(obs.units[obs.variable==param].unique().tolist()[0])
-		plt.savefig(f'{imageDir}/{station}_{param}_{model}.png')
-		plt.close()
-	return
-		
+		ax.set_title(f"{station} {model.upper()} {param.upper().replace('_',' ')}")
+		ax.set_ylabel(_shared['units'].get(param,''))
+		fig.autofmt_xdate()
+		fname=f'{station}_{param}_{model}.png'
+		fig.savefig(f'{imageDir}/{fname}')
+		files.append(fname)
+	return files
+
 #---------------------------------------------------------
-if __name__=='__main__':
+def fingerprint(obs1,pts1,model,units):
+	# hash of everything that goes into a station's plots for one model; the
+	# frames carry their valid times, so this covers the plotted window too
+	h=hashlib.sha1()
+	for frame in (obs1,pts1):
+		h.update(pd.util.hash_pandas_object(frame,index=True).values.tobytes())
+	h.update(f'{model}|{sorted(units.items())}'.encode())
+	return h.hexdigest()
 
-	end = pd.Timestamp("now").floor("12h") - pd.Timedelta("24h")
-	start=end-pd.Timedelta('7d')
+def load_manifest(path):
+	try:
+		with open(f'{path}/fingerprints.json') as f:
+			return json.load(f)
+	except FileNotFoundError:
+		return {}
+
+def save_manifest(path,manifest):
+	with open(f'{path}/fingerprints.json.tmp','w') as f:
+		json.dump(manifest,f)
+	os.replace(f'{path}/fingerprints.json.tmp',f'{path}/fingerprints.json')
+
+#---------------------------------------------------------
+def render_model(model,stations,rolled,fcst,units,manifest):
+	# only re-render stations whose input fingerprint changed, fanned out to a
+	# pool; every future is collected and failures are reported
+	obs_groups,pts_groups=group_by_station(rolled,fcst)
+	todo={}
+	for station in stations:
+		if station not in obs_groups or station not in pts_groups:
+			continue
+		key=f'{station}_{model}'
+		fp=fingerprint(obs_groups[station],pts_groups[station],model,units)
+		entry=manifest.get(key)
+		if entry and entry['hash']==fp and all(os.path.exists(f'{imageDir}/{f}') for f in entry['files']):
+			continue
+		todo[station]=fp
+
+	initargs=(obs_groups,pts_groups,model,units)
+	failed={}
+	done={}
+	if WANT_POOL and todo:
+		with ProcessPoolExecutor(max_workers=POOL_WORKERS,initializer=init_worker,initargs=initargs) as executor:
+			futures={executor.submit(plot_station,station):station for station in todo}
+			for fut in tqdm(cf.as_completed(futures),total=len(futures),desc=model):
+				try:
+					done[futures[fut]]=fut.result()
+				except Exception as e:
+					failed[futures[fut]]=e
+	elif todo:
+		init_worker(*initargs)
+		for station in tqdm(todo,desc=model):
+			try:
+				done[station]=plot_station(station)
+			except Exception as e:
+				failed[station]=e
+		import matplotlib.pyplot as plt
+		plt.close(_shared['fig'])
+
+	for station,files in done.items():
+		key=f'{station}_{model}'
+		for stale in set(manifest.get(key,{}).get('files',[]))-set(files):
+			# another run may have removed it already
+			with contextlib.suppress(FileNotFoundError):
+				os.remove(f'{imageDir}/{stale}')
+		manifest[key]={'hash':todo[station],'files':files}
+	for station in failed:
+		# forget the old fingerprint so the next run retries
+		manifest.pop(f'{station}_{model}',None)
+
+	print(f'✅ {model}: rendered {len(done)} stations, {len(stations)-len(todo)} unchanged or without data')
+	count('stations_rendered',len(done),model=model)
+	count('images_rendered',sum(len(files) for files in done.values()),model=model)
+	count('render_cache_hits',len(stations)-len(todo),model=model)
+	for station,e in failed.items():
+		fail(type(e).__name__,model=model)
+		print(f'❌ {model} {station}: {e}')
+	return failed
+
+#---------------------------------------------------------
+def publish_images(src,web_dir,manifest):
+	# build the next version next to the live one, hardlinking images whose
+	# fingerprint is unchanged, then swap the web path's symlink atomically
+	versions=f'{web_dir}_versions'
+	os.makedirs(versions,exist_ok=True)
+	if os.path.isdir(web_dir) and not os.path.islink(web_dir):
+		# one-time move of the old plain directory under the versions dir
+		os.replace(web_dir,f'{versions}/legacy')
+		os.symlink(f'{versions}/legacy',web_dir)
+	live=os.path.realpath(web_dir) if os.path.islink(web_dir) else None
+	live_manifest=load_manifest(live) if live else {}
+
+	new=f"{versions}/{pd.Timestamp.now(tz='UTC').strftime('%Y%m%dT%H%M%S%f')}"
+	os.makedirs(new)
+	copied=linked=0
+	for key,entry in manifest.items():
+		same=live_manifest.get(key,{}).get('hash')==entry['hash']
+		for f in entry['files']:
+			if same and os.path.exists(f'{live}/{f}'):
+				os.link(f'{live}/{f}',f'{new}/{f}')
+				linked+=1
+			else:
+				shutil.copy2(f'{src}/{f}',f'{new}/{f}')
+				copied+=1
+	save_manifest(new,manifest)
+
+	tmp_link=f'{web_dir}.tmp'
+	if os.path.lexists(tmp_link):
+		os.remove(tmp_link)
+	os.symlink(new,tmp_link)
+	os.replace(tmp_link,web_dir)
+
+	# keep the previous version around for requests that are still reading it
+	for name in os.listdir(versions):
+		path=f'{versions}/{name}'
+		if path not in (new,live):
+			shutil.rmtree(path)
+	count('images_copied',copied)
+	count('images_linked',linked)
+	print(f'✅ Published {web_dir} -> {new} ({copied} copied, {linked} unchanged)')
+
+#---------------------------------------------------------
+def main(argv=None):
+	parser=argparse.ArgumentParser(description='Render and publish the station wind verification plots.')
+	parser.parse_args(argv)
+
+	with run('plots'):
+		end = pd.Timestamp("now").floor("12h") - pd.Timedelta("24h")
+		start=end-pd.Timedelta('7d')
 		
-	# get obs data from Synoptic
-	stns,obs=get_stations(start,end)
+		# station locations from the catalog, obs from the archive
+		stns=load_station_catalog()
+		stns=stns[stns.stid.isin(allSites)][['stid','latitude','longitude']].reset_index(drop=True)
+		with span('read',source='obs'):
+			obs=get_obs(list(stns.stid),start,end)
+		units=dict(wind_speed='kt',wind_direction='deg',wind_gust='kt')
+		rolled={}
+		os.makedirs(imageDir,exist_ok=True)
+		manifest=load_manifest(imageDir)
+		models=['hrrrak','nbm','urma_ak','rtma_ak','gfs']
 		
-	for model in ['hrrrak','nbm','urma_ak','rtma_ak','gfs']:
+		for model in models:
 		
-		# GFS on AWS is 6h cycle time, NBM is 1 hour, all of the others are 3h, 
-		# even though rtma/urma and hrrr are hourly on nomads.
-		if model=='gfs':
-			cycle='6h'
-		elif model in ['nbm','rtma_ak','urma_ak']:
-			cycle='3h'
-		else:
-			cycle='3h'
+			# GFS on AWS is 6h cycle time, NBM is 1 hour, all of the others are 3h, 
+			# even though rtma/urma and hrrr are hourly on nomads.
+			if model=='gfs':
+				cycle='6h'
+			elif model in ['nbm','rtma_ak','urma_ak']:
+				cycle='3h'
+			else:
+				cycle='3h'
 			
-		dates=pd.date_range(start,end,freq=cycle)
+			dates=pd.date_range(start,end,freq=cycle)
 			
-		pts=get_model(model,dates,stns)	
-
-		with warnings.catch_warnings():
-			warnings.simplefilter("ignore")
-			if WANT_POOL:
-				with ProcessPoolExecutor(max_workers=4) as executor:
-					for station in stns.stid:
-						executor.submit(plot_station,station,obs,pts,cycle,model)
-			else:
-				for station in tqdm(stns.stid):
-					plot_station(station,obs,pts,cycle,model)
+			with span('read',source=model):
+				fcst=get_forecasts(model,stns,dates)
+			if cycle not in rolled:
+				rolled[cycle]=rollup_stations(obs,list(stns.stid),cycle,start,end)
+
+			with warnings.catch_warnings(), span('render',model=model):
+				warnings.simplefilter("ignore")
+				render_model(model,list(stns.stid),rolled[cycle],fcst,units,manifest)
+			save_manifest(imageDir,manifest)
 	
+		# drop stations that left the station list
+		current={f'{stid}_{model}' for stid in stns.stid for model in models}
+		for key in set(manifest)-current:
+			for f in manifest.pop(key)['files']:
+				with contextlib.suppress(FileNotFoundError):
+					os.remove(f'{imageDir}/{f}')
+		save_manifest(imageDir,manifest)
+		with span('publish'):
+			publish_images(imageDir,webDir,manifest)
 
-	if not os.path.exists(imageDir):
-		os.mkdir(imageDir)
-	subprocess.run(f'rm /var/www/html/verification/images/*',shell=True)
-	subprocess.run(f'rsync -av {imageDir} /var/www/html/verification/images/.',shell=True)
-	subprocess.run(f'rm -rf {imageDir}/*',shell=True)
+#---------------------------------------------------------
+if __name__=='__main__':
+	main()
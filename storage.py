@@ -0,0 +1,232 @@
+import io
+import os
+import fcntl
+import threading
+import contextlib
+from urllib.parse import urlparse
+import fsspec
+import wind_config as config
+
+"""
+One place that decides how s3:// URLs are reached. By default that is AWS with
+config.AWS_PROFILE (or unsigned requests for the public NOAA buckets). When
+config.S3_ENDPOINT_URL / $S3_ENDPOINT_URL is set, every reader and writer goes to that
+S3-compatible endpoint instead, with credentials from the usual AWS_* environment
+variables; s3_harness uses this to run the pipelines against a local stand-in.
+
+Clients are pooled per process and option set, with connection limits sized for the
+thread pools that share them. Large objects move as parallel multipart uploads and
+parallel ranged reads (put_bytes/get_bytes, write_parquet/read_parquet).
+"""
+
+# (pid, kind, options) -> client; forked workers build their own instead of sharing sockets
+_pool = {}
+_pool_lock = threading.Lock()
+
+
+def _pooled(kind, key, factory):
+    key = (os.getpid(), kind, config.S3_ENDPOINT_URL, config.AWS_PROFILE) + key
+    with _pool_lock:
+        if key not in _pool:
+            _pool[key] = factory()
+        return _pool[key]
+
+
+def s3_options(anon=False, region=config.AWS_REGION):
+    """fsspec/s3fs keyword options for s3:// access."""
+    if config.S3_ENDPOINT_URL:
+        return {"client_kwargs": {"endpoint_url": config.S3_ENDPOINT_URL, "region_name": region}}
+    if anon:
+        return {"anon": True}
+    return {"profile": config.AWS_PROFILE, "client_kwargs": {"region_name": region}}
+
+
+def storage_options(url, anon=False, region=config.AWS_REGION):
+    """Options for any fsspec URL; empty for local paths."""
+    return s3_options(anon, region) if str(url).startswith("s3://") else {}
+
+
+def s3_filesystem(anon=False, region=config.AWS_REGION):
+    """Pooled s3fs client for this process (anonymous for the public NOAA buckets)."""
+    def connect():
+        options = s3_options(anon, region)
+        return fsspec.filesystem(
+            "s3", skip_instance_cache=True, max_concurrency=config.S3_MAX_CONCURRENCY,
+            config_kwargs={"max_pool_connections": config.S3_MAX_POOL_CONNECTIONS,
+                           "retries": {"max_attempts": config.S3_MAX_ATTEMPTS, "mode": "adaptive"}},
+            **options,
+        )
+    return _pooled("s3fs", (anon, region), connect)
+
+
+def filesystem(url, anon=False, region=config.AWS_REGION):
+    """(fs, path) for any fsspec URL, using the pooled client for s3://."""
+    if str(url).startswith("s3://"):
+        fs = s3_filesystem(anon, region)
+        return fs, fs._strip_protocol(url)
+    return fsspec.core.url_to_fs(url)
+
+
+def arrow_s3_filesystem(region=config.AWS_REGION, anon=False):
+    """Pooled pyarrow S3 filesystem; its output streams upload parts in the background."""
+    import pyarrow.fs as pafs
+
+    def connect():
+        if config.S3_ENDPOINT_URL:
+            endpoint = urlparse(config.S3_ENDPOINT_URL)
+            return pafs.S3FileSystem(region=region, endpoint_override=endpoint.netloc, scheme=endpoint.scheme or "https",
+                                     background_writes=True)
+        return pafs.S3FileSystem(region=region, anonymous=anon, background_writes=True)
+    return _pooled("arrow", (anon, region), connect)
+
+
+def multipart_chunk():
+    return config.S3_MULTIPART_CHUNK_MB * 2**20
+
+
+def put_bytes(url, data, anon=False, region=config.AWS_REGION):
+    """
+    Write bytes to url. On S3, objects over two chunks go up as a multipart upload with
+    config.S3_MAX_CONCURRENCY parts in flight; local files are written then swapped in.
+    """
+    fs, path = filesystem(url, anon, region)
+    if not str(url).startswith("s3://"):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(data)
+        os.replace(f"{path}.tmp", path)
+    else:
+        fs.pipe_file(path, data, chunksize=multipart_chunk(), max_concurrency=config.S3_MAX_CONCURRENCY)
+    return len(data)
+
+
+def get_bytes(url, anon=False, region=config.AWS_REGION):
+    """Read a whole object; large S3 objects are fetched as concurrent ranged GETs."""
+    fs, path = filesystem(url, anon, region)
+    if not str(url).startswith("s3://"):
+        return fs.cat_file(path)
+    size = fs.size(path)
+    chunk = multipart_chunk()
+    if size <= 2 * chunk:
+        return fs.cat_file(path)
+    starts = list(range(0, size, chunk))
+    ends = [min(s + chunk, size) for s in starts]
+    return b"".join(fs.cat_ranges([path] * len(starts), starts, ends, batch_size=config.S3_MAX_CONCURRENCY))
+
+
+def write_parquet(df, url, anon=False, region=config.AWS_REGION, **kwargs):
+    """Serialize df to Parquet in memory and upload it in one (multipart) put; returns bytes written."""
+    buf = io.BytesIO()
+    df.to_parquet(buf, **kwargs)
+    return put_bytes(url, buf.getvalue(), anon, region)
+
+
+def read_parquet(url, anon=False, region=config.AWS_REGION, **kwargs):
+    import pandas as pd
+    return pd.read_parquet(io.BytesIO(get_bytes(url, anon, region)), **kwargs)
+
+
+def cached_copy(url, cache_dir, anon=False):
+    """Local copy of a remote object under cache_dir, downloaded once; returns (path, cache_hit)."""
+    fs, path = filesystem(url, anon)
+    local = os.path.join(cache_dir, path.replace("/", "_"))
+    if os.path.exists(local):
+        return local, True
+    os.makedirs(cache_dir, exist_ok=True)
+    # concurrent fetches of the same key each write their own part file
+    part = f"{local}.{os.getpid()}.{threading.get_ident()}.part"
+    fs.get_file(path, part)
+    os.replace(part, local)
+    return local, False
+
+
+class PreconditionFailed(Exception):
+    """A conditional write found that the object changed after it was read."""
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """
+    Exclusive advisory lock for path, held for the block; local files only. The lock file
+    is a hidden .<name>.lock next to path, so dataset scans of the directory skip it.
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, f".{name}.lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _local_version(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return f"{st.st_ino}-{st.st_mtime_ns}-{st.st_size}"
+
+
+def read_versioned(url, anon=False):
+    """
+    (bytes, version) of a small object, or (None, None) when it does not exist. The
+    version (the S3 ETag, or inode/mtime/size locally) is what put_if checks against.
+    """
+    fs, path = filesystem(url, anon)
+    if not str(url).startswith("s3://"):
+        # put_if swaps files in with os.replace, so the open file and its stat always agree
+        try:
+            with open(path, "rb") as f:
+                st = os.fstat(f.fileno())
+                return f.read(), f"{st.st_ino}-{st.st_mtime_ns}-{st.st_size}"
+        except FileNotFoundError:
+            return None, None
+    bucket, key = path.split("/", 1)
+    try:
+        version = fs.call_s3("head_object", Bucket=bucket, Key=key)["ETag"]
+        # read after the HEAD: if the object changes in between, put_if fails and the caller re-reads
+        return fs.cat_file(path), version
+    except FileNotFoundError:
+        return None, None
+
+
+def put_if(url, data, version):
+    """
+    Write data only if the object is still at version (None: only if it does not exist yet);
+    raises PreconditionFailed otherwise. S3 uses a conditional PUT (If-Match/If-None-Match),
+    local files compare and replace under file_lock.
+    """
+    fs, path = filesystem(url)
+    if not str(url).startswith("s3://"):
+        with file_lock(path):
+            if _local_version(path) != version:
+                raise PreconditionFailed(url)
+            with open(f"{path}.tmp", "wb") as f:
+                f.write(data)
+            os.replace(f"{path}.tmp", path)
+        return
+    bucket, key = path.split("/", 1)
+    condition = {"IfMatch": version} if version else {"IfNoneMatch": "*"}
+    try:
+        fs.call_s3("put_object", Bucket=bucket, Key=key, Body=data, **condition)
+    except OSError as e:
+        code = getattr(e.__cause__, "response", {}).get("Error", {}).get("Code")
+        if code in ("PreconditionFailed", "ConditionalRequestConflict"):
+            raise PreconditionFailed(url) from e
+        raise
+    finally:
+        fs.invalidate_cache(path)
+
+
+def duckdb_s3_secret(region=config.AWS_REGION):
+    """CREATE SECRET statement that points DuckDB's httpfs at the configured endpoint."""
+    if not config.S3_ENDPOINT_URL:
+        return f"CREATE OR REPLACE SECRET archive_s3 (TYPE s3, PROVIDER credential_chain, REGION '{region}')"
+    endpoint = urlparse(config.S3_ENDPOINT_URL)
+    return (
+        "CREATE OR REPLACE SECRET archive_s3 (TYPE s3, "
+        f"KEY_ID '{os.environ.get('AWS_ACCESS_KEY_ID', '')}', SECRET '{os.environ.get('AWS_SECRET_ACCESS_KEY', '')}', "
+        f"REGION '{region}', ENDPOINT '{endpoint.netloc}', URL_STYLE 'path', "
+        f"USE_SSL {'true' if endpoint.scheme == 'https' else 'false'})"
+    )
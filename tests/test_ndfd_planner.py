@@ -0,0 +1,12 @@
+import pandas as pd
+from ndfd_planner import PLAN_COLUMNS, plan_files, estimate
+
+
+def test_empty_period_plans_nothing(tmp_path):
+    # a mirror with no files for the period
+    files = plan_files("2021-01-01", "2021-01-31 23:59", base_url=str(tmp_path))
+    assert files.empty
+    assert list(files.columns) == PLAN_COLUMNS
+    assert pd.api.types.is_datetime64_any_dtype(files["cycle"])
+    tasks, summary = estimate(files, chunks=4, threads=16)
+    assert summary["tasks"] == 0 and summary["files"] == 0
@@ -0,0 +1,40 @@
+import pandas as pd
+from obs_qc import run_qc, QC_SPEED_FLATLINE, QC_DUPLICATE
+from create_obs_archive import write_obs_batch, read_obs_archive
+
+
+def obs(stid, start, hours, speed=10.0):
+    return run_qc(pd.DataFrame({
+        "stid": stid,
+        "timestamp": pd.date_range(start, periods=hours, freq="h", tz="UTC"),
+        "wind_direction": 180.0,
+        "wind_speed": speed,
+        "wind_gust": speed + 5,
+    }))
+
+
+def flags(archive, stid, start):
+    df = read_obs_archive(str(archive))
+    rows = df[(df["stid"] == stid) & (df["timestamp"] >= pd.Timestamp(start, tz="UTC"))]
+    return rows["qc_flags"].tolist()
+
+
+def test_other_station_write_keeps_flags(tmp_path):
+    # a flatline across the month boundary, then a repeat fetch that disagrees
+    write_obs_batch(obs("PANC", "2021-01-31 20:00", 4), tmp_path)
+    write_obs_batch(obs("PANC", "2021-02-01 00:00", 4), tmp_path)
+    write_obs_batch(obs("PANC", "2021-02-01 03:00", 1, speed=3.0), tmp_path)
+    before = flags(tmp_path, "PANC", "2021-02-01")
+    assert all(f & QC_SPEED_FLATLINE for f in before[:3])
+    assert before[3] & QC_DUPLICATE
+
+    write_obs_batch(obs("PAFA", "2021-02-10 00:00", 2), tmp_path)
+    assert flags(tmp_path, "PANC", "2021-02-01") == before
+    assert len(flags(tmp_path, "PAFA", "2021-02-01")) == 2
+
+
+def test_duplicate_flag_survives_rewrite_of_same_station(tmp_path):
+    write_obs_batch(obs("PANC", "2021-03-01 00:00", 1), tmp_path)
+    write_obs_batch(obs("PANC", "2021-03-01 00:00", 1, speed=4.0), tmp_path)
+    write_obs_batch(obs("PANC", "2021-03-02 00:00", 1), tmp_path)
+    assert flags(tmp_path, "PANC", "2021-03-01")[0] & QC_DUPLICATE
@@ -0,0 +1,169 @@
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+import wind_config as config
+from verification_stats import SUM_COLUMNS, merge_stats, finalize_scores
+
+"""
+Materialized verification cube for dashboard queries. Stats are summed over years into
+(source, station, lead, calendar month, hour) cells, and each station group is stored as a
+packed bitmap over the cube's station list so region aggregates are precomputed too.
+Refreshes only rebuild the (source, month) cells whose stats slices changed.
+"""
+
+STATION_DIMS = ["source", "stid_code", "lead_hr", "month", "hour"]
+
+REGION_DIMS = ["source", "region", "lead_hr", "month", "hour"]
+
+
+def build_region_bitmaps(stids, groups):
+    """Pack station-group membership into one bit per cube station."""
+    index = pd.Index(stids)
+    bitmaps = {}
+    for region, members in groups.items():
+        bits = np.zeros(len(stids), dtype=bool)
+        codes = index.get_indexer(list(members))
+        bits[codes[codes >= 0]] = True
+        bitmaps[region] = np.packbits(bits)
+    return bitmaps
+
+
+def region_mask(bitmaps, region, n_stations):
+    return np.unpackbits(bitmaps[region], count=n_stations).astype(bool)
+
+
+def slice_signatures(stats):
+    """Checksum of each (source, year, month) slice so refreshes can spot changed stats."""
+    sums = stats.groupby(["source", "year", "month"], observed=True)[SUM_COLUMNS].sum()
+    return {
+        f"{source}|{year}|{month}": hashlib.sha1(np.round(row.to_numpy(dtype="float64"), 6).tobytes()).hexdigest()
+        for (source, year, month), row in sums.iterrows()
+    }
+
+
+def group_signature(groups):
+    """Checksum of the station-group definitions the region cells and bitmaps were built from."""
+    spec = {region: sorted(map(str, members)) for region, members in groups.items()}
+    return hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+
+def aggregate_regions(cells, bitmaps, n_stations):
+    frames = []
+    codes = cells["stid_code"].to_numpy()
+    for region in bitmaps:
+        in_region = region_mask(bitmaps, region, n_stations)[codes]
+        if in_region.any():
+            part = merge_stats(cells[in_region], by=["source", "lead_hr", "month", "hour"])
+            frames.append(part.assign(region=region))
+    if not frames:
+        return pd.DataFrame(columns=REGION_DIMS + SUM_COLUMNS)
+    return pd.concat(frames, ignore_index=True)[REGION_DIMS + SUM_COLUMNS]
+
+
+def write_atomic_parquet(df, path):
+    tmpfile = f"{path}.tmp"
+    df.to_parquet(tmpfile, index=False)
+    os.replace(tmpfile, path)
+
+
+def refresh_cube(stats_path=config.VERIFICATION_STATS, cube_dir=config.VERIFICATION_CUBE_DIR, groups=None):
+    """Rebuild the cube cells whose (source, month) stats, or the region cells whose station groups, changed since the last refresh."""
+    groups = groups or config.STATION_GROUPS
+    stats = pd.read_parquet(stats_path)
+    stats["source"] = stats["source"].astype(str)
+    os.makedirs(cube_dir, exist_ok=True)
+    manifest_path = os.path.join(cube_dir, "manifest.json")
+    manifest = {"slices": {}}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    signatures = slice_signatures(stats)
+    stale = {k for k in set(signatures) | set(manifest["slices"]) if signatures.get(k) != manifest["slices"].get(k)}
+    # an edited group definition only rebuilds the region cells and bitmaps
+    groups_sig = group_signature(groups)
+    if not stale and manifest.get("groups") == groups_sig:
+        print("✅ Verification cube is up to date.")
+        return
+    dirty = {(key.split("|")[0], int(key.split("|")[2])) for key in stale}
+
+    stids = sorted(stats["stid"].astype(str).unique())
+    stats["stid_code"] = pd.Categorical(stats["stid"].astype(str), categories=stids).codes.astype("int32")
+    in_dirty = pd.Series(list(zip(stats["source"], stats["month"]))).isin(dirty).to_numpy()
+    fresh = merge_stats(stats[in_dirty], by=STATION_DIMS)
+
+    station_path = os.path.join(cube_dir, "stations.parquet")
+    if os.path.exists(station_path) and manifest.get("stids"):
+        cells = pd.read_parquet(station_path)
+        # re-code kept cells against the (possibly grown) station list
+        old_stids = np.asarray(manifest["stids"])
+        cells["stid_code"] = pd.Index(stids).get_indexer(old_stids[cells["stid_code"].to_numpy()]).astype("int32")
+        keep = ~pd.Series(list(zip(cells["source"], cells["month"]))).isin(dirty).to_numpy()
+        cells = pd.concat([cells[keep & (cells["stid_code"].to_numpy() >= 0)], fresh], ignore_index=True)
+    else:
+        cells = fresh
+    cells = cells.sort_values(STATION_DIMS).reset_index(drop=True)
+
+    bitmaps = build_region_bitmaps(stids, groups)
+    regions = aggregate_regions(cells, bitmaps, len(stids)).sort_values(REGION_DIMS).reset_index(drop=True)
+
+    write_atomic_parquet(cells, station_path)
+    write_atomic_parquet(regions, os.path.join(cube_dir, "regions.parquet"))
+    np.savez(os.path.join(cube_dir, "bitmaps.tmp.npz"), **bitmaps)
+    os.replace(os.path.join(cube_dir, "bitmaps.tmp.npz"), os.path.join(cube_dir, "bitmaps.npz"))
+    # manifest goes last so a reader never sees it ahead of the data it describes
+    manifest = {"slices": signatures, "stids": stids, "groups": groups_sig, "updated": pd.Timestamp.now(tz="UTC").isoformat()}
+    with open(f"{manifest_path}.tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+    print(f"✅ Refreshed {len(dirty)} (source, month) slices; cube has {len(cells)} station cells and {len(regions)} region cells.")
+
+
+class VerificationCube:
+    """In-memory view of a refreshed cube with a small slicing API."""
+
+    def __init__(self, cube_dir=config.VERIFICATION_CUBE_DIR):
+        with open(os.path.join(cube_dir, "manifest.json")) as f:
+            self.stids = np.asarray(json.load(f)["stids"])
+        self.stations = pd.read_parquet(os.path.join(cube_dir, "stations.parquet"))
+        self.regions = pd.read_parquet(os.path.join(cube_dir, "regions.parquet"))
+        with np.load(os.path.join(cube_dir, "bitmaps.npz")) as npz:
+            self.bitmaps = {name: npz[name] for name in npz.files}
+        self.stations["stid"] = self.stids[self.stations["stid_code"].to_numpy()]
+
+    def query(self, source=None, region=None, stid=None, lead_hr=None, month=None, hour=None, by=("source",)):
+        """
+        Score one slice of the cube, e.g. query("nbm", region="JuneauMarine", lead_hr=48, month=1).
+        Each filter takes a value or a list; by names the dimensions kept in the result.
+        """
+        by = list(by)
+        if stid is not None or "stid" in by:
+            table = self.stations
+            mask = np.ones(len(table), dtype=bool)
+            if region is not None:
+                mask &= region_mask(self.bitmaps, region, len(self.stids))[table["stid_code"].to_numpy()]
+            filters = {"source": source, "stid": stid}
+        else:
+            table = self.regions if region is not None or "region" in by else self.stations
+            mask = np.ones(len(table), dtype=bool)
+            filters = {"source": source, "region": region}
+        filters.update({"lead_hr": lead_hr, "month": month, "hour": hour})
+        for column, value in filters.items():
+            if value is None or column not in table:
+                continue
+            values = value if isinstance(value, (list, tuple, set, np.ndarray)) else [value]
+            mask &= table[column].isin(values).to_numpy()
+        selected = table[mask]
+        if selected.empty:
+            return pd.DataFrame(columns=by)
+        if by:
+            sums = selected.groupby(by, observed=True)[SUM_COLUMNS].sum().reset_index()
+        else:
+            sums = selected[SUM_COLUMNS].sum().to_frame().T
+        return finalize_scores(sums)
+
+
+if __name__ == "__main__":
+    refresh_cube()
@@ -0,0 +1,163 @@
+import os
+import numpy as np
+import pandas as pd
+import wind_config as config
+from pairing import read_pairs
+
+"""
+Verification scores built from mergeable sufficient statistics. Paired rows are reduced to
+sums per (source, stid, lead_hr, year, month, hour); adding a month only appends its sums,
+and any roll-up (region, season, lead band) is a groupby-sum over the small stats table
+followed by finalize_scores.
+"""
+
+STAT_KEYS = ["source", "stid", "lead_hr", "year", "month", "hour"]
+
+SUM_COLUMNS = [
+    # speed
+    "n_speed", "sum_fcst", "sum_obs", "sum_err", "sum_abs_err", "sum_sq_err",
+    "sum_fcst_sq", "sum_obs_sq", "sum_fo",
+    # vector wind (forecast minus observed u/v)
+    "n_vec", "sum_du", "sum_dv", "sum_vec_sq",
+    # direction (circular error in degrees, only above VERIF_MIN_DIR_SPEED_KT)
+    "n_dir", "sum_dir_err", "sum_abs_dir_err", "sum_sin_err", "sum_cos_err",
+]
+
+SEASONS = {12: "DJF", 1: "DJF", 2: "DJF", 3: "MAM", 4: "MAM", 5: "MAM",
+           6: "JJA", 7: "JJA", 8: "JJA", 9: "SON", 10: "SON", 11: "SON"}
+
+
+def wind_components(speed, direction):
+    rad = np.radians(direction)
+    return -speed * np.sin(rad), -speed * np.cos(rad)
+
+
+def accumulate_stats(pairs, min_dir_speed=config.VERIF_MIN_DIR_SPEED_KT):
+    """Reduce paired rows to sufficient statistics per STAT_KEYS."""
+    valid = pd.to_datetime(pairs["valid_time"], utc=True)
+    f = pairs["fcst_speed_kt"].to_numpy(dtype="float64")
+    o = pairs["obs_speed_kt"].to_numpy(dtype="float64")
+    fd = pairs["fcst_dir_deg"].to_numpy(dtype="float64")
+    od = pairs["obs_dir_deg"].to_numpy(dtype="float64")
+
+    has_speed = ~np.isnan(f) & ~np.isnan(o)
+    has_vec = has_speed & ~np.isnan(fd) & ~np.isnan(od)
+    with np.errstate(invalid="ignore"):
+        has_dir = has_vec & (o >= min_dir_speed)
+    err = np.where(has_speed, f - o, 0.0)
+    fu, fv = wind_components(f, fd)
+    ou, ov = wind_components(o, od)
+    du = np.where(has_vec, fu - ou, 0.0)
+    dv = np.where(has_vec, fv - ov, 0.0)
+    # signed smallest angle from observed to forecast direction, in [-180, 180)
+    dir_err = np.where(has_dir, (fd - od + 180) % 360 - 180, 0.0)
+
+    work = pd.DataFrame({
+        "source": pairs["source"].astype(str).values,
+        "stid": pairs["stid"].astype(str).values,
+        "lead_hr": pairs["lead_hr"].astype("int32").values,
+        "year": valid.dt.year.astype("int16").values,
+        "month": valid.dt.month.astype("int8").values,
+        "hour": valid.dt.hour.astype("int8").values,
+        "n_speed": has_speed.astype("int64"),
+        "sum_fcst": np.where(has_speed, f, 0.0),
+        "sum_obs": np.where(has_speed, o, 0.0),
+        "sum_err": err,
+        "sum_abs_err": np.abs(err),
+        "sum_sq_err": err ** 2,
+        "sum_fcst_sq": np.where(has_speed, f ** 2, 0.0),
+        "sum_obs_sq": np.where(has_speed, o ** 2, 0.0),
+        "sum_fo": np.where(has_speed, f * o, 0.0),
+        "n_vec": has_vec.astype("int64"),
+        "sum_du": du,
+        "sum_dv": dv,
+        "sum_vec_sq": du ** 2 + dv ** 2,
+        "n_dir": has_dir.astype("int64"),
+        "sum_dir_err": dir_err,
+        "sum_abs_dir_err": np.abs(dir_err),
+        "sum_sin_err": np.where(has_dir, np.sin(np.radians(dir_err)), 0.0),
+        "sum_cos_err": np.where(has_dir, np.cos(np.radians(dir_err)), 0.0),
+    })
+    return merge_stats(work)
+
+
+def merge_stats(*frames, by=STAT_KEYS):
+    """Combine any number of stats frames (or raw accumulations) by summing on the keys."""
+    stats = pd.concat(frames, ignore_index=True)
+    return stats.groupby(by, sort=True, observed=True)[SUM_COLUMNS].sum().reset_index()
+
+
+def update_stats(pairs, stats_path=config.VERIFICATION_STATS):
+    """
+    Fold a batch of pairs into the stored stats. Rows for the (source, year, month) slices in
+    the batch are replaced, so re-pairing a month never double counts.
+    """
+    new = accumulate_stats(pairs)
+    if os.path.exists(stats_path):
+        stats = pd.read_parquet(stats_path)
+        slices = new[["source", "year", "month"]].drop_duplicates()
+        keep = stats.merge(slices, on=["source", "year", "month"], how="left", indicator=True)["_merge"] == "left_only"
+        stats = merge_stats(stats[keep.values], new)
+    else:
+        stats = new
+    os.makedirs(os.path.dirname(stats_path), exist_ok=True)
+    tmpfile = f"{stats_path}.tmp"
+    stats.to_parquet(tmpfile, index=False)
+    os.replace(tmpfile, stats_path)
+    return stats
+
+
+def add_regions(stats, groups=None):
+    """Attach a region column from station groups (stations in several groups are repeated)."""
+    groups = groups or config.STATION_GROUPS
+    membership = pd.DataFrame(
+        [(stid, region) for region, stids in groups.items() for stid in dict.fromkeys(stids)],
+        columns=["stid", "region"],
+    )
+    return stats.merge(membership, on="stid", how="inner")
+
+
+def finalize_scores(sums):
+    """Turn summed statistics into scores; works on any roll-up of SUM_COLUMNS."""
+    out = sums.copy()
+    n = out["n_speed"].where(out["n_speed"] > 0)
+    out["bias"] = out["sum_err"] / n
+    out["mae"] = out["sum_abs_err"] / n
+    out["rmse"] = np.sqrt(out["sum_sq_err"] / n)
+    cov = out["sum_fo"] / n - (out["sum_fcst"] / n) * (out["sum_obs"] / n)
+    var_f = out["sum_fcst_sq"] / n - (out["sum_fcst"] / n) ** 2
+    var_o = out["sum_obs_sq"] / n - (out["sum_obs"] / n) ** 2
+    out["corr"] = cov / np.sqrt(var_f * var_o).where(lambda v: v > 0)
+    n_vec = out["n_vec"].where(out["n_vec"] > 0)
+    out["vector_rmse"] = np.sqrt(out["sum_vec_sq"] / n_vec)
+    out["mean_du"] = out["sum_du"] / n_vec
+    out["mean_dv"] = out["sum_dv"] / n_vec
+    n_dir = out["n_dir"].where(out["n_dir"] > 0)
+    out["dir_bias"] = np.degrees(np.arctan2(out["sum_sin_err"] / n_dir, out["sum_cos_err"] / n_dir))
+    out["dir_mae"] = out["sum_abs_dir_err"] / n_dir
+    return out
+
+
+def rollup_scores(stats, by, regions=False, seasons=False):
+    """
+    Aggregate stats to any grouping and score it, e.g.
+    rollup_scores(stats, ["source", "region", "lead_hr"], regions=True).
+    """
+    if regions:
+        stats = add_regions(stats)
+    if seasons:
+        stats = stats.assign(season=stats["month"].map(SEASONS))
+    return finalize_scores(merge_stats(stats, by=by))
+
+
+if __name__ == "__main__":
+    start = pd.to_datetime(config.OBS_START, format="%Y%m%d%H%M")
+    end = pd.to_datetime(config.OBS_END, format="%Y%m%d%H%M")
+    for month in pd.period_range(start.to_period("M"), end.to_period("M"), freq="M"):
+        for source in config.FORECAST_ARCHIVES:
+            pairs = read_pairs(source=source, start=month.start_time, end=(month + 1).start_time)
+            if pairs.empty:
+                print(f"⚠️ No {source} pairs for {month} — skipping.")
+                continue
+            stats = update_stats(pairs)
+            print(f"✅ Folded {len(pairs)} {source} pairs for {month} into {config.VERIFICATION_STATS} ({len(stats)} stat rows).")
@@ -15,10 +15,20 @@ MODEL_DIR = os.path.join(HOME, 'model')
 
 TMP = os.path.join(HOME, 'tmp_cache')
 
+# Hive-partitioned (year=/month=) Parquet dataset holding the typed obs archive
+OBS_ARCHIVE_DIR = os.path.join(OBS, f"alaska_{ELEMENT.lower()}_obs")
+# Obs binned to forecast valid times (freq=/year=/month= partitions)
+OBS_ROLLUP_DIR = os.path.join(OBS, f"alaska_{ELEMENT.lower()}_obs_rollup")
+
 
 ######################## File Names #################################
 
-METADATA = "alaska_obs_metadata.csv"
+# Cached Synoptic station metadata, refreshed by station_catalog once older than the TTL
+STATION_CATALOG = "alaska_station_catalog.parquet"
+
+STATION_CATALOG_TTL_HOURS = 24
+# Grid cell size (degrees) for the catalog's spatial index
+SPATIAL_INDEX_RES_DEG = 1.0
 
 WIND_OBS_FILE = f"alaska_{ELEMENT.lower()}_obs.csv"
 
@@ -28,9 +38,12 @@ WIND_OBS_FILE_COMPRESSED = f"alaska_{ELEMENT.lower()}_obs.parquet"
 ###################### Synoptic Params ##########################
 API_KEY = "c6c8a66a96094960aabf1fed7d07ccf0" # link to get an API key can be found at https://docs.google.com/document/d/1YuMUYog4J7DpFoEszMmFir4Ehqk9Q0GHG_QhSdrgV9M/edit?usp=sharing
 
-TIMESERIES_URL = "https://api.synopticdata.com/v2/stations/timeseries"
+# Point at a mock server (mock_synoptic.py) by exporting SYNOPTIC_BASE_URL
+SYNOPTIC_BASE_URL = os.environ.get("SYNOPTIC_BASE_URL", "https://api.synopticdata.com/v2")
+
+TIMESERIES_URL = f"{SYNOPTIC_BASE_URL}/stations/timeseries"
 
-METADATA_URL = "https://api.synopticdata.com/v2/stations/metadata"
+METADATA_URL = f"{SYNOPTIC_BASE_URL}/stations/metadata"
 
 STATE = "ak"
 
@@ -46,6 +59,73 @@ OBS_END = "202103010000"
 INITIAL_WAIT = 1
 # Number of retry attempts
 MAX_RETRIES = 5
+# Cap (seconds) on the exponential backoff between retries when no Retry-After is given
+RETRY_MAX_WAIT = 60
+# Per-request timeout (seconds) for Synoptic calls
+REQUEST_TIMEOUT = 10
+# Number of stations fetched before flushing a batch into the obs archive
+OBS_BATCH_SIZE = 200
+# Where obs come from: "synoptic" (per-station API calls) or "madis" (hourly bulk files)
+OBS_SOURCE = "synoptic"
+# Wind speeds are stored in knots; factors convert from the units reported by each source
+KNOTS_PER_UNIT = {"knots": 1.0, "kts": 1.0, "kt": 1.0, "m/s": 1.94384, "mph": 0.868976, "miles/hour": 0.868976}
+
+# Bin widths for the obs rollup; bins are centered on 00Z-aligned valid times
+OBS_ROLLUP_FREQS = ["1h", "3h", "6h"]
+
+# Obs QC limits (speeds in knots). Flat-lined sensors repeat the same non-calm value for QC_FLATLINE_HOURS or longer
+QC_MAX_SPEED_KT = 150
+
+QC_MAX_GUST_KT = 200
+
+QC_FLATLINE_HOURS = 6
+
+###################### MADIS Params ##########################
+# Local directory or object-store prefix holding hourly MADIS NetCDF files (YYYYMMDD_HHMM[.gz])
+MADIS_DIR = os.path.join(OBS, 'madis')
+
+MADIS_SUFFIX = ".gz"
+
+MADIS_STORAGE_OPTIONS = {}
+
+# MADIS variable names for the wind elements; speeds in the files are m/s
+MADIS_VARS = {"stid": "stationId", "timestamp": "observationTime", "wind_direction": "windDir",
+			  "wind_speed": "windSpeed", "wind_gust": "windGust"}
+
+MADIS_SPEED_UNITS = "m/s"
+# Number of hourly files read concurrently and merged per archive write
+MADIS_WORKERS = 8
+
+MADIS_FILES_PER_BATCH = 24
+
+################### Station Groups ###################################
+# Named AK verification regions (previously copied into atpg_verification.py and davids_stations.py)
+STATION_GROUPS = dict(
+	JuneauLand=['PAGY','PAHN','PAGS','PAJN','PAOH','SDIA2','PASI','PAGN','PAPG',
+				'PAWG','PAKT','PAKW','PAHY','PAMM','PAFE'],
+	JuneauMarine=['EROA2','LIXA2','NKXA2','SCXA2','RIXA2','CSPA2', 'FFIA2',
+				  'PGXA2','CDEA2','LCNA2','GIXA2','MXXA2','PBPA2','GLIA2','KEXA2',
+				  'TKEA2'],
+	JuneauMarineHRRR=['EROA2','LIXA2','NKXA2','SCXA2','RIXA2','CSPA2', 'FFIA2',
+					  'PGXA2','CDXA2','LCNA2','GIXA2','JLXA2','PBPA2','GLIA2','KECA2',
+					  'TKEA2'],
+	AnchorageLand=['PANC','PAAQ','PAWS','PABV','SBPA2','PATO','WHMA2','PAWD',
+				   'MCPA2','PAHO','PAEN','PASX','RUFA2','SHDA2','PAVD','RHVA2','RSCA2',
+				   'PAGK','CXCA2','PXKA2','PLCA2','PATK','WOWA2','MMRA2','COVA2','PAII',
+				   'PADL','PAPH','PADU','PAVC','PASD','UNLA2','NKLA2','PADK','PADQ',
+				   'ALIA2','PANI','PAIG','PAIL','PASL','PABE','PAPM','PATG','PAKI',
+				   'PAVA','PACV','ARCA2','SMCA2','PGPA2','RBTA2','GAHA2','RHRA2'],
+	AnchorageMarine=['PAMD','46076','46061','46060','SELA2','PILA2','AMAA2','46080',
+					 '46001','46078','SKJA2','46075','PAPB','PASN','BLIA2','AUGA2'],
+	FairbanksLand=['ACRA2','BKCA2','TKRA2','CKNA2','SGNA2','PABI','FCPA2','TRDA2',
+				   'TKLA2','PAIN','SMPA2','RXBA2','NHPA2','PAFA','TEXA2',
+				   'PAEI','SLRA2','BCHA2','BREA2','PAFB','D6992','CPKA2','WICA2',
+				   'PATA','PAEG','PFYU','PAGA','PABT','CHMA2','RAMA2','PAKP','IMYA2',
+				   'PABA','PAAD','PASC','PAKU','PALP','PAQT','UMTA2','PAOR',
+				   'PABR','PAWI','SSIA2','ASIA2','PAWN','PAOT','MNOA2','PAGH','SAGA2',
+				   'PASK','PADE','HDOA2','PFSH','PFEL','PAKK','PAUN','PANV','PAOM',
+				   'PATE','PATC','PAIW','PALU','PAPO','PAMK','PACZ','PASM','PADM',
+				   'PATL','PAKV','PRDA2','PPIZ'])
 
 ################### Model Params ###################################
 MODEL = 'nbm'
@@ -72,7 +152,10 @@ HERBIE_CYCLES = {"nbm": "3h", "hrrrak": "3h", "urma_ak": "3h", "gfs": "6h", "rtm
 ELEMENT_DICT = {'Wind': {'nbm': ['si10', 'wdir10']}}
 
 HERBIE_XARRAY_STRINGS = {'Wind': {'nbm': [':WIND:10 m above', ':WDIR:10 m above', ':GUST:'],
-								   'hrrrak': [':[UV]GRD:10 m above',':GUST:']}}
+								   'hrrrak': [':[UV]GRD:10 m above',':GUST:'],
+								   'gfs': [':[UV]GRD:10 m above',':GUST:'],
+								   'rtma_ak': [':[UV]GRD:10 m above',':GUST:'],
+								   'urma_ak': [':[UV]GRD:10 m above',':GUST:']}}
 
 ########################## NDFD Params #################################
 NDFD_DIR = 'ndfd'
@@ -91,8 +174,118 @@ NDFD_FILE_STRINGS = {"Wind": ["wspd", "wdir", "wgust"]}
 
 NDFD_ELEMENT_STRINGS = {"Wind": ["si10", "wdir10", "ifg10"]}
 
-NDFD_S3_URL = "s3://alaska-verification/ndfd/"
+# Public NDFD GRIB feed listed by get_ndfd_file_list (wspd/wdir/YYYY/MM/DD/...)
+NDFD_SOURCE_URL = "s3://noaa-ndfd-pds/wmo"
 
+NDFD_S3_URL = "s3://alaska-verification/ndfd/"
+# Monthly NDFD archive objects under NDFD_S3_URL
+NDFD_ARCHIVE_FILE = "{year}_{month:02d}_ndfd_" + ELEMENT.lower() + "_archive.parquet"
+# Longest NDFD lead (YCRZ97 runs out to day 7)
+NDFD_MAX_LEAD_HOURS = 168
+# Lead hours (first, last) by product suffix: days 1-3 (YCRZ98/YBRZ98) and days 4-7 (YCRZ97/YBRZ97).
+# The planner uses these to pick exactly the issuances whose valid times reach a window.
+NDFD_LEAD_HOURS = {"98": (1, 72), "97": (78, 168)}
+# The 00Z/12Z cycles are transmitted during the 23Z/11Z hours before them
+NDFD_CYCLE_FILE_HOURS = [11, 23]
+# Dry-run cost model, overridden by --calibrate <metrics run>: source download rate and
+# decode+extract seconds per GRIB file on one thread
+NDFD_EST_FETCH_MBPS = 40
+NDFD_EST_DECODE_S = 1.5
+
+# Backfill: month chunks run in parallel processes that share a thread and memory budget.
+# Each run writes its months under NDFD_RUNS_DIR/<run_id>/ (next to the archive, or under
+# MODEL_DIR/ndfd for the local CSV mode); a commit points NDFD_MANIFEST_DIR/<YYYY_MM>.json at
+# the run's object with a conditional put, retried up to NDFD_COMMIT_ATTEMPTS times on a race
+NDFD_BACKFILL_CHUNKS = 4
+NDFD_BACKFILL_THREADS = 16
+# rough peak RSS of one month chunk (see the chunk spans' peak_rss_mb in the run metrics)
+NDFD_CHUNK_MEMORY_GB = 3
+NDFD_MEMORY_BUDGET_GB = 24
+NDFD_RUNS_DIR = "_runs"
+NDFD_MANIFEST_DIR = "_manifests"
+NDFD_COMMIT_ATTEMPTS = 5
+
+# Archive writers sort by station and cap row groups so station lookups can skip most of a file
+PARQUET_ROW_GROUP_ROWS = 65536
+
+###################### Pairing Params ##############################
+# Forecast archives to pair with obs. Paths containing {year}/{month} are one file per month.
+FORECAST_ARCHIVES = {
+	"ndfd": NDFD_S3_URL + NDFD_ARCHIVE_FILE,
+	"nbm": os.path.join(MODEL_DIR, "nbm", f"alaska_nbm_{ELEMENT.lower()}_forecasts.parquet"),
+}
+# Paired forecast/obs rows (source=/year=/month= partitions)
+PAIRED_DIR = os.path.join(MODEL_DIR, "paired")
+# Forecasts are matched to the nearest obs no further than this from the valid time
+PAIR_TOLERANCE = "30min"
+
+PAIR_WORKERS = 4
+
+###################### Verification Params ##############################
+# Mergeable sufficient statistics per (source, stid, lead_hr, year, month, hour)
+VERIFICATION_STATS = os.path.join(MODEL_DIR, "verification", f"alaska_{ELEMENT.lower()}_verification_stats.parquet")
+# Materialized model x region/station x lead x month x hour cube built from the stats
+VERIFICATION_CUBE_DIR = os.path.join(MODEL_DIR, "verification", "cube")
+# Direction errors are only scored when the observed wind is at least this strong (kt)
+VERIF_MIN_DIR_SPEED_KT = 3
+
+###################### Array Export Params ##############################
+# Station-major memory-mapped exports of the archives, one subdirectory per source
+ARCHIVE_ARRAYS_DIR = os.path.join(MODEL_DIR, "arrays")
+
+###################### Benchmark Params ##############################
+# Offline fixtures (NDFD GRIB tree, Synoptic JSON) used by bench_pipeline
+BENCH_FIXTURES_DIR = os.environ.get("BENCH_FIXTURES_DIR", os.path.join(HOME, "fixtures"))
+# NDFD/NBM Alaska 2.976 km polar-stereographic grid written by make_fixtures
+AK_GRID = dict(Nx=1649, Ny=1105, latitudeOfFirstGridPointInDegrees=40.530101, longitudeOfFirstGridPointInDegrees=181.429,
+			   LaDInDegrees=60.0, orientationOfTheGridInDegrees=210.0, DxInMetres=2976.563, DyInMetres=2976.563)
+BENCH_BASELINE = os.path.join(HOME, "bench_baseline.json")
+BENCH_REPEATS = 3
+# Stages slower than the baseline by more than this are flagged
+BENCH_REGRESSION_PCT = 10
+
+###################### Chart Export Params ##############################
+# Per-station chart bundles (obs, forecasts by lead, scores) for the browser-side charts
+CHART_EXPORT_DIR = os.path.join(MODEL_DIR, "charts")
+CHART_WINDOW_DAYS = 7
+# Values are stored as delta-encoded integers in 1/CHART_SCALE units
+CHART_SCALE = 10
+CHART_SOURCES = ["ndfd", "nbm", "hrrrak", "urma_ak", "rtma_ak", "gfs"]
+
+
+###################### Pipeline Metrics Params ##############################
+# Each run appends span/counter events to METRICS_DIR/<job>_<run>.jsonl and rewrites a
+# Prometheus textfile summary (point node_exporter's textfile collector at METRICS_TEXTFILE_DIR)
+METRICS_DIR = os.environ.get("PIPELINE_METRICS_DIR", os.path.join(HOME, "metrics"))
+METRICS_TEXTFILE_DIR = os.environ.get("PIPELINE_TEXTFILE_DIR", METRICS_DIR)
+# Profile every span of this stage (e.g. "decode") with cProfile, or py-spy when on PATH
+PROFILE_STAGE = os.environ.get("PIPELINE_PROFILE") or None
+PROFILER = os.environ.get("PIPELINE_PROFILER", "cprofile")
+# profiles written per stage and process, so a per-file stage doesn't leave thousands
+PROFILE_LIMIT = 3
+
+###################### CLI Params ##############################
+# Import-time budget (seconds, fresh interpreter) for archive_cli's quick subcommands and
+# the modules pool workers import; checked with `python archive_cli.py import-budget`
+IMPORT_BUDGET_S = 0.8
+
+###################### Executor Params ##############################
+# Where the archive pipelines run their tasks: "thread", "process" or "dask".
+# "dask" submits to the scheduler at DASK_SCHEDULER ("local" starts a LocalCluster with
+# DASK_LOCAL_WORKERS single-threaded workers); add nodes by starting more dask workers
+EXECUTOR = os.environ.get("ARCHIVE_EXECUTOR", "process")
+DASK_SCHEDULER = os.environ.get("DASK_SCHEDULER", "local")
+DASK_LOCAL_WORKERS = 4
 
 ##################### AWS Params #################################
-
+AWS_REGION = "us-east-2"
+
+AWS_PROFILE = os.environ.get("AWS_PROFILE", "default")
+# S3-compatible endpoint (MinIO, moto server, ...) used for every s3:// read and write when set
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL") or None
+# Pooled S3 clients: connections per client (shared by the fetch/write thread pools),
+# multipart part size and parts in flight for large uploads and ranged reads
+S3_MAX_POOL_CONNECTIONS = 64
+S3_MAX_CONCURRENCY = 8
+S3_MULTIPART_CHUNK_MB = 16
+S3_MAX_ATTEMPTS = 5